@@ -3,6 +3,24 @@ from pathlib import Path
 from dotenv import load_dotenv
 
 
+def _int_env(name: str, default: int) -> int:
+    """Целочисленная настройка из окружения; мусор в значении -> default."""
+    raw = (os.getenv(name) or "").strip()
+    try:
+        return int(raw) if raw else default
+    except ValueError:
+        return default
+
+
+def _float_env(name: str, default: float) -> float:
+    """Дробная настройка из окружения; мусор в значении -> default."""
+    raw = (os.getenv(name) or "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
 def load_settings():
     """Load settings from .env and return as dict."""
     load_dotenv()
@@ -34,4 +52,74 @@ def load_settings():
         "RAW_ALLOWED": raw_allowed,
         "RAW_ADMINS": raw_admins,
         "GENERATED_DIR": generated_dir,
+        # Хранение сгенерированных документов (0 = ограничение выключено)
+        "RETENTION_KEEP_LAST": _int_env("RETENTION_KEEP_LAST", 20),
+        "RETENTION_MAX_AGE_DAYS": _int_env("RETENTION_MAX_AGE_DAYS", 0),
+        "RETENTION_MAX_CASE_MB": _int_env("RETENTION_MAX_CASE_MB", 0),
+        "RETENTION_MAX_TOTAL_MB": _int_env("RETENTION_MAX_TOTAL_MB", 0),
+        "RETENTION_DEDUP": _int_env("RETENTION_DEDUP", 1) == 1,
+        "RETENTION_INTERVAL_MIN": _int_env("RETENTION_INTERVAL_MIN", 360),
+        # кэш PDF (pdf-cache/): срок и объём
+        "RETENTION_PDF_CACHE_DAYS": _int_env("RETENTION_PDF_CACHE_DAYS", 30),
+        "RETENTION_PDF_CACHE_MB": _int_env("RETENTION_PDF_CACHE_MB", 0),
+        # Хранилище документов: local (GENERATED_DIR) или s3 (S3/MinIO)
+        "STORAGE_BACKEND": (os.getenv("STORAGE_BACKEND") or "local").strip().lower(),
+        "S3_ENDPOINT_URL": (os.getenv("S3_ENDPOINT_URL") or "").strip(),
+        "S3_BUCKET": (os.getenv("S3_BUCKET") or "bankrot-docs").strip(),
+        "S3_ACCESS_KEY": (os.getenv("S3_ACCESS_KEY") or "").strip(),
+        "S3_SECRET_KEY": (os.getenv("S3_SECRET_KEY") or "").strip(),
+        "S3_REGION": (os.getenv("S3_REGION") or "").strip(),
+        "S3_PREFIX": (os.getenv("S3_PREFIX") or "").strip(),
+        # DOCX больше порога пишутся во временный файл, а не в память
+        "DOCX_SPOOL_THRESHOLD_KB": _int_env("DOCX_SPOOL_THRESHOLD_KB", 1024),
+        # последних рендеров заявления в кэше для инкрементального рендера
+        "PETITION_RENDER_CACHE_SIZE": _int_env("PETITION_RENDER_CACHE_SIZE", 32),
+        # Пул процессов для рендеринга DOCX (0 = по числу CPU)
+        "RENDER_WORKERS": _int_env("RENDER_WORKERS", 0),
+        "BATCH_MAX_CASES": _int_env("BATCH_MAX_CASES", 200),
+        # Экспорт в PDF через пул unoserver (LibreOffice)
+        "PDF_EXPORT": _int_env("PDF_EXPORT", 0) == 1,
+        "PDF_WORKERS": _int_env("PDF_WORKERS", 2),
+        "PDF_TIMEOUT_SEC": _int_env("PDF_TIMEOUT_SEC", 60),
+        "PDF_UNOSERVER_CMD": (os.getenv("PDF_UNOSERVER_CMD") or "unoserver").strip(),
+        "PDF_UNOSERVER_BASE_PORT": _int_env("PDF_UNOSERVER_BASE_PORT", 2003),
+        "PDF_UNOSERVER_ADDRS": (os.getenv("PDF_UNOSERVER_ADDRS") or "").strip(),
+        # Пул соединений GigaChat (одна сессия на процесс)
+        "GIGACHAT_POOL_PER_HOST": _int_env("GIGACHAT_POOL_PER_HOST", 10),
+        "GIGACHAT_KEEPALIVE_SEC": _int_env("GIGACHAT_KEEPALIVE_SEC", 60),
+        "GIGACHAT_DNS_TTL_SEC": _int_env("GIGACHAT_DNS_TTL_SEC", 300),
+        "GIGACHAT_TIMEOUT_SEC": _int_env("GIGACHAT_TIMEOUT_SEC", 90),
+        # потоковый ответ: пауза между редактированиями одного сообщения Telegram
+        "TG_STREAM_EDIT_INTERVAL_SEC": _float_env("TG_STREAM_EDIT_INTERVAL_SEC", 1.5),
+        # OAuth-токен: обновление заранее и общий токен в Redis для всех процессов
+        "GIGACHAT_TOKEN_REFRESH_AHEAD_SEC": _int_env("GIGACHAT_TOKEN_REFRESH_AHEAD_SEC", 300),
+        "GIGACHAT_TOKEN_SHARED": _int_env("GIGACHAT_TOKEN_SHARED", 1) == 1,
+        # кэш ответов в Redis (0 — выключен)
+        "GIGACHAT_CACHE_TTL_SEC": _int_env("GIGACHAT_CACHE_TTL_SEC", 3600),
+        # одновременные запросы, очередь, повторы и размыкатель
+        "GIGACHAT_MAX_CONCURRENT": _int_env("GIGACHAT_MAX_CONCURRENT", 10),
+        "GIGACHAT_QUEUE_TIMEOUT_SEC": _int_env("GIGACHAT_QUEUE_TIMEOUT_SEC", 15),
+        "GIGACHAT_MAX_RETRIES": _int_env("GIGACHAT_MAX_RETRIES", 3),
+        "GIGACHAT_BREAKER_FAILURES": _int_env("GIGACHAT_BREAKER_FAILURES", 5),
+        "GIGACHAT_BREAKER_RESET_SEC": _int_env("GIGACHAT_BREAKER_RESET_SEC", 30),
+        # Redis для FSM (и общий клиент для GigaChat/ResultStore)
+        "REDIS_URL": (os.getenv("REDIS_URL") or "redis://localhost:6379/0").strip(),
+        "REDIS_POOL_SIZE": _int_env("REDIS_POOL_SIZE", 20),
+        # вебхук с шардами по пользователю (0 — обработка прямо в web.py)
+        "WEBHOOK_SHARDS": _int_env("WEBHOOK_SHARDS", 0),
+        "WEBHOOK_SHARD": (os.getenv("WEBHOOK_SHARD") or "").strip(),
+        "WEBHOOK_WORKER_CONCURRENCY": _int_env("WEBHOOK_WORKER_CONCURRENCY", 16),
+        # очередь апдейтов вебхука (на шард или в процессе web.py); 0 — обработка в запросе
+        "WEBHOOK_QUEUE_MAX": _int_env("WEBHOOK_QUEUE_MAX", 1000),
+        # срок жизни ключей FSM в Redis (0 — без срока)
+        "FSM_STATE_TTL_SEC": _int_env("FSM_STATE_TTL_SEC", 7 * 24 * 3600),
+        "FSM_DATA_TTL_SEC": _int_env("FSM_DATA_TTL_SEC", 7 * 24 * 3600),
+        # кэш FSM в процессе (0 — выключен); только при sticky-маршрутизации по user_id
+        "FSM_CACHE_TTL_SEC": _int_env("FSM_CACHE_TTL_SEC", 5),
+        # ответы GigaChat для экспорта (Redis, zlib)
+        "RESULT_TTL_SEC": _int_env("RESULT_TTL_SEC", 7 * 24 * 3600),
+        "RESULT_MAX_KB": _int_env("RESULT_MAX_KB", 256),
+        # /metrics процесса бота (0 — выключен); у каждого процесса на хосте свой порт
+        "METRICS_HOST": (os.getenv("METRICS_HOST") or "0.0.0.0").strip(),
+        "METRICS_PORT": _int_env("METRICS_PORT", 9101),
     }
@@ -1,10 +1,9 @@
 """Callback query handlers for bankruptcy bot."""
 import logging
-from pathlib import Path
 
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, FSInputFile
+from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from bankrot_bot.services.public_docs import (
@@ -17,6 +16,7 @@ from bankrot_bot.keyboards.menus import (
     docs_item_ikb,
     case_card_ikb,
 )
+from bankrot_bot.services.storage import case_key, get_storage
 from bankrot_bot.shared import is_allowed  # ✓ Uses shared module (breaks circular import)
 
 logger = logging.getLogger(__name__)
@@ -24,12 +24,6 @@ logger = logging.getLogger(__name__)
 router = Router()
 
 
-def get_generated_dir() -> Path:
-    """Get GENERATED_DIR from bot.py."""
-    from bot import GENERATED_DIR
-    return GENERATED_DIR
-
-
 # ========== DOCS section ==========
 
 @router.callback_query(F.data.startswith("docs_cat:"))
@@ -110,14 +104,7 @@ async def case_docs(call: CallbackQuery, state: FSMContext):
     await state.update_data(docs_case_id=case_id)
 
     # показываем уже созданные файлы по делу (ТОЛЬКО новая структура)
-    GENERATED_DIR = get_generated_dir()
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files = []
-    if case_dir.is_dir():
-        files = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    files = await get_storage().list_case_documents(case_id)
 
     # клавиатура: генерация + последний документ + архив
     kb = InlineKeyboardBuilder()
@@ -154,29 +141,17 @@ async def case_lastdoc_send(call: CallbackQuery):
         return
 
     case_id = int(call.data.split(":")[-1])
-    GENERATED_DIR = get_generated_dir()
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    if not case_dir.is_dir():
-        await call.message.answer("Документы не найдены.")
-        await call.answer()
-        return
-
-    files = sorted(
-        [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-        reverse=True,
-    )
+    storage = get_storage()
+    files = await storage.list_case_documents(case_id)
     if not files:
         await call.message.answer("Документы не найдены.")
         await call.answer()
         return
 
-    path = case_dir / files[0]
-    if not path.is_file():
-        await call.message.answer("Файл не найден (возможно, удалён).")
-        await call.answer()
-        return
-
-    await call.message.answer_document(FSInputFile(path), caption=f"Последний документ по делу #{case_id}")
+    await call.message.answer_document(
+        storage.input_file(case_key(case_id, files[0])),
+        caption=f"Последний документ по делу #{case_id}",
+    )
     await call.answer()
 
 
@@ -200,14 +175,8 @@ async def case_archive(call: CallbackQuery):
     if page < 1:
         page = 1
 
-    GENERATED_DIR = get_generated_dir()
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files_all = []
-    if case_dir.is_dir():
-        files_all = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    storage = get_storage()
+    files_all = await storage.list_case_documents(case_id)
 
     archive_files = files_all[1:] if len(files_all) > 1 else []
     per_page = 10
@@ -261,14 +230,8 @@ async def case_file_send_by_index(call: CallbackQuery):
         await call.answer()
         return
 
-    GENERATED_DIR = get_generated_dir()
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files_all = []
-    if case_dir.is_dir():
-        files_all = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    storage = get_storage()
+    files_all = await storage.list_case_documents(case_id)
 
     archive_files = files_all[1:] if len(files_all) > 1 else []
     if idx < 0 or idx >= len(archive_files):
@@ -276,14 +239,13 @@ async def case_file_send_by_index(call: CallbackQuery):
         await call.answer()
         return
 
-    filename = archive_files[idx]
-    path = case_dir / filename
-    if not path.is_file():
+    key = case_key(case_id, archive_files[idx])
+    if not await storage.exists(key):
         await call.message.answer("Файл не найден (возможно, удалён).")
         await call.answer()
         return
 
-    await call.message.answer_document(FSInputFile(path))
+    await call.message.answer_document(storage.input_file(key))
     await call.answer()
 
 
@@ -308,17 +270,16 @@ async def case_file_send(call: CallbackQuery):
         await call.answer()
         return
 
-    GENERATED_DIR = get_generated_dir()
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    path = case_dir / filename
+    storage = get_storage()
+    key = case_key(case_id, filename)
 
-    if not path.exists():
+    if not await storage.exists(key):
         await call.message.answer("Файл не найден (возможно, удалён).")
         await call.answer()
         return
 
     await call.message.answer_document(
-        FSInputFile(path),
+        storage.input_file(key),
         caption=f"📄 Документ по делу #{case_id}",
     )
     await call.answer()
@@ -349,7 +310,9 @@ async def case_generate_from_case_docs(call: CallbackQuery, state: FSMContext):
     doc_kind = parts[3]
 
     # Import helper functions from bot.py
-    from bot import get_case, get_case_card, validate_case_card, build_bankruptcy_petition_doc, _humanize_missing
+    from bot import get_case, get_case_card, validate_case_card, _humanize_missing
+    from bankrot_bot.services.docx_jinja import PETITION_TEMPLATE
+    from bankrot_bot.services.docs_builder import build_bankruptcy_petition_doc
 
     case_row = get_case(uid, case_id)
     if not case_row:
@@ -367,7 +330,7 @@ async def case_generate_from_case_docs(call: CallbackQuery, state: FSMContext):
             await call.answer()
             return
 
-        validation = validate_case_card(card)
+        validation = validate_case_card(card, PETITION_TEMPLATE)
         missing = validation.get("missing", []) if isinstance(validation, dict) else (validation or [])
 
         if missing:
@@ -379,9 +342,9 @@ async def case_generate_from_case_docs(call: CallbackQuery, state: FSMContext):
             await call.answer()
             return
 
-        path = await build_bankruptcy_petition_doc(case_row, card)
+        key = await build_bankruptcy_petition_doc(case_row, card)
         await call.message.answer_document(
-            FSInputFile(path),
+            get_storage().input_file(key),
             caption=f"Готово ✅ Заявление о банкротстве (дело #{case_id})",
         )
 
@@ -0,0 +1,115 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Без внешних зависимостей: счётчики (Counter) и текущие значения (Gauge) с
+метками регистрируются при импорте модуля-владельца, а render_metrics()
+отдаёт их для эндпоинта /metrics.
+
+Метрики живут в памяти своего процесса. web.py отдаёт только свои (приём
+вебхука, очереди); счётчики бота — GigaChat, FSM, обработка шардов — отдаёт
+сам процесс бота через start_metrics_server() на METRICS_PORT.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Union
+
+Number = Union[int, float]
+
+_REGISTRY: list["_Metric"] = []
+_LOCK = threading.Lock()
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], Number] = {}
+        if not labelnames:
+            self._values[()] = 0
+        with _LOCK:
+            _REGISTRY.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels {sorted(labels)} != {sorted(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, amount: Number, labels: dict[str, str]) -> None:
+        key = self._key(labels)
+        with _LOCK:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> Number:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with _LOCK:
+            items = sorted(self._values.items())
+        for key, value in items:
+            if key:
+                labels = ",".join(f'{name}="{val}"' for name, val in zip(self.labelnames, key))
+                lines.append(f"{self.name}{{{labels}}} {value}")
+            else:
+                lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонный счётчик."""
+
+    kind = "counter"
+
+    def inc(self, amount: Number = 1, **labels: str) -> None:
+        self._add(amount, labels)
+
+
+class Gauge(_Metric):
+    """Текущее значение (может расти и убывать)."""
+
+    kind = "gauge"
+
+    def inc(self, amount: Number = 1, **labels: str) -> None:
+        self._add(amount, labels)
+
+    def dec(self, amount: Number = 1, **labels: str) -> None:
+        self._add(-amount, labels)
+
+    def set(self, value: Number, **labels: str) -> None:
+        key = self._key(labels)
+        with _LOCK:
+            self._values[key] = value
+
+
+def render_metrics() -> str:
+    """Все зарегистрированные метрики в формате Prometheus text exposition."""
+    with _LOCK:
+        metrics = list(_REGISTRY)
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+async def start_metrics_server(host: str, port: int) -> Any:
+    """
+    HTTP-сервер с одним эндпоинтом /metrics для процесса бота (aiohttp).
+
+    Returns:
+        aiohttp.web.AppRunner — остановить через await runner.cleanup()
+    """
+    from aiohttp import web
+
+    async def metrics(_request: web.Request) -> web.Response:
+        return web.Response(
+            body=render_metrics().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,232 @@
+"""
+Пакетная генерация документов по многим делам (админ).
+
+Для каждого выбранного дела и вида документа данные читаются из БД в event
+loop, а рендеринг идёт в пуле процессов (render_pool). Готовые файлы по мере
+появления дописываются в один ZIP во временном файле на диске — архив
+целиком в памяти не собирается и отправляется потоково (DocumentInputFile).
+Ошибки по делам не прерывают пакет, а попадают в report.txt внутри архива.
+
+Выбор дел (аргументы команды /batch_docs):
+    12 15 20-25        — номера дел и диапазоны
+    all                — все дела (до BATCH_MAX_CASES)
+    owner=<user_id>    — дела пользователя
+    stage=<стадия>     — дела на стадии
+    kinds=petition,creditors,inventory — виды документов (по умолчанию все)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import IO, Any, Optional, Tuple
+
+from bankrot_bot.services.render_pool import (
+    render_creditors_list_to_file,
+    render_inventory_to_file,
+    render_petition_to_file,
+    run_in_render_pool,
+)
+
+logger = logging.getLogger(__name__)
+
+DOC_KINDS = ("petition", "creditors", "inventory")
+
+_KIND_FILENAMES = {
+    "petition": "bankruptcy_petition",
+    "creditors": "creditors_list",
+    "inventory": "inventory",
+}
+
+
+@dataclass(frozen=True)
+class CaseSelection:
+    """Какие дела и какие документы генерировать."""
+
+    case_ids: Optional[list[int]] = None
+    owner_user_id: Optional[int] = None
+    stage: Optional[str] = None
+    kinds: tuple[str, ...] = DOC_KINDS
+
+
+@dataclass
+class BatchResult:
+    """Результат пакета: ZIP (позиция в начале) и отчёт по делам."""
+
+    zip_file: IO[bytes]
+    filename: str
+    cases: int = 0
+    ok: list[tuple[int, str]] = field(default_factory=list)
+    errors: list[tuple[int, str, str]] = field(default_factory=list)
+
+
+def parse_case_selection(args: list[str]) -> CaseSelection:
+    """
+    Разобрать аргументы /batch_docs.
+
+    Raises:
+        ValueError: Некорректный аргумент (текст ошибки — для пользователя)
+    """
+    ids: list[int] = []
+    select_all = False
+    owner: Optional[int] = None
+    stage: Optional[str] = None
+    kinds: tuple[str, ...] = DOC_KINDS
+
+    for arg in args:
+        tokens = [arg] if "=" in arg else [t for t in arg.split(",") if t]
+        for token in tokens:
+            key, sep, value = token.partition("=")
+            if sep:
+                key = key.lower()
+                if key == "owner":
+                    if not value.isdigit():
+                        raise ValueError(f"owner должен быть числом: {value}")
+                    owner = int(value)
+                elif key == "stage":
+                    stage = value
+                elif key == "kinds":
+                    kinds = tuple(k.strip().lower() for k in value.split(",") if k.strip())
+                    unknown = [k for k in kinds if k not in DOC_KINDS]
+                    if unknown or not kinds:
+                        raise ValueError(f"Неизвестный вид документа: {', '.join(unknown) or value}")
+                else:
+                    raise ValueError(f"Неизвестный фильтр: {key}")
+            elif token.lower() == "all":
+                select_all = True
+            elif "-" in token:
+                lo, _, hi = token.partition("-")
+                if not (lo.isdigit() and hi.isdigit()) or int(lo) > int(hi):
+                    raise ValueError(f"Некорректный диапазон: {token}")
+                ids.extend(range(int(lo), int(hi) + 1))
+            elif token.isdigit():
+                ids.append(int(token))
+            else:
+                raise ValueError(f"Некорректный номер дела: {token}")
+
+    if not (ids or select_all or owner is not None or stage):
+        raise ValueError("Не указаны дела")
+
+    return CaseSelection(
+        case_ids=None if select_all or not ids else sorted(set(ids)),
+        owner_user_id=owner,
+        stage=stage,
+        kinds=kinds,
+    )
+
+
+async def _prepare(case_row: Tuple, kind: str) -> tuple[Any, Any]:
+    """Прочитать данные дела для вида документа: (функция воркера, данные)."""
+    from bankrot_bot.database import get_session
+    from bankrot_bot.services.case_financials import format_parties_for_doc, get_case_parties
+    from bankrot_bot.services.cases_db import get_case_card, validate_case_card
+    from bankrot_bot.services.docx_forms import load_creditors_list_data, load_inventory_data
+    from bankrot_bot.services.docs_builder import build_petition_context
+    from bankrot_bot.services.docx_jinja import PETITION_TEMPLATE
+
+    cid, owner_user_id = case_row[0], case_row[1]
+
+    async with get_session() as session:
+        if kind == "petition":
+            card = get_case_card(owner_user_id, cid)
+            missing = validate_case_card(card, PETITION_TEMPLATE).get("missing", [])
+            if missing:
+                raise ValueError(f"не заполнены поля карточки: {', '.join(missing)}")
+            parties = await get_case_parties(session, cid, role="creditor")
+            creditors = format_parties_for_doc(parties, role="creditor") if parties else None
+            return render_petition_to_file, build_petition_context(case_row, card, creditors)
+        if kind == "creditors":
+            return render_creditors_list_to_file, await load_creditors_list_data(session, cid)
+        if kind == "inventory":
+            return render_inventory_to_file, await load_inventory_data(session, cid)
+    raise ValueError(f"Неизвестный вид документа: {kind}")
+
+
+async def _render_one(
+    case_row: Tuple,
+    kind: str,
+    workdir: str,
+    sem: asyncio.Semaphore,
+) -> tuple[int, str, Optional[str], Optional[str]]:
+    """Один документ: (case_id, kind, путь к файлу или None, ошибка или None)."""
+    cid = case_row[0]
+    async with sem:
+        try:
+            func, data = await _prepare(case_row, kind)
+            out_path = os.path.join(workdir, f"{cid}_{kind}.docx")
+            await run_in_render_pool(func, data, out_path)
+            return cid, kind, out_path, None
+        except Exception as e:
+            logger.warning(f"Batch: case {cid} {kind} failed: {e}", exc_info=not isinstance(e, ValueError))
+            return cid, kind, None, str(e) or type(e).__name__
+
+
+def format_batch_report(result: BatchResult) -> str:
+    """Отчёт по пакету (кладётся в архив как report.txt)."""
+    lines = [
+        f"Дел: {result.cases}",
+        f"Документов сформировано: {len(result.ok)}",
+        f"Ошибок: {len(result.errors)}",
+    ]
+    for cid, kind, err in sorted(result.errors):
+        lines.append(f"- дело #{cid}, {kind}: {err}")
+    return "\n".join(lines) + "\n"
+
+
+async def run_batch(case_rows: list[Tuple], kinds: tuple[str, ...], *, concurrency: int = 4) -> BatchResult:
+    """
+    Сгенерировать документы kinds по делам case_rows в один ZIP.
+
+    Args:
+        case_rows: Строки дел (cases_db.select_cases)
+        kinds: Виды документов из DOC_KINDS
+        concurrency: Сколько документов готовится одновременно
+
+    Returns:
+        BatchResult; вызывающий закрывает result.zip_file
+    """
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    result = BatchResult(
+        zip_file=tempfile.TemporaryFile(),
+        filename=f"batch_{stamp}.zip",
+        cases=len(case_rows),
+    )
+    workdir = tempfile.mkdtemp(prefix="batch_docs_")
+    sem = asyncio.Semaphore(max(1, concurrency))
+    tasks = [
+        asyncio.create_task(_render_one(row, kind, workdir, sem))
+        for row in case_rows
+        for kind in kinds
+    ]
+
+    try:
+        # DOCX уже сжат — храним без повторного сжатия
+        with zipfile.ZipFile(result.zip_file, "w", compression=zipfile.ZIP_STORED) as zf:
+            for fut in asyncio.as_completed(tasks):
+                cid, kind, path, err = await fut
+                if path is None:
+                    result.errors.append((cid, kind, err or "unknown error"))
+                    continue
+                arcname = f"case_{cid}/{_KIND_FILENAMES[kind]}_case_{cid}_{stamp}.docx"
+                await asyncio.to_thread(zf.write, path, arcname)
+                os.unlink(path)
+                result.ok.append((cid, kind))
+            zf.writestr("report.txt", format_batch_report(result))
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        result.zip_file.close()
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result.zip_file.seek(0)
+    logger.info(
+        f"Batch done: cases={result.cases} docs={len(result.ok)} errors={len(result.errors)}"
+    )
+    return result
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Iterable, Iterator
+
+from bankrot_bot.services.money import creditor_kopeks, split, total_kopeks
 
 
 def build_creditors_header_block(creditors: list[dict] | None) -> str:
@@ -22,13 +24,9 @@ def build_creditors_header_block(creditors: list[dict] | None) -> str:
     return ", ".join(names[:3]) + f" и др. (всего {len(names)})"
 
 
-def build_creditors_block(creditors: list[dict] | None) -> str:
-    creditors = creditors or []
-    if not creditors:
-        return "Сведения о кредиторах не представлены."
-
-    out: list[str] = []
-    for i, c in enumerate(creditors, start=1):
+def iter_creditor_lines(creditors: Iterable[dict] | None) -> Iterator[str]:
+    """Строки списка кредиторов по одной на кредитора ("1) ..."), без общей склейки."""
+    for i, c in enumerate(creditors or (), start=1):
         c = c or {}
 
         name = str(c.get("name") or "").strip() or "Кредитор"
@@ -37,10 +35,7 @@ def build_creditors_block(creditors: list[dict] | None) -> str:
         address = str(c.get("address") or "").strip()
         note = str(c.get("note") or "").strip()
 
-        debt_r = str(c.get("debt_rubles") or "").strip()
-        debt_k_raw = "" if c.get("debt_kopeks") is None else str(c.get("debt_kopeks")).strip()
-        digits = "".join(ch for ch in debt_k_raw if ch.isdigit())
-        debt_k = f"{int(digits):02d}" if digits else "00"
+        amount = creditor_kopeks(c)
 
         parts = [name]
         if inn:
@@ -52,49 +47,26 @@ def build_creditors_block(creditors: list[dict] | None) -> str:
 
         line = f"{i}) " + ", ".join(parts)
 
-        if debt_r or digits:
-            line += f"; сумма задолженности: {debt_r or '0'} руб. {debt_k} коп."
+        if amount is not None:
+            debt_r, debt_k = split(amount)
+            line += f"; сумма задолженности: {debt_r} руб. {debt_k:02d} коп."
 
         if note:
             line += f"; прим.: {note}"
 
         # быстрый фикс, если в тексте оказались слэши/экранирования
-        line = line.replace('\\\\', '"').replace('\\"', '"')
+        yield line.replace('\\\\', '"').replace('\\"', '"')
 
-        out.append(line)
 
-    return "\n".join(out)
+def build_creditors_block(creditors: list[dict] | None) -> str:
+    if not creditors:
+        return "Сведения о кредиторах не представлены."
+    return "\n".join(iter_creditor_lines(creditors))
 
 
 def sum_creditors_total(creditors: list[dict] | None) -> tuple[int, int]:
-    creditors = creditors or []
-    total_r = 0
-    total_k = 0
-
-    for c in creditors:
-        c = c or {}
-
-        r = c.get("debt_rubles")
-        k = c.get("debt_kopeks")
-
-        try:
-            rr = int(str(r).strip()) if str(r).strip() else 0
-        except (ValueError, TypeError):
-            rr = 0
-
-        kk_raw = "" if k is None else str(k).strip()
-        digits = "".join(ch for ch in kk_raw if ch.isdigit())
-        try:
-            kk = int(digits) if digits else 0
-        except (ValueError, TypeError):
-            kk = 0
-
-        total_r += rr
-        total_k += kk
-
-    total_r += total_k // 100
-    total_k = total_k % 100
-    return total_r, total_k
+    """Итог по кредиторам: (рубли, копейки)."""
+    return split(total_kopeks(creditors))
 
 
 def build_vehicle_block(card: dict) -> str:
@@ -105,3 +77,86 @@ def build_vehicle_block(card: dict) -> str:
 def build_attachments_list(card: dict) -> str:
     # пока безопасный дефолт
     return ""
+
+
+def build_gender_forms(gender: str | None) -> dict:
+    """
+    Возвращает слова в нужном роде для плейсхолдеров шаблона:
+    {{debtor_having_word}}, {{debtor_registered_word}}, {{debtor_living_word}},
+    {{debtor_not_registered_word}}, {{debtor_insolvent_word}}
+    """
+    g = (gender or "").strip().lower()
+    if g == "female":
+        return {
+            "debtor_having_word": "имеющая",
+            "debtor_registered_word": "зарегистрированная",
+            "debtor_living_word": "проживающая",
+            "debtor_not_registered_word": "не зарегистрирована",
+            "debtor_insolvent_word": "несостоятельной",
+        }
+    # по умолчанию male
+    return {
+        "debtor_having_word": "имеющий",
+        "debtor_registered_word": "зарегистрированный",
+        "debtor_living_word": "проживающий",
+        "debtor_not_registered_word": "не зарегистрирован",
+        "debtor_insolvent_word": "несостоятельным",
+    }
+
+
+def build_debtor_last_name_initials(card: dict) -> str:
+    """
+    Из 'Иванов Иван Иванович' делает 'Иванов И. И.'
+    Если ФИО пустое/неполное — возвращает как есть.
+    """
+    full_name = (card.get("debtor_full_name") or "").strip()
+    parts = [p for p in full_name.split() if p]
+    if len(parts) >= 2:
+        last = parts[0]
+        first_i = parts[1][0].upper() + "."
+        patro_i = (parts[2][0].upper() + ".") if len(parts) >= 3 and parts[2] else ""
+        return (last + " " + first_i + (" " + patro_i if patro_i else "")).strip()
+    return full_name
+
+
+def build_family_status_block(card: dict) -> str:
+    """
+    Возвращает текстовый блок о семейном положении/детях для {{family_status_block}}.
+    Поля ожидаются: marital_status, spouse_full_name, has_minor_children, children_count,
+    marriage_certificate_number, marriage_certificate_date
+    """
+    marital_status = (card.get("marital_status") or "").strip()
+    spouse_full_name = (card.get("spouse_full_name") or "").strip()
+    has_minor_children = card.get("has_minor_children")
+    children_count = card.get("children_count")
+    cert_no = (card.get("marriage_certificate_number") or "").strip()
+    cert_date = (card.get("marriage_certificate_date") or "").strip()
+
+    lines: list[str] = []
+
+    if marital_status == "married":
+        line = "Состоит в браке"
+        if spouse_full_name:
+            line += f" с {spouse_full_name}"
+        line += "."
+        lines.append(line)
+
+        if cert_no:
+            cert_line = f"Свидетельство о заключении брака № {cert_no}"
+            if cert_date:
+                cert_line += f" от {cert_date}"
+            cert_line += "."
+            lines.append(cert_line)
+
+    elif marital_status == "single":
+        lines.append("В браке не состоит.")
+
+    if has_minor_children is True:
+        cnt = ""
+        if children_count not in (None, ""):
+            cnt = f" ({children_count} ребёнок(детей))"
+        lines.append(f"Имеет несовершеннолетних детей{cnt}.")
+    elif has_minor_children is False:
+        lines.append("Несовершеннолетних детей нет.")
+
+    return "\n".join(lines)
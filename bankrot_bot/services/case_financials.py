@@ -1,5 +1,6 @@
 """Service layer for case financial data: assets and parties (creditors/debtors)."""
 import logging
+import re
 from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Tuple, Optional
 
@@ -8,9 +9,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from bankrot_bot.models.case_asset import CaseAsset
 from bankrot_bot.models.case_party import CaseParty
+from bankrot_bot.services.money import AMOUNT_KEY, Kopeks, to_kopeks
 
 logger = logging.getLogger(__name__)
 
+# рубли и до двух знаков копеек после точки или запятой
+_AMOUNT_RE = re.compile(r"\d+(?:[.,]\d{1,2})?")
+
 
 # ========== CaseParty (Кредиторы/Должники) ==========
 
@@ -107,21 +112,16 @@ def format_parties_for_doc(parties: List[CaseParty], role: str = "creditor") ->
     Преобразовать CaseParty в формат для генерации документа.
 
     Возвращает список словарей совместимых с существующими build_creditors_block().
-    Формат: {name, debt_rubles, debt_kopeks, inn, ogrn, address, note}
+    Формат: {name, amount_kopeks, inn, ogrn, address, note}; сумма — int копеек.
     """
     result = []
     for p in parties:
         if p.role != role:
             continue
 
-        amount = p.amount or Decimal(0)
-        rubles = int(amount)
-        kopeks = int((amount - rubles) * 100)
-
         result.append({
             "name": p.name,
-            "debt_rubles": str(rubles),
-            "debt_kopeks": f"{kopeks:02d}",
+            AMOUNT_KEY: to_kopeks(p.amount),
             "inn": "",  # В базовой схеме нет ИНН, можно расширить позже
             "ogrn": "",
             "address": "",
@@ -188,36 +188,28 @@ def calculate_assets_total(assets: List[CaseAsset]) -> Decimal:
 
 # ========== Утилиты ==========
 
-def parse_amount_input(text: str) -> Decimal:
+def parse_amount_kopeks(text: str) -> Optional[Kopeks]:
     """
-    Парсинг пользовательского ввода суммы.
+    Пользовательский ввод суммы -> целые копейки.
 
-    Принимает: "100000", "100 000", "100 000.50", "100000,50"
-    Возвращает Decimal (или Decimal(0) при ошибке).
-
-    Args:
-        text: User input string with amount
+    Принимает: "100000", "100 000", "100 000.50", "100000,5" (пробелы между
+    разрядами, в том числе неразрывные, игнорируются).
 
     Returns:
-        Parsed Decimal value, or Decimal(0) on parse error
+        Сумма в копейках или None, если ввод — не неотрицательное число
+        с не более чем двумя знаками после запятой
 
     Examples:
-        >>> safe_parse_decimal("100 000,50")
-        Decimal('100000.50')
-        >>> safe_parse_decimal("invalid")
-        Decimal('0')
+        >>> parse_amount_kopeks("150 000,50")
+        15000050
+        >>> parse_amount_kopeks("150.000.50") is None
+        True
     """
-    normalized = text.strip().replace(" ", "").replace(",", ".")
-    try:
-        return Decimal(normalized)
-    except (InvalidOperation, ValueError) as e:
-        # Expected errors: invalid decimal format
-        logger.warning(f"Failed to parse decimal '{text}': {e}")
-        return Decimal(0)
-    except (AttributeError, TypeError) as e:
-        # Unexpected: text is not a string (programmer error)
-        logger.error(f"safe_parse_decimal called with invalid type {type(text)}: {e}")
-        return Decimal(0)
+    normalized = "".join(str(text).split())
+    if not _AMOUNT_RE.fullmatch(normalized):
+        logger.warning(f"Failed to parse amount '{text}'")
+        return None
+    return to_kopeks(Decimal(normalized.replace(",", ".")))
 
 
 def normalize_amount_to_string(text: str) -> Optional[str]:
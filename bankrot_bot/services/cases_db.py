@@ -209,6 +209,54 @@ def get_case(owner_user_id: int, cid: int) -> Tuple | None:
         return cur.fetchone()
 
 
+def select_cases(
+    case_ids: list[int] | None = None,
+    *,
+    owner_user_id: int | None = None,
+    stage: str | None = None,
+    limit: int = 500,
+) -> List[Tuple]:
+    """
+    Select cases across all owners (admin batch operations).
+
+    Args:
+        case_ids: Only these case IDs (None = no ID filter)
+        owner_user_id: Only cases of this owner
+        stage: Only cases in this stage
+        limit: Maximum number of cases
+
+    Returns:
+        List of tuples in get_case() column order, ordered by id
+    """
+    where: list[str] = []
+    params: list[Any] = []
+    if case_ids is not None:
+        if not case_ids:
+            return []
+        where.append(f"id IN ({','.join('?' * len(case_ids))})")
+        params.extend(case_ids)
+    if owner_user_id is not None:
+        where.append("owner_user_id = ?")
+        params.append(owner_user_id)
+    if stage:
+        where.append("stage = ?")
+        params.append(stage)
+
+    sql = (
+        "SELECT id, owner_user_id, code_name, case_number, court, judge, fin_manager, "
+        "stage, notes, created_at, updated_at FROM cases"
+    )
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id LIMIT ?"
+    params.append(limit)
+
+    with sqlite3.connect(get_db_path()) as con:
+        cur = con.cursor()
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+
 def update_case_fields(
     owner_user_id: int,
     cid: int,
@@ -343,22 +391,31 @@ def get_case_card(owner_user_id: int, cid: int) -> dict[str, Any]:
     return base
 
 
-def validate_case_card(card: dict[str, Any]) -> dict[str, list[str]]:
+def validate_case_card(card: dict[str, Any], template_path: Path | None = None) -> dict[str, list[str]]:
     """
     Validate case card.
 
     Args:
         card: Dictionary with case card data
+        template_path: Document template; its placeholder manifest adds
+            template-specific fields to the check
 
     Returns:
         Dictionary with "missing" key containing list of missing fields
+        (and "template_missing" with the template-specific part when template_path given)
     """
     missing = []
     for field in CASE_CARD_REQUIRED_FIELDS:
         val = card.get(field)
         if val is None or str(val).strip() == "":
             missing.append(field)
-    return {"missing": missing}
+    if template_path is None:
+        return {"missing": missing}
+
+    from bankrot_bot.services.docs_builder import missing_card_fields
+
+    template_missing = [f for f in missing_card_fields(card, template_path) if f not in missing]
+    return {"missing": missing + template_missing, "template_missing": template_missing}
 
 
 # ============================================
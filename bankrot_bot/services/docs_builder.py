@@ -1,462 +1,371 @@
+"""
+Сборка документов по делу: единая точка для бота и сервисов.
+
+Значения плейсхолдеров заявления о банкротстве описаны декларативно —
+списком FieldSpec (плейсхолдер -> источник -> дефолт -> форматтер).
+Список компилируется один раз при импорте модуля в готовые функции, и
+контекст строится одним проходом по ним вместо ручных _txt(card.get(...)).
+
+Модуль не читает настройки при импорте: хранилище берётся через get_storage().
+"""
 from __future__ import annotations
-import logging
-import os
 
+import logging
+from dataclasses import dataclass, field
 from datetime import datetime
+from functools import cached_property
 from pathlib import Path
-from typing import Any, Dict, Tuple
-
-from docx import Document
+from typing import Any, Callable, Optional, Tuple, Union
 
-from bankrot_bot.config import load_settings
-
-logger = logging.getLogger(__name__)
 from bankrot_bot.services.blocks import (
-    build_creditors_block,
-    build_creditors_header_block,
-    sum_creditors_total,
     build_attachments_list,
+    build_creditors_header_block,
+    build_debtor_last_name_initials,
+    build_family_status_block,
+    build_gender_forms,
     build_vehicle_block,
+    iter_creditor_lines,
 )
+from bankrot_bot.services.docx_incremental import render_petition_incremental
+from bankrot_bot.services.docx_jinja import PETITION_TEMPLATE, template_manifest
+from bankrot_bot.services.money import split, total_kopeks
+from bankrot_bot.services.storage import case_key, get_storage
 
+logger = logging.getLogger(__name__)
 
-settings = load_settings()
-GENERATED_DIR = Path(settings.get('GENERATED_DIR') or 'generated')
+NOT_SPECIFIED = "не указано"
+NO_CREDITORS = "Сведения о кредиторах не представлены."
+
+# гендерные формы, если пол не заполнен или build_gender_forms упала
+NEUTRAL_GENDER_FORMS = {
+    "debtor_having_word": "имеющий(ая)",
+    "debtor_registered_word": "зарегистрированный(ая)",
+    "debtor_living_word": "проживающий(ая)",
+    "debtor_not_registered_word": "не зарегистрирован(а)",
+    "debtor_insolvent_word": "неплатёжеспособный(ая)",
+}
+
+MARITAL_STATUS_TEXT = {
+    "married": "Состоит в зарегистрированном браке.",
+    "single": "В браке не состоит.",
+    "divorced": "Брак расторгнут.",
+    "widowed": "Вдовец/вдова.",
+}
+
+
+@dataclass
+class PetitionSource:
+    """Исходные данные заявления: дело, карточка, кредиторы из case_parties."""
+
+    case_row: Tuple
+    card: dict
+    creditors_from_db: Optional[list[dict]] = None
+    now: datetime = field(default_factory=datetime.now)
+
+    @cached_property
+    def card_creditors(self) -> list[dict]:
+        creditors = self.card.get("creditors")
+        return creditors if isinstance(creditors, list) else []
+
+    @cached_property
+    def debt_total(self) -> Optional[tuple[int, int]]:
+        """Сумма долга по кредиторам (приоритет — case_parties), (рубли, копейки), или None, если она нулевая."""
+        amount = total_kopeks(self.creditors_from_db or self.card_creditors)
+        return split(amount) if amount else None
+
+    @cached_property
+    def gender_forms(self) -> dict[str, str]:
+        try:
+            forms = build_gender_forms(self.card.get("debtor_gender"))
+            if isinstance(forms, dict):
+                return {**NEUTRAL_GENDER_FORMS, **forms}
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Failed to build gender forms: {e}")
+        return NEUTRAL_GENDER_FORMS
 
-def _replace_placeholders_strong(doc: Document, mapping: Dict[str, Any]) -> None:
-    """
-    Замена плейсхолдеров формата {{key}} по полному тексту параграфов и ячеек таблиц.
-    mapping: ключи БЕЗ фигурных скобок, например: {"court_name": "..." }
-    """
-    def apply_to_paragraph(p):
-        text = p.text
-        if not text or "{{" not in text:
-            return
-        changed = False
-        for k, v in mapping.items():
-            placeholder = f"{{{{{k}}}}}"
-            if placeholder in text:
-                text = text.replace(placeholder, "" if v is None else str(v))
-                changed = True
-        if changed:
-            _set_paragraph_text_keep_style(p, text)
-
-    for p in doc.paragraphs:
-        apply_to_paragraph(p)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    apply_to_paragraph(p)
-                for nested in cell.tables:
-                    # рекурсивно для вложенных таблиц
-                    for nrow in nested.rows:
-                        for ncell in nrow.cells:
-                            for np in ncell.paragraphs:
-                                apply_to_paragraph(np)
-
-
-def build_gender_forms(gender: str | None) -> dict:
-    """
-    Возвращает слова в нужном роде для плейсхолдеров шаблона:
-    {{debtor_having_word}}, {{debtor_registered_word}}, {{debtor_living_word}},
-    {{debtor_not_registered_word}}, {{debtor_insolvent_word}}
-    """
-    g = (gender or "").strip().lower()
-    if g == "female":
-        return {
-            "debtor_having_word": "имеющая",
-            "debtor_registered_word": "зарегистрированная",
-            "debtor_living_word": "проживающая",
-            "debtor_not_registered_word": "не зарегистрирована",
-            "debtor_insolvent_word": "несостоятельной",
-        }
-    # по умолчанию male
-    return {
-        "debtor_having_word": "имеющий",
-        "debtor_registered_word": "зарегистрированный",
-        "debtor_living_word": "проживающий",
-        "debtor_not_registered_word": "не зарегистрирован",
-        "debtor_insolvent_word": "несостоятельным",
-    }
-
-
-
-def build_debtor_last_name_initials(card: dict) -> str:
-    """
-    Из 'Иванов Иван Иванович' делает 'Иванов И. И.'
-    Если ФИО пустое/неполное — возвращает как есть.
-    """
-    full_name = (card.get("debtor_full_name") or "").strip()
-    parts = [p for p in full_name.split() if p]
-    if len(parts) >= 2:
-        last = parts[0]
-        first_i = parts[1][0].upper() + "."
-        patro_i = (parts[2][0].upper() + ".") if len(parts) >= 3 and parts[2] else ""
-        return (last + " " + first_i + (" " + patro_i if patro_i else "")).strip()
-    return full_name
 
+Source = Union[str, tuple[str, ...], Callable[[PetitionSource], Any]]
 
 
-def build_family_status_block(card: dict) -> str:
+@dataclass(frozen=True)
+class FieldSpec:
     """
-    Возвращает текстовый блок о семейном положении/детях для {{family_status_block}}.
-    Поля ожидаются: marital_status, spouse_full_name, has_minor_children, children_count,
-    marriage_certificate_number, marriage_certificate_date
+    Описание одного плейсхолдера.
+
+    source: ключ карточки, кортеж ключей (берётся первый непустой) или
+        функция от PetitionSource
+    row_index: колонка строки дела, если в карточке пусто
+    default: значение для пустого результата
+    formatter: преобразование непустой строки (после strip)
+
+    Функция-источник может вернуть список строк — тогда плейсхолдер
+    списочный (шаблон выводит по параграфу на элемент), а пустой список
+    заменяется на [default].
     """
-    marital_status = (card.get("marital_status") or "").strip()
-    spouse_full_name = (card.get("spouse_full_name") or "").strip()
-    has_minor_children = card.get("has_minor_children")
-    children_count = card.get("children_count")
-    cert_no = (card.get("marriage_certificate_number") or "").strip()
-    cert_date = (card.get("marriage_certificate_date") or "").strip()
 
-    lines: list[str] = []
+    placeholder: str
+    source: Source
+    default: str = NOT_SPECIFIED
+    formatter: Optional[Callable[[str], str]] = None
+    row_index: Optional[int] = None
 
-    if marital_status == "married":
-        line = "Состоит в браке"
-        if spouse_full_name:
-            line += f" с {spouse_full_name}"
-        line += "."
-        lines.append(line)
 
-        if cert_no:
-            cert_line = f"Свидетельство о заключении брака № {cert_no}"
-            if cert_date:
-                cert_line += f" от {cert_date}"
-            cert_line += "."
-            lines.append(cert_line)
+CompiledField = tuple[str, Callable[[PetitionSource], Union[str, list[str]]]]
 
-    elif marital_status == "single":
-        lines.append("В браке не состоит.")
 
-    if has_minor_children is True:
-        cnt = ""
-        if children_count not in (None, ""):
-            cnt = f" ({children_count} ребёнок(детей))"
-        lines.append(f"Имеет несовершеннолетних детей{cnt}.")
-    elif has_minor_children is False:
-        lines.append("Несовершеннолетних детей нет.")
+def _compile_field(spec: FieldSpec) -> CompiledField:
+    if callable(spec.source):
+        get = spec.source
+    else:
+        keys = (spec.source,) if isinstance(spec.source, str) else spec.source
+        row_index = spec.row_index
 
-    return "\n".join(lines)
+        def get(src: PetitionSource) -> Any:
+            for key in keys:
+                value = src.card.get(key)
+                if value:
+                    return value
+            if row_index is not None and len(src.case_row) > row_index:
+                return src.case_row[row_index]
+            return None
 
+    default, formatter = spec.default, spec.formatter
 
+    def value(src: PetitionSource) -> Union[str, list[str]]:
+        text = get(src)
+        if isinstance(text, list):
+            return text or [default]
+        text = "" if text is None else str(text).strip()
+        if text and formatter is not None:
+            text = formatter(text)
+        return text or default
 
-async def build_bankruptcy_petition_doc(case_row: Tuple, card: dict) -> Path:
-    """
-    Генерация заявления о банкротстве по шаблону.
-    Подстановка строго по 23 плейсхолдерам шаблона + дефолты для пустых данных.
+    return spec.placeholder, value
 
-    НОВОЕ: приоритетно используем данные из case_parties/case_assets (если есть).
-    """
-    cid = case_row[0]
 
-    template_path = Path("templates/petitions/bankruptcy_petition.docx")
-    doc = Document(template_path)
+def compile_fields(specs: list[FieldSpec]) -> list[CompiledField]:
+    """Скомпилировать описания полей (один раз, при импорте модуля)."""
+    names = [s.placeholder for s in specs]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate placeholders in field spec: {sorted(duplicates)}")
+    return [_compile_field(s) for s in specs]
 
-    # Попытка загрузить кредиторов из новых таблиц
-    creditors_from_db = []
-    try:
-        from bankrot_bot.database import get_session
-        from bankrot_bot.services.case_financials import get_case_parties, format_parties_for_doc
 
-        async with get_session() as session:
-            parties = await get_case_parties(session, cid, role="creditor")
-            if parties:
-                creditors_from_db = format_parties_for_doc(parties, role="creditor")
-    except Exception as e:
-        logger.warning(f"Failed to load creditors from DB for case {cid}: {e}")
+# ========== Форматтеры и вычисляемые источники ==========
+
+def _clean_address(text: str) -> str:
+    while ",," in text:
+        text = text.replace(",,", ",")
+    return text.rstrip(" ,")
 
-    # --- дефолты ---
-    def _txt(v: Any) -> str:
-        v = "" if v is None else str(v).strip()
-        return v if v else "не указано"
 
-    def _money_rubles(v: Any) -> str:
-        v = "" if v is None else str(v).strip()
-        return v if v else "0"
+def _marital_status(text: str) -> str:
+    # известный код -> текст; иначе (в т.ч. русский текст) используем как есть
+    text = text.lower()
+    return MARITAL_STATUS_TEXT.get(text, text)
 
-    def _money_kopeks(v: Any) -> str:
-        if v is None or str(v).strip() == "":
-            return "00"
+
+def _safe_block(builder: Callable[[dict], str]) -> Callable[[PetitionSource], str]:
+    def get(src: PetitionSource) -> str:
         try:
-            return f"{int(str(v).strip()):02d}"
-        except (ValueError, TypeError):
-            s = str(v).strip()
-            digits = "".join(ch for ch in s if ch.isdigit())
-            if digits == "":
-                return "00"
-            try:
-                return f"{int(digits):02d}"
-            except (ValueError, TypeError):
-                return "00"
-
-    # --- исходные данные ---
-    court_name = _txt(card.get("court_name") or (case_row[4] if len(case_row) > 4 else None))
-    court_address = _txt(card.get("court_address"))
-
-    financial_manager_info = _txt(
-        card.get("financial_manager_info") or (case_row[6] if len(case_row) > 6 else None)
-    )
-
-    debtor_full_name = _txt(card.get("debtor_full_name"))
-    debtor_address = _txt(card.get("debtor_address"))
-    debtor_birth_date = _txt(card.get("debtor_birth_date"))
-    debtor_inn = _txt(card.get("debtor_inn"))
-    debtor_snils = _txt(card.get("debtor_snils"))
-    debtor_phone = _txt(card.get("debtor_phone"))
-
-    passport_series = (card.get("passport_series") or "").strip()
-    passport_number = (card.get("passport_number") or "").strip()
-    debtor_passport = _txt(f"{passport_series} {passport_number}".strip())
-
-    debtor_passport_issued_by = _txt(card.get("passport_issued_by"))
-    debtor_passport_date = _txt(card.get("passport_date"))
-    debtor_passport_code = _txt(card.get("passport_code"))
-
-    raw_marital = card.get("marital_status")
-    raw_marital = ("" if raw_marital is None else str(raw_marital)).strip().lower()
-
-    debtor_address = (debtor_address or "").strip()
-    while ",," in debtor_address:
-        debtor_address = debtor_address.replace(",,", ",")
-    debtor_address = debtor_address.rstrip(" ,")
-
-    marital_map = {
-        "married": "Состоит в зарегистрированном браке.",
-        "single": "В браке не состоит.",
-        "divorced": "Брак расторгнут.",
-        "widowed": "Вдовец/вдова.",
-    }
-
-    # Если уже введён нормальный русский текст — оставляем как есть
-    if raw_marital in marital_map:
-        marital_status = marital_map[raw_marital]
-    else:
-        # если строка пустая -> дефолт "не указано"
-        # если строка не пустая (в т.ч. русский текст) -> используем как есть
-        marital_status = _txt(raw_marital)
-
-    certificate_number = card.get("certificate_number") or card.get("marriage_certificate_number")
-    certificate_date = card.get("certificate_date") or card.get("marriage_certificate_date")
-    certificate_number = _txt(certificate_number)
-    certificate_date = _txt(certificate_date)
-
-    # НОВАЯ ЛОГИКА: приоритет - creditors_from_db, потом card creditors
-    if creditors_from_db:
-        creditors = creditors_from_db
-    else:
-        creditors = card.get("creditors") if isinstance(card.get("creditors"), list) else []
+            return builder(src.card) or ""
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Failed to build {builder.__name__}: {e}")
+            return ""
+    return get
 
-    auto_r, auto_k = sum_creditors_total(creditors)
-    if auto_r or auto_k:
-        total_debt_rubles = str(auto_r)
-        total_debt_kopeks = f"{auto_k:02d}"
-    else:
-        total_debt_rubles = _money_rubles(card.get("total_debt_rubles"))
-        total_debt_kopeks = _money_kopeks(card.get("total_debt_kopeks"))
 
-    deposit_deferral_request = card.get("deposit_deferral_request") or ""
-    # attachments_list по утверждённым дефолтам должен быть пустым, если нет данных
-    attachments_list = ""
-    try:
-        built_attachments = build_attachments_list(card)
-        if built_attachments and str(built_attachments).strip():
-            attachments_list = str(built_attachments)
-    except (KeyError, TypeError, AttributeError) as e:
-        logger.warning(f"Failed to build attachments list: {e}")
-        attachments_list = ""
-
-    # creditors_block: creditors_text приоритетно, иначе список из БД/card, иначе нейтральный текст
-    creditors_text = card.get("creditors_text")
-    creditors_text = str(creditors_text).strip() if creditors_text is not None else ""
-
-    if creditors_text:
-        creditors_block = creditors_text
-    elif creditors:
-        creditors_block = build_creditors_block(creditors)
-    else:
-        creditors_block = "Сведения о кредиторах не представлены."
+def _creditors_block(src: PetitionSource) -> list[str]:
+    # по строке на кредитора: creditors_text приоритетно, иначе список из карточки
+    text = src.card.get("creditors_text")
+    text = str(text).strip() if text is not None else ""
+    if text:
+        return [line for line in (ln.strip() for ln in text.splitlines()) if line]
+    return list(iter_creditor_lines(src.card_creditors))
 
-    # creditors_header_block: короткий список для шапки (из того же источника, что и creditors_block)
-    if creditors:
-        creditors_header_block = build_creditors_header_block(creditors)
-    else:
-        creditors_header_block = "Сведения о кредиторах не представлены."
 
-    # vehicle_block: дефолт при отсутствии
-    vehicle_block = ""
-    try:
-        vehicle_block = build_vehicle_block(card) or ""
-    except (KeyError, TypeError, AttributeError) as e:
-        logger.warning(f"Failed to build vehicle block: {e}")
-        vehicle_block = ""
-    if not str(vehicle_block).strip():
-        vehicle_block = "Транспортные средства: отсутствуют."
-
-    # --- статус ИП (умная логика: справка или ЕГРИП) ---
-    ip_cert_number = (card.get("ip_certificate_number") or "").strip()
-    ip_cert_date = (card.get("ip_certificate_date") or "").strip()
-
-    if ip_cert_number and ip_cert_date:
-        ip_status_text = (
+def _creditors_header_block(src: PetitionSource) -> str:
+    # короткий список для шапки (из того же источника, что и creditors_block)
+    return build_creditors_header_block(src.card_creditors) if src.card_creditors else ""
+
+
+def _total_debt_rubles(src: PetitionSource) -> str:
+    if src.debt_total:
+        return str(src.debt_total[0])
+    return src.card.get("total_debt_rubles") or ""
+
+
+def _kopeks(text: str) -> str:
+    digits = "".join(ch for ch in text if ch.isdigit())
+    return f"{int(digits):02d}" if digits else "00"
+
+
+def _total_debt_kopeks(src: PetitionSource) -> str:
+    if src.debt_total:
+        return f"{src.debt_total[1]:02d}"
+    value = src.card.get("total_debt_kopeks")
+    return "" if value is None else _kopeks(str(value))
+
+
+def _ip_status_text(src: PetitionSource) -> str:
+    number = (src.card.get("ip_certificate_number") or "").strip()
+    date = (src.card.get("ip_certificate_date") or "").strip()
+    if number and date:
+        text = (
             "не зарегистрирован в качестве индивидуального предпринимателя, "
-            f"что подтверждается справкой № {ip_cert_number} от {ip_cert_date}."
+            f"что подтверждается справкой № {number} от {date}."
         )
     else:
-        ip_status_text = (
+        text = (
             "не зарегистрирован в качестве индивидуального предпринимателя, "
             "что подтверждается сведениями из ЕГРИП"
         )
-
     # нормализация, чтобы не было 'ЕГРИП..'
-    ip_status_text = (ip_status_text or "").strip()
-    while ".." in ip_status_text:
-        ip_status_text = ip_status_text.replace("..", ".")
+    while ".." in text:
+        text = text.replace("..", ".")
+    return text
 
-    mapping = {
-        "attachments_list": attachments_list,
-        "certificate_date": certificate_date,
-        "certificate_number": certificate_number,
-        "court_address": court_address,
-        "court_name": court_name,
 
-        # Кредиторы: шапка + основной блок
-        "creditors_block": creditors_block,
-        "creditors_header_block": creditors_header_block,
+def _gender_form(key: str) -> Callable[[PetitionSource], str]:
+    return lambda src: src.gender_forms[key]
 
-        "date": datetime.now().strftime("%d.%m.%Y"),
 
-        "debtor_address": debtor_address,
-        "debtor_birth_date": debtor_birth_date,
-        "debtor_full_name": debtor_full_name,
+# ========== Заявление о банкротстве ==========
 
-        # В шаблоне есть и обычные, и *_or_absent
-        "debtor_inn": debtor_inn if debtor_inn != "не указано" else "",
-        "debtor_inn_or_absent": debtor_inn if debtor_inn != "не указано" else "отсутствует",
+PETITION_FIELDS: list[FieldSpec] = [
+    FieldSpec("attachments_list", _safe_block(build_attachments_list), default=""),
+    FieldSpec("certificate_date", ("certificate_date", "marriage_certificate_date")),
+    FieldSpec("certificate_number", ("certificate_number", "marriage_certificate_number")),
+    FieldSpec("court_address", "court_address"),
+    FieldSpec("court_name", "court_name", row_index=4),
 
-        "debtor_snils": debtor_snils if debtor_snils != "не указано" else "",
-        "debtor_snils_or_absent": debtor_snils if debtor_snils != "не указано" else "отсутствует",
+    # Кредиторы: шапка + основной блок
+    FieldSpec("creditors_block", _creditors_block, default=NO_CREDITORS),
+    FieldSpec("creditors_header_block", _creditors_header_block, default=NO_CREDITORS),
 
-        "debtor_phone_or_absent": debtor_phone if debtor_phone != "не указано" else "отсутствует",
+    FieldSpec("date", lambda src: src.now.strftime("%d.%m.%Y")),
 
-        # Паспорт: ключи должны совпадать с плейсхолдерами шаблона
-        "passport_series": passport_series or "",
-        "passport_number": passport_number or "",
-        "passport_issued_by": debtor_passport_issued_by if debtor_passport_issued_by != "не указано" else "",
-        "passport_date": debtor_passport_date if debtor_passport_date != "не указано" else "",
-        "passport_code": debtor_passport_code if debtor_passport_code != "не указано" else "",
+    FieldSpec("debtor_address", "debtor_address", formatter=_clean_address),
+    FieldSpec("debtor_birth_date", "debtor_birth_date"),
+    FieldSpec("debtor_full_name", "debtor_full_name"),
 
-        # Эти плейсхолдеры есть в шаблоне (ты их показывал в списке)
-        "debtor_last_name_initials": build_debtor_last_name_initials(card),
+    # В шаблоне есть и обычные, и *_or_absent
+    FieldSpec("debtor_inn", "debtor_inn", default=""),
+    FieldSpec("debtor_inn_or_absent", "debtor_inn", default="отсутствует"),
+    FieldSpec("debtor_snils", "debtor_snils", default=""),
+    FieldSpec("debtor_snils_or_absent", "debtor_snils", default="отсутствует"),
+    FieldSpec("debtor_phone_or_absent", "debtor_phone", default="отсутствует"),
 
-        "financial_manager_info": financial_manager_info,
-        "family_status_block": build_family_status_block(card),
-        "ip_status_text": ip_status_text,
+    # Паспорт: ключи совпадают с плейсхолдерами шаблона
+    FieldSpec("passport_series", "passport_series", default=""),
+    FieldSpec("passport_number", "passport_number", default=""),
+    FieldSpec("passport_issued_by", "passport_issued_by", default=""),
+    FieldSpec("passport_date", "passport_date", default=""),
+    FieldSpec("passport_code", "passport_code", default=""),
 
-        "marital_status": marital_status,
+    FieldSpec("debtor_last_name_initials", lambda src: build_debtor_last_name_initials(src.card), default=""),
+    FieldSpec("financial_manager_info", "financial_manager_info", row_index=6),
+    FieldSpec("family_status_block", lambda src: build_family_status_block(src.card), default=""),
+    FieldSpec("ip_status_text", _ip_status_text),
+    FieldSpec("marital_status", "marital_status", formatter=_marital_status),
 
-        "total_debt_kopeks": total_debt_kopeks,
-        "total_debt_rubles": total_debt_rubles,
+    FieldSpec("total_debt_kopeks", _total_debt_kopeks, default="00"),
+    FieldSpec("total_debt_rubles", _total_debt_rubles, default="0"),
 
-        "vehicle_block": vehicle_block,
+    FieldSpec("vehicle_block", _safe_block(build_vehicle_block), default="Транспортные средства: отсутствуют."),
+    FieldSpec("deposit_deferral_request", "deposit_deferral_request", default=""),
 
-        "deposit_deferral_request": deposit_deferral_request,
-    }
+    # гендерные формы
+    *(FieldSpec(key, _gender_form(key), default="") for key in NEUTRAL_GENDER_FORMS),
+]
 
-    # гендерные формы (debtor_having_word, debtor_registered_word, debtor_living_word,
-    # debtor_not_registered_word, debtor_insolvent_word)
-    try:
-        gender_forms = build_gender_forms(card.get("debtor_gender"))
-        if isinstance(gender_forms, dict):
-            mapping.update(gender_forms)
-    except (KeyError, TypeError, AttributeError) as e:
-        # если пол не заполнен или функция упала — ставим нейтральные значения
-        logger.warning(f"Failed to build gender forms: {e}")
-        mapping.update(
-            {
-                "debtor_having_word": "имеющий(ая)",
-                "debtor_registered_word": "зарегистрированный(ая)",
-                "debtor_living_word": "проживающий(ая)",
-                "debtor_not_registered_word": "не зарегистрирован(а)",
-                "debtor_insolvent_word": "неплатёжеспособный(ая)",
-            }
-        )
+_PETITION_COMPILED = compile_fields(PETITION_FIELDS)
+_PETITION_SPECS = {spec.placeholder: spec for spec in PETITION_FIELDS}
+
+
+def missing_card_fields(
+    card: dict,
+    template_path: Path = PETITION_TEMPLATE,
+    case_row: Optional[Tuple] = None,
+) -> list[str]:
+    """
+    Поля карточки, которых не хватает именно этому шаблону.
+
+    По манифесту шаблона берутся его плейсхолдеры; поле считается
+    незаполненным, если плейсхолдер берётся из карточки, дефолт — "не указано"
+    (т.е. в документ попала бы заглушка) и все ключи-источники пусты.
+    Плейсхолдеры шаблона, которых нет в PETITION_FIELDS, возвращаются как есть.
+    Колонки строки дела (row_index) учитываются, только если передан case_row.
+    """
+    missing: list[str] = []
+    for name in sorted(template_manifest(template_path).placeholders):
+        spec = _PETITION_SPECS.get(name)
+        if spec is None:
+            missing.append(name)
+            continue
+        if callable(spec.source) or spec.default != NOT_SPECIFIED:
+            continue
+        if spec.row_index is not None and case_row is None:
+            continue
+        keys = (spec.source,) if isinstance(spec.source, str) else spec.source
+        if any(str(card.get(k) or "").strip() for k in keys):
+            continue
+        if case_row is not None and spec.row_index is not None and len(case_row) > spec.row_index:
+            if str(case_row[spec.row_index] or "").strip():
+                continue
+        missing.append(keys[0])
+    return missing
+
+
+def build_petition_context(
+    case_row: Tuple,
+    card: dict,
+    creditors_from_db: Optional[list[dict]] = None,
+    now: Optional[datetime] = None,
+) -> dict[str, str]:
+    """
+    Значения плейсхолдеров заявления о банкротстве.
 
+    Args:
+        case_row: Строка дела из cases_db.get_case()
+        card: Карточка дела из cases_db.get_case_card()
+        creditors_from_db: Кредиторы из case_parties (format_parties_for_doc), приоритетнее карточки
+        now: Дата заявления (по умолчанию — сейчас)
 
-    _replace_placeholders_strong(doc, mapping)
-    # второй проход — добиваем плейсхолдеры, разорванные Word по runs
-    for p in doc.paragraphs:
-        for run in p.runs:
-            if "{{" in run.text:
-                for k, v in mapping.items():
-                    run.text = run.text.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    for run in p.runs:
-                        if "{{" in run.text:
-                            for k, v in mapping.items():
-                                run.text = run.text.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
-
-
-    # Контроль: не должно остаться {{...}}
-    def _has_unreplaced_placeholders(d: Document) -> bool:
-        for p in d.paragraphs:
-            if "{{" in (p.text or ""):
-                return True
-        for t in d.tables:
-            for row in t.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        if "{{" in (p.text or ""):
-                            return True
-        return False
-
-    if _has_unreplaced_placeholders(doc):
-        import re
-
-        # диагностируем, что именно осталось в документе
-        left = set()
-
-        def _scan_paragraph_for_left(p):
-            txt = p.text or ""
-            for m in re.findall(r"\{\{[^}]+\}\}", txt):
-                left.add(m)
-
-        for p in doc.paragraphs:
-            _scan_paragraph_for_left(p)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        _scan_paragraph_for_left(p)
-                    for nested in cell.tables:
-                        for nrow in nested.rows:
-                            for ncell in nrow.cells:
-                                for p in ncell.paragraphs:
-                                    _scan_paragraph_for_left(p)
-
-        import logging
-        logging.exception("UNREPLACED_PLACEHOLDERS: %s", sorted(left))
-
-        raise ValueError("В документе остались не заменённые плейсхолдеры вида {{...}}")
-
-    fname = f"bankruptcy_petition_case_{cid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-    case_dir = GENERATED_DIR / "cases" / str(cid)
-    case_dir.mkdir(parents=True, exist_ok=True)
-    out_path = case_dir / fname
-    doc.save(out_path)
-    return out_path
-
-
-async def _selected_case_id(state: FSMContext) -> int | None:
-    data = await state.get_data()
+    Returns:
+        Словарь {плейсхолдер без скобок: значение} с дефолтами для пустых данных
+    """
+    src = PetitionSource(case_row, card, creditors_from_db, now or datetime.now())
+    return {name: value(src) for name, value in _PETITION_COMPILED}
+
+
+async def build_bankruptcy_petition_doc(case_row: Tuple, card: dict) -> str:
+    """
+    Генерация заявления о банкротстве по шаблону.
+    Документ сохраняется в хранилище документов; возвращается его ключ.
+
+    Кредиторы приоритетно берутся из case_parties (если есть).
+    """
+    from bankrot_bot.database import get_session
+    from bankrot_bot.services.case_financials import format_parties_for_doc, get_case_parties
+
+    cid = case_row[0]
+
+    # Попытка загрузить кредиторов из новых таблиц
+    creditors_from_db: list[dict] = []
     try:
-        return int(data.get("docs_case_id"))
-    except (TypeError, ValueError):
-        return None
+        async with get_session() as session:
+            parties = await get_case_parties(session, cid, role="creditor")
+            if parties:
+                creditors_from_db = format_parties_for_doc(parties, role="creditor")
+    except Exception as e:
+        logger.warning(f"Failed to load creditors from DB for case {cid}: {e}")
+
+    now = datetime.now()
+    context = build_petition_context(case_row, card, creditors_from_db, now=now)
+
+    fname = f"bankruptcy_petition_case_{cid}_{now.strftime('%Y%m%d_%H%M%S')}.docx"
+    # повторная генерация по тому же делу правит только изменившиеся параграфы
+    with render_petition_incremental((case_row[1], cid), context) as rendered:
+        return await get_storage().save_stream(case_key(cid, fname), rendered)
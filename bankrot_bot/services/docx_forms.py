@@ -4,18 +4,28 @@
 Модуль предоставляет функции для автоматического заполнения шаблонов:
 - Список кредиторов и должников гражданина
 - Опись имущества гражданина
+- Проект документа из текста ответа GigaChat (ходатайство, мировое)
 """
 from __future__ import annotations
 
-import io
+import copy
 import logging
+import re
 from datetime import datetime
+from decimal import Decimal
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, Optional, Sequence, Tuple
 
 from docx import Document
-from docx.shared import Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.table import CT_Row, CT_Tc
 from docx.table import Table, _Cell
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bankrot_bot.services.docx_output import RenderedDocument, save_document
+from bankrot_bot.services.money import format_amount, to_kopeks
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +66,86 @@ def find_cell_with_text(table: Table, search_text: str) -> Optional[Tuple[int, i
     return None
 
 
+def normalize_label(text: str) -> str:
+    """Нормализовать текст ячейки для поиска: нижний регистр, пробелы схлопнуты."""
+    return " ".join(text.lower().split())
+
+
+class TableCellIndex:
+    """
+    Положение заданных лейблов в таблице: лейбл -> (row_idx, col_idx).
+
+    Все лейблы сопоставляются с ячейками за один проход по таблице (текст
+    каждой ячейки читается и приводится к нижнему регистру один раз,
+    объединённые ячейки — тоже один раз); проход заканчивается, как только
+    найдены все лейблы. Поиски после этого — обращения к словарю. Индекс
+    нужно строить после изменения структуры таблицы (например, после
+    replace_table_rows).
+    """
+
+    def __init__(self, table: Table, labels: Iterable[str]) -> None:
+        self.table = table
+        self._grid: list[list[_Cell]] = [list(row.cells) for row in table.rows]
+        self._positions: dict[str, Optional[tuple[int, int]]] = {normalize_label(label): None for label in labels}
+
+        pending = set(self._positions)
+        seen: set[int] = set()
+        for row_idx, cells in enumerate(self._grid):
+            for col_idx, cell in enumerate(cells):
+                if not pending:
+                    return
+                if id(cell._tc) in seen:
+                    continue
+                seen.add(id(cell._tc))
+                text = normalize_label(cell.text)
+                if not text:
+                    continue
+                for key in [k for k in pending if k in text]:
+                    self._positions[key] = (row_idx, col_idx)
+                    pending.discard(key)
+
+    def find(self, label: str) -> Optional[tuple[int, int]]:
+        """
+        Первая ячейка (в порядке обхода), содержащая label.
+
+        Семантика как у find_cell_with_text: поиск подстроки без учёта регистра.
+
+        Raises:
+            KeyError: label не передавался при построении индекса
+        """
+        key = normalize_label(label)
+        if key not in self._positions:
+            raise KeyError(f"Label {label!r} is not indexed")
+        return self._positions[key]
+
+    def cell(self, row_idx: int, col_idx: int) -> Optional[_Cell]:
+        """Ячейка по координатам сетки или None."""
+        if 0 <= row_idx < len(self._grid) and 0 <= col_idx < len(self._grid[row_idx]):
+            return self._grid[row_idx][col_idx]
+        return None
+
+    def right_of(self, label: str, offset: int = 1) -> Optional[_Cell]:
+        """
+        offset-я ячейка справа от ячейки с label.
+
+        Объединённые по горизонтали ячейки считаются одной ячейкой.
+        """
+        pos = self.find(label)
+        if pos is None:
+            return None
+        row_idx, col_idx = pos
+        cells = self._grid[row_idx]
+        current = cells[col_idx]._tc
+        for cell in cells[col_idx + 1:]:
+            if cell._tc is current:
+                continue
+            current = cell._tc
+            offset -= 1
+            if offset == 0:
+                return cell
+        return None
+
+
 def set_cell_text(cell: _Cell, text: str, preserve_style: bool = True):
     """
     Установить текст в ячейку с сохранением стиля.
@@ -84,41 +174,152 @@ def set_cell_text(cell: _Cell, text: str, preserve_style: bool = True):
         run.font.size = original_style
 
 
+# ========== Шаблонизация строк таблиц ==========
+
+_W_TR = qn("w:tr")
+_W_TC = qn("w:tc")
+_W_P = qn("w:p")
+_W_R = qn("w:r")
+_W_T = qn("w:t")
+_W_BR = qn("w:br")
+_W_PPR = qn("w:pPr")
+_W_RPR = qn("w:rPr")
+_XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+_ROW_NUMBER_RE = re.compile(r"^\s*\d+(\.\d+)*\.?\s*$")
+
+
+def _fill_tc_text(tc: CT_Tc, text: str) -> None:
+    """
+    Записать текст в ячейку <w:tc> напрямую в XML.
+
+    Остаётся первый параграф (с его pPr) и первый run (с его rPr),
+    остальное содержимое ячейки удаляется.
+    """
+    paragraphs = tc.findall(_W_P)
+    if not paragraphs:
+        p = OxmlElement("w:p")
+        tc.append(p)
+    else:
+        p = paragraphs[0]
+        for extra in paragraphs[1:]:
+            tc.remove(extra)
+
+    runs = p.findall(_W_R)
+    if runs:
+        r = runs[0]
+        for extra in runs[1:]:
+            p.remove(extra)
+        for child in list(r):
+            if child.tag != _W_RPR:
+                r.remove(child)
+    else:
+        r = OxmlElement("w:r")
+        # свойства знака абзаца — лучшее приближение к стилю пустой ячейки
+        ppr = p.find(_W_PPR)
+        mark_rpr = ppr.find(_W_RPR) if ppr is not None else None
+        if mark_rpr is not None:
+            r.append(copy.deepcopy(mark_rpr))
+        p.append(r)
+
+    for i, line in enumerate(str(text).split("\n")):
+        if i:
+            r.append(OxmlElement("w:br"))
+        t = OxmlElement("w:t")
+        t.text = line
+        t.set(_XML_SPACE, "preserve")
+        r.append(t)
+
+
+def find_template_row_index(table: Table) -> int:
+    """
+    Индекс строки-образца для данных.
+
+    Берётся строка с номером вида "1", "1.1" в первой ячейке и наибольшим
+    числом ячеек (строки-разделы вроде "1 | Денежные обязательства" с
+    объединёнными ячейками пропускаются). Если такой нет — последняя строка.
+    """
+    best_idx, best_cells = -1, 0
+    trs = table._tbl.tr_lst
+    for idx, tr in enumerate(trs):
+        tcs = tr.findall(_W_TC)
+        if len(tcs) <= best_cells:
+            continue
+        first_text = "".join(t.text or "" for t in tcs[0].iter(_W_T))
+        if _ROW_NUMBER_RE.match(first_text):
+            best_idx, best_cells = idx, len(tcs)
+    return best_idx if best_idx >= 0 else len(trs) - 1
+
+
+def fill_table_rows(table: Table, rows: Iterable[Sequence[str]], template_tr: CT_Row) -> int:
+    """
+    Добавить строки в таблицу, клонируя XML строки-образца <w:tr>.
+
+    Образец копируется (deepcopy) один раз на строку со всем форматированием:
+    свойства строки, ширины и границы ячеек, стили параграфов и runs.
+    Текст пишется прямо в <w:t>, без прокси-объектов python-docx, поэтому
+    стоимость не зависит от числа уже добавленных строк.
+
+    Args:
+        table: Таблица
+        rows: Значения ячеек по строкам (лишние значения отбрасываются)
+        template_tr: Элемент <w:tr> строки-образца (может быть уже удалён из таблицы)
+
+    Returns:
+        Количество добавленных строк
+    """
+    tbl = table._tbl
+    count = 0
+    for values in rows:
+        new_tr = copy.deepcopy(template_tr)
+        tcs = new_tr.findall(_W_TC)
+        for tc, value in zip(tcs, values):
+            _fill_tc_text(tc, value)
+        for tc in tcs[len(values):]:
+            _fill_tc_text(tc, "")
+        tbl.append(new_tr)
+        count += 1
+    return count
+
+
+def replace_table_rows(table: Table, rows: Iterable[Sequence[str]]) -> int:
+    """
+    Заменить строки данных таблицы: шапка (всё выше строки-образца)
+    остаётся, строка-образец и всё ниже удаляются, новые строки клонируются
+    с образца.
+
+    Returns:
+        Количество добавленных строк
+    """
+    tbl = table._tbl
+    trs = tbl.tr_lst
+    template_idx = find_template_row_index(table)
+    template_tr = trs[template_idx]
+    for tr in trs[template_idx:]:
+        tbl.remove(tr)
+    return fill_table_rows(table, rows, template_tr)
+
+
 def add_table_row(table: Table, values: list[str], template_row_idx: int = 1) -> None:
     """
-    Добавить строку в таблицу, копируя стиль из template_row_idx.
+    Добавить строку в таблицу, копируя форматирование из template_row_idx.
+
+    Для множества строк используйте fill_table_rows() — он не пересчитывает
+    список строк таблицы на каждой итерации.
 
     Args:
         table: Таблица
         values: Список значений для ячеек
         template_row_idx: Индекс строки-шаблона для копирования стиля
     """
-    # Добавляем новую строку
-    new_row = table.add_row()
-
-    # Копируем стиль из template_row
-    if template_row_idx < len(table.rows) - 1:  # -1 т.к. мы только что добавили строку
-        template_row = table.rows[template_row_idx]
-        for col_idx, cell in enumerate(new_row.cells):
-            if col_idx < len(template_row.cells):
-                # Копируем стиль параграфа
-                template_cell = template_row.cells[col_idx]
-                if template_cell.paragraphs and cell.paragraphs:
-                    template_para = template_cell.paragraphs[0]
-                    new_para = cell.paragraphs[0]
-
-                    if template_para.runs:
-                        template_run = template_para.runs[0]
-                        new_run = new_para.add_run()
-                        if hasattr(template_run.font, 'size') and template_run.font.size:
-                            new_run.font.size = template_run.font.size
-                        if hasattr(template_run.font, 'name') and template_run.font.name:
-                            new_run.font.name = template_run.font.name
-
-    # Заполняем значениями
-    for col_idx, value in enumerate(values):
-        if col_idx < len(new_row.cells):
-            set_cell_text(new_row.cells[col_idx], value)
+    trs = table._tbl.tr_lst
+    if not trs:
+        new_row = table.add_row()
+        for cell, value in zip(new_row.cells, values):
+            set_cell_text(cell, value)
+        return
+    template_tr = trs[template_row_idx] if template_row_idx < len(trs) else trs[-1]
+    fill_table_rows(table, [values], template_tr)
 
 
 def fill_debtor_info_table(doc: Document, debtor_data: dict) -> None:
@@ -134,8 +335,6 @@ def fill_debtor_info_table(doc: Document, debtor_data: dict) -> None:
         logger.warning("No tables found in document")
         return
 
-    first_table = doc.tables[0]
-
     # Маппинг лейблов на данные
     field_mapping = {
         "фамилия": debtor_data.get("last_name", "-"),
@@ -148,223 +347,245 @@ def fill_debtor_info_table(doc: Document, debtor_data: dict) -> None:
         "снилс": debtor_data.get("snils", "-"),
         "инн": debtor_data.get("inn", "-"),
     }
+    index = TableCellIndex(doc.tables[0], field_mapping)
 
-    # Заполняем ячейки
+    # Записываем значение в следующую ячейку (справа)
     for label, value in field_mapping.items():
-        result = find_cell_with_text(first_table, label)
-        if result:
-            row_idx, col_idx, cell = result
-            # Записываем значение в следующую ячейку (справа)
-            if col_idx + 1 < len(first_table.rows[row_idx].cells):
-                target_cell = first_table.rows[row_idx].cells[col_idx + 1]
-                set_cell_text(target_cell, value)
+        target_cell = index.right_of(label)
+        if target_cell is not None:
+            set_cell_text(target_cell, value)
 
 
 # ========== Генерация документов ==========
 
-async def render_creditors_list(case_id: int) -> bytes:
+CREDITORS_LIST_TEMPLATE = Path("templates/forms/creditors_list_template.docx")
+INVENTORY_TEMPLATE = Path("templates/forms/inventory_template.docx")
+
+# Данные должника (из карточки дела)
+# TODO: загрузить из Case/card если нужно
+EMPTY_DEBTOR_DATA = {
+    "last_name": "-",
+    "first_name": "-",
+    "middle_name": "-",
+    "birth_date": "-",
+    "birth_place": "-",
+    "address": "-",
+    "passport": "-",
+    "snils": "-",
+    "inn": "-",
+}
+
+
+def party_rows(parties: list) -> list[list[str]]:
+    """Строки таблицы кредиторов/должников: [№, наименование, основание, сумма, валюта]."""
+    return [
+        [
+            str(idx),
+            party.name,
+            party.basis or "-",
+            format_amount(to_kopeks(party.amount)),
+            party.currency or "RUB",
+        ]
+        for idx, party in enumerate(parties, start=1)
+    ]
+
+
+def asset_rows(assets: list) -> list[list[str]]:
+    """Строки описи имущества: [№, вид, описание, количество/площадь, стоимость]."""
+    return [
+        [
+            str(idx),
+            asset.kind,
+            asset.description or "-",
+            asset.qty_or_area or "-",
+            format_amount(to_kopeks(asset.value)) if asset.value else "-",
+        ]
+        for idx, asset in enumerate(assets, start=1)
+    ]
+
+
+def build_creditors_list(
+    creditor_rows: list[list[str]],
+    debtor_rows: list[list[str]],
+    totals: dict,
+    debtor_data: dict,
+    template_path: Path = CREDITORS_LIST_TEMPLATE,
+) -> Document:
     """
-    Сгенерировать "Список кредиторов и должников гражданина".
+    Заполнить шаблон "Список кредиторов и должников" готовыми строками.
 
-    Args:
-        case_id: ID дела
-
-    Returns:
-        bytes: содержимое DOCX-файла
+    Синхронная часть без обращений к БД — её можно выполнять в пуле процессов.
     """
-    from bankrot_bot.database import get_session
-    from bankrot_bot.services.case_financials import (
-        get_case_parties,
-        calculate_parties_totals,
-    )
-
-    template_path = Path("templates/forms/creditors_list_template.docx")
-
     if not template_path.exists():
         raise FileNotFoundError(f"Template not found: {template_path}")
 
     # Загружаем шаблон
     doc = Document(str(template_path))
 
-    # Получаем данные
-    async with get_session() as session:
-        # Кредиторы
-        creditors = await get_case_parties(session, case_id, role="creditor")
-        # Должники (дебиторы)
-        debtors = await get_case_parties(session, case_id, role="debtor")
-
-        # Данные должника (из карточки дела)
-        # TODO: загрузить из Case/card если нужно
-        debtor_data = {
-            "last_name": "-",
-            "first_name": "-",
-            "middle_name": "-",
-            "birth_date": "-",
-            "birth_place": "-",
-            "address": "-",
-            "passport": "-",
-            "snils": "-",
-            "inn": "-",
-        }
-
     # Заполняем данные должника
     fill_debtor_info_table(doc, debtor_data)
 
     # Заполняем кредиторов
     creditors_table = find_table_by_text(doc, "Сведения о кредиторах")
-    if creditors_table and creditors:
-        # Удаляем пустые строки-шаблоны (если есть)
-        # Предполагаем, что первая строка - заголовок, вторая - шаблон
-        # Оставляем только заголовок
-        while len(creditors_table.rows) > 1:
-            creditors_table._element.remove(creditors_table.rows[-1]._element)
-
-        # Добавляем кредиторов
-        for idx, creditor in enumerate(creditors, start=1):
-            amount = f"{float(creditor.amount):.2f}" if creditor.amount else "0.00"
-            basis = creditor.basis or "-"
-
-            add_table_row(creditors_table, [
-                str(idx),
-                creditor.name,
-                basis,
-                amount,
-                creditor.currency or "RUB",
-            ], template_row_idx=0)
+    if creditors_table and creditor_rows:
+        # Шапка остаётся, строки клонируем с образца строки данных (1.1)
+        replace_table_rows(creditors_table, creditor_rows)
 
     # Заполняем должников (дебиторов)
     debtors_table = find_table_by_text(doc, "Сведения о должниках")
-    if debtors_table and debtors:
+    if debtors_table and debtor_rows:
         # Аналогично для должников
-        while len(debtors_table.rows) > 1:
-            debtors_table._element.remove(debtors_table.rows[-1]._element)
+        replace_table_rows(debtors_table, debtor_rows)
 
-        for idx, debtor in enumerate(debtors, start=1):
-            amount = f"{float(debtor.amount):.2f}" if debtor.amount else "0.00"
-            basis = debtor.basis or "-"
+    # Заполняем итоги (ищем таблицу с "Итого"); индекс строится после добавления строк
+    for table in doc.tables:
+        index = TableCellIndex(table, ["Итого"])
+        # Записываем суммы в следующие ячейки
+        creditors_cell = index.right_of("Итого")
+        if creditors_cell is not None:
+            set_cell_text(creditors_cell, format_amount(to_kopeks(totals['total_creditors'])))
+
+        # Сумма должников (если есть колонка)
+        debtors_cell = index.right_of("Итого", offset=2)
+        if debtors_cell is not None:
+            set_cell_text(debtors_cell, format_amount(to_kopeks(totals['total_debtors'])))
+
+    return doc
+
+
+def build_inventory(
+    rows: list[list[str]],
+    total: Decimal,
+    debtor_data: dict,
+    template_path: Path = INVENTORY_TEMPLATE,
+) -> Document:
+    """
+    Заполнить шаблон "Опись имущества" готовыми строками.
 
-            add_table_row(debtors_table, [
-                str(idx),
-                debtor.name,
-                basis,
-                amount,
-                debtor.currency or "RUB",
-            ], template_row_idx=0)
+    Синхронная часть без обращений к БД — её можно выполнять в пуле процессов.
+    """
+    if not template_path.exists():
+        raise FileNotFoundError(f"Template not found: {template_path}")
 
-    # Считаем итоги
-    all_parties = creditors + debtors
-    totals = calculate_parties_totals(all_parties)
+    # Загружаем шаблон
+    doc = Document(str(template_path))
+
+    # Заполняем данные должника
+    fill_debtor_info_table(doc, debtor_data)
+
+    # Заполняем имущество
+    # Обычно в описи имущества несколько таблиц по типам:
+    # - Недвижимое имущество
+    # - Движимое имущество
+    # - Ценные бумаги
+    # - Иное имущество
+
+    # Поиск основной таблицы имущества
+    inventory_table = find_table_by_text(doc, "имущество") or find_table_by_text(doc, "движимое")
 
-    # Заполняем итоги (ищем таблицу с "Итого")
+    if inventory_table and rows:
+        # Шапка остаётся, строки имущества клонируем с образца
+        replace_table_rows(inventory_table, rows)
+
+    # Заполняем итоги
     for table in doc.tables:
-        result = find_cell_with_text(table, "Итого")
-        if result:
-            row_idx, col_idx, cell = result
-            # Записываем суммы в следующие ячейки
-            if col_idx + 1 < len(table.rows[row_idx].cells):
-                creditors_total = f"{float(totals['total_creditors']):.2f}"
-                set_cell_text(table.rows[row_idx].cells[col_idx + 1], creditors_total)
+        index = TableCellIndex(table, ["Итого", "Общая стоимость"])
+        # Записываем сумму в следующую ячейку
+        total_cell = index.right_of("Итого") or index.right_of("Общая стоимость")
+        if total_cell is not None:
+            set_cell_text(total_cell, format_amount(to_kopeks(total)))
 
-            # Сумма должников (если есть колонка)
-            if col_idx + 2 < len(table.rows[row_idx].cells):
-                debtors_total = f"{float(totals['total_debtors']):.2f}"
-                set_cell_text(table.rows[row_idx].cells[col_idx + 2], debtors_total)
+    return doc
 
-    # Сохраняем в память
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output.read()
 
+def build_text_document(title: str, text: str) -> Document:
+    """
+    Документ из простого текста: заголовок и по абзацу на строку.
 
-async def render_inventory(case_id: int) -> bytes:
+    Используется для экспорта ответов GigaChat; пустые строки пропускаются.
     """
-    Сгенерировать "Опись имущества гражданина".
+    doc = Document()
+    heading = doc.add_paragraph()
+    heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    heading.add_run(title).bold = True
+    for line in text.splitlines():
+        if line.strip():
+            doc.add_paragraph(line.strip())
+    return doc
 
-    Args:
-        case_id: ID дела
+
+async def load_creditors_list_data(session: AsyncSession, case_id: int) -> tuple:
+    """
+    Данные для build_creditors_list() по делу.
 
     Returns:
-        bytes: содержимое DOCX-файла
+        (creditor_rows, debtor_rows, totals, debtor_data)
+    """
+    from bankrot_bot.services.case_financials import (
+        get_case_parties,
+        calculate_parties_totals,
+    )
+
+    # Кредиторы
+    creditors = await get_case_parties(session, case_id, role="creditor")
+    # Должники (дебиторы)
+    debtors = await get_case_parties(session, case_id, role="debtor")
+
+    # Считаем итоги
+    totals = calculate_parties_totals(creditors + debtors)
+    return party_rows(creditors), party_rows(debtors), totals, dict(EMPTY_DEBTOR_DATA)
+
+
+async def load_inventory_data(session: AsyncSession, case_id: int) -> tuple:
+    """
+    Данные для build_inventory() по делу.
+
+    Returns:
+        (rows, total, debtor_data)
     """
-    from bankrot_bot.database import get_session
     from bankrot_bot.services.case_financials import (
         get_case_assets,
         calculate_assets_total,
     )
 
-    template_path = Path("templates/forms/inventory_template.docx")
+    assets = await get_case_assets(session, case_id)
+    # Считаем итоговую стоимость
+    return asset_rows(assets), calculate_assets_total(assets), dict(EMPTY_DEBTOR_DATA)
 
-    if not template_path.exists():
-        raise FileNotFoundError(f"Template not found: {template_path}")
 
-    # Загружаем шаблон
-    doc = Document(str(template_path))
+async def render_creditors_list(case_id: int) -> RenderedDocument:
+    """
+    Сгенерировать "Список кредиторов и должников гражданина".
+
+    Args:
+        case_id: ID дела
+
+    Returns:
+        Файловый объект с DOCX (позиция в начале); закрыть после использования
+    """
+    from bankrot_bot.database import get_session
 
-    # Получаем данные
     async with get_session() as session:
-        assets = await get_case_assets(session, case_id)
-
-        # Данные должника
-        debtor_data = {
-            "last_name": "-",
-            "first_name": "-",
-            "middle_name": "-",
-            "birth_date": "-",
-            "birth_place": "-",
-            "address": "-",
-            "passport": "-",
-            "snils": "-",
-            "inn": "-",
-        }
+        data = await load_creditors_list_data(session, case_id)
 
-    # Заполняем данные должника
-    fill_debtor_info_table(doc, debtor_data)
+    # Один проход сохранения в spooled-файл, без копий в bytes
+    return save_document(build_creditors_list(*data))
 
-    # Заполняем имущество
-    # Обычно в описи имущества несколько таблиц по типам:
-    # - Недвижимое имущество
-    # - Движимое имущество
-    # - Ценные бумаги
-    # - Иное имущество
 
-    # Поиск основной таблицы имущества
-    inventory_table = find_table_by_text(doc, "имущество") or find_table_by_text(doc, "движимое")
+async def render_inventory(case_id: int) -> RenderedDocument:
+    """
+    Сгенерировать "Опись имущества гражданина".
+
+    Args:
+        case_id: ID дела
 
-    if inventory_table and assets:
-        # Удаляем пустые строки-шаблоны
-        while len(inventory_table.rows) > 1:
-            inventory_table._element.remove(inventory_table.rows[-1]._element)
-
-        # Добавляем имущество
-        for idx, asset in enumerate(assets, start=1):
-            value = f"{float(asset.value):.2f}" if asset.value else "-"
-            qty = asset.qty_or_area or "-"
-            description = asset.description or "-"
-
-            add_table_row(inventory_table, [
-                str(idx),
-                asset.kind,
-                description,
-                qty,
-                value,
-            ], template_row_idx=0)
+    Returns:
+        Файловый объект с DOCX (позиция в начале); закрыть после использования
+    """
+    from bankrot_bot.database import get_session
 
-    # Считаем итоговую стоимость
-    total = calculate_assets_total(assets)
+    async with get_session() as session:
+        data = await load_inventory_data(session, case_id)
 
-    # Заполняем итоги
-    for table in doc.tables:
-        result = find_cell_with_text(table, "Итого") or find_cell_with_text(table, "Общая стоимость")
-        if result:
-            row_idx, col_idx, cell = result
-            # Записываем сумму в следующую ячейку
-            if col_idx + 1 < len(table.rows[row_idx].cells):
-                total_str = f"{float(total):.2f}"
-                set_cell_text(table.rows[row_idx].cells[col_idx + 1], total_str)
-
-    # Сохраняем в память
-    output = io.BytesIO()
-    doc.save(output)
-    output.seek(0)
-    return output.read()
+    # Один проход сохранения в spooled-файл, без копий в bytes
+    return save_document(build_inventory(*data))
@@ -0,0 +1,300 @@
+"""
+Инкрементальный повторный рендер заявления.
+
+Обычно пользователь правит одно поле карточки и сразу перегенерирует
+документ. Вместо полного рендера шаблона запоминаем последний документ по
+делу (LRU) вместе с контекстом и при следующем вызове заново рендерим только
+параграфы, в которых стоят изменившиеся плейсхолдеры; остальной XML
+документа переиспользуется как есть.
+
+Карта плейсхолдер -> параграфы (номер <w:p> в порядке обхода тела документа)
+строится один раз на шаблон из того же XML после patch_xml, что компилирует
+Jinja, и одинакова для всех дел; в кэше по делу лежат DOCX и контекст.
+Параграф списочного плейсхолдера (PARAGRAPH_LIST_PLACEHOLDERS) в документе
+занимает столько параграфов, сколько элементов было в списке, — номера
+последующих параграфов сдвигаются на эту разницу.
+
+Полный рендер выполняется, если:
+- дела нет в кэше или шаблон изменился (mtime);
+- шаблон не подходит для точечной правки (управляющие теги {% %}, кроме
+  циклов списочных плейсхолдеров, плейсхолдеры в колонтитулах/свойствах,
+  картинки в параграфе с плейсхолдером);
+- значение содержит \\a или \\f (docxtpl превращает их в новые параграфы,
+  и номера параграфов сдвигаются) или список пуст.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Hashable, Optional
+
+from docx import Document
+from docxtpl import DocxTemplate
+from jinja2 import Template, TemplateError, meta
+from lxml import etree
+
+from bankrot_bot.services.docx_jinja import (
+    _BODY_PART,
+    _SOURCE,
+    JINJA_ENV,
+    LIST_ITEM,
+    PETITION_TEMPLATE,
+    check_context,
+    render_petition_jinja,
+    render_petition_legacy,
+)
+from bankrot_bot.services.docx_output import RenderedDocument, spooled_file
+
+logger = logging.getLogger(__name__)
+
+_DOCUMENT_PART = "word/document.xml"
+_W_P = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p"
+# значения, после которых docxtpl создаёт новые параграфы
+_PARAGRAPH_BREAKS = ("\a", "\f")
+_XMLNS = re.compile(r'\s+xmlns(?::\w+)?="[^"]*"')
+_LIST_LOOP = re.compile(r"\{% for " + LIST_ITEM + r" in (\w+) %\}")
+_END_LOOP = "{% endfor %}"
+
+
+@dataclass(frozen=True)
+class _ParagraphPlan:
+    """Карта плейсхолдеров шаблона на параграфы тела документа."""
+
+    mtime: float
+    # None — шаблон правится только полным рендером
+    paragraphs: Optional[dict[int, Template]]
+    by_placeholder: dict[str, tuple[int, ...]]
+    # номер параграфа -> списочный плейсхолдер, который его повторяет
+    lists: dict[int, str] = field(default_factory=dict)
+    # декларации пространств имён корня документа: параграф парсится внутри
+    # обёртки с ними, чтобы после вставки не тащить свои xmlns
+    namespaces: str = ""
+
+
+@dataclass
+class _CachedRender:
+    template: str
+    mtime: float
+    context: dict[str, Any]
+    docx: bytes
+
+
+_PLANS: dict[str, _ParagraphPlan] = {}
+_CACHE: "OrderedDict[Hashable, _CachedRender]" = OrderedDict()
+_LOCK = threading.Lock()
+# PETITION_RENDER_CACHE_SIZE из load_settings() (init_render_cache)
+_cache_size = 32
+
+
+def _has_template_properties(path: str) -> bool:
+    props = Document(path).core_properties
+    return any(
+        "{{" in (getattr(props, name) or "")
+        for name in ("author", "category", "comments", "content_status", "identifier",
+                     "keywords", "language", "subject", "title", "version")
+    )
+
+
+def _build_plan(path: str, mtime: float) -> _ParagraphPlan:
+    parts = _SOURCE.parts(path)
+    body = parts[_BODY_PART]
+    disabled = _ParagraphPlan(mtime, None, {})
+
+    loops = _LIST_LOOP.findall(body)
+    if "{%" in _LIST_LOOP.sub("", body).replace(_END_LOOP, "") or body.count(_END_LOOP) != len(loops):
+        return disabled
+    if any("{{" in xml for name, xml in parts.items() if name != _BODY_PART):
+        return disabled
+    if _has_template_properties(path):
+        return disabled
+
+    paragraphs: dict[int, Template] = {}
+    by_placeholder: dict[str, list[int]] = {}
+    lists: dict[int, str] = {}
+    pending_loops = iter(loops)
+    root = etree.fromstring(body.encode("utf-8"))
+    namespaces = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in root.nsmap.items() if prefix)
+    for index, p in enumerate(root.iter(_W_P)):
+        xml = _XMLNS.sub("", etree.tostring(p, encoding="unicode", with_tail=False))
+        if "{{" not in xml:
+            continue
+        if "docPr" in xml or any(a is not p and a.tag == _W_P for a in p.iterancestors()):
+            return disabled
+        if LIST_ITEM in xml:
+            # циклы в теле идут в том же порядке, что и их параграфы
+            name = next(pending_loops, None)
+            if name is None:
+                return disabled
+            lists[index] = name
+            xml = f"{{% for {LIST_ITEM} in {lists[index]} %}}{xml}{_END_LOOP}"
+        try:
+            names = meta.find_undeclared_variables(JINJA_ENV.parse(xml))
+            paragraphs[index] = JINJA_ENV.from_string(xml)
+        except TemplateError as e:
+            logger.info(f"Incremental render disabled for {path}: {e}")
+            return disabled
+        for name in names:
+            by_placeholder.setdefault(name, []).append(index)
+
+    return _ParagraphPlan(mtime, paragraphs, {k: tuple(v) for k, v in by_placeholder.items()}, lists, namespaces)
+
+
+def _plan(template_path: Path) -> _ParagraphPlan:
+    key = str(template_path)
+    mtime = _SOURCE.mtime(key)
+    plan = _PLANS.get(key)
+    if plan is None or plan.mtime != mtime:
+        plan = _build_plan(key, mtime)
+        _PLANS[key] = plan
+        logger.info(
+            f"Paragraph plan {key}: "
+            + (f"{len(plan.paragraphs)} paragraphs" if plan.paragraphs is not None else "full render only")
+        )
+    return plan
+
+
+def _render_paragraph(plan: _ParagraphPlan, index: int, context: dict[str, Any]) -> list[etree._Element]:
+    # та же постобработка, что в _PrecompiledDocxTemplate._render_compiled
+    xml = plan.paragraphs[index].render(context)
+    xml = (xml
+           .replace("{_{", "{{")
+           .replace("}_}", "}}")
+           .replace("{_%", "{%")
+           .replace("%_}", "%}"))
+    xml = DocxTemplate.resolve_listing(None, xml)
+    return list(etree.fromstring(f"<w:wrap {plan.namespaces}>{xml}</w:wrap>".encode("utf-8")))
+
+
+def _rendered_count(plan: _ParagraphPlan, index: int, context: dict[str, Any]) -> int:
+    """Сколько параграфов документа дал параграф шаблона index."""
+    name = plan.lists.get(index)
+    return 1 if name is None else len(context[name])
+
+
+def _patch(entry: _CachedRender, plan: _ParagraphPlan, indexes: set[int], context: dict[str, Any]) -> bytes:
+    src = zipfile.ZipFile(io.BytesIO(entry.docx))
+    root = etree.fromstring(src.read(_DOCUMENT_PART))
+    paragraphs = list(root.iter(_W_P))
+    for index in sorted(indexes):
+        start = index + sum(_rendered_count(plan, i, entry.context) - 1 for i in plan.lists if i < index)
+        old = paragraphs[start:start + _rendered_count(plan, index, entry.context)]
+        for new in _render_paragraph(plan, index, context):
+            old[0].addprevious(new)
+        for p in old:
+            p.getparent().remove(p)
+    xml = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            dst.writestr(info, xml if info.filename == _DOCUMENT_PART else src.read(info))
+    return out.getvalue()
+
+
+def _can_reuse(context: dict[str, Any]) -> bool:
+    for value in context.values():
+        items = value if isinstance(value, list) else (value,)
+        if isinstance(value, list) and not value:
+            return False
+        if any(isinstance(v, str) and any(ch in v for ch in _PARAGRAPH_BREAKS) for v in items):
+            return False
+    return True
+
+
+def _spooled(data: bytes) -> RenderedDocument:
+    out = spooled_file()
+    out.write(data)
+    out.seek(0)
+    return out
+
+
+def _remember(cache_key: Hashable, entry: _CachedRender) -> None:
+    with _LOCK:
+        _CACHE[cache_key] = entry
+        _CACHE.move_to_end(cache_key)
+        while len(_CACHE) > _cache_size:
+            _CACHE.popitem(last=False)
+
+
+def init_render_cache(size: int) -> None:
+    """
+    Задать число дел, для которых хранится последний рендер (0 — не хранить).
+
+    Must be called during bot startup.
+    """
+    global _cache_size
+    with _LOCK:
+        _cache_size = max(size, 0)
+        while len(_CACHE) > _cache_size:
+            _CACHE.popitem(last=False)
+
+
+def forget_render(cache_key: Hashable) -> None:
+    """Убрать дело из кэша (например, после удаления дела)."""
+    with _LOCK:
+        _CACHE.pop(cache_key, None)
+
+
+def render_petition_incremental(
+    cache_key: Hashable,
+    context: dict[str, Any],
+    template_path: Path = PETITION_TEMPLATE,
+) -> RenderedDocument:
+    """
+    Отрендерить заявление, по возможности правя прошлый документ дела.
+
+    Args:
+        cache_key: Ключ дела в кэше, например (owner_user_id, case_id)
+        context: Контекст build_petition_context()
+        template_path: Шаблон
+
+    Returns:
+        Файловый объект с DOCX (позиция в начале); закрыть после использования
+
+    Raises:
+        MissingPlaceholdersError: Не для всех плейсхолдеров шаблона есть значения
+    """
+    check_context(context, template_path)
+    key = str(template_path)
+    plan = _plan(template_path)
+
+    with _LOCK:
+        entry = _CACHE.get(cache_key)
+    if (
+        entry is not None
+        and plan.paragraphs is not None
+        and entry.template == key
+        and entry.mtime == plan.mtime
+        and _can_reuse(context)
+    ):
+        changed = {name for name in plan.by_placeholder if entry.context.get(name) != context.get(name)}
+        indexes = {i for name in changed for i in plan.by_placeholder[name]}
+        try:
+            docx = _patch(entry, plan, indexes, context) if indexes else entry.docx
+        except (TemplateError, etree.XMLSyntaxError, KeyError, IndexError) as e:
+            logger.warning(f"Incremental render failed for {cache_key}, full render: {e!r}")
+        else:
+            logger.debug(f"Incremental render {cache_key}: {len(indexes)} paragraphs ({sorted(changed)})")
+            _remember(cache_key, _CachedRender(key, plan.mtime, dict(context), docx))
+            return _spooled(docx)
+
+    try:
+        rendered = render_petition_jinja(context, template_path)
+    except TemplateError as e:
+        logger.warning(f"Jinja render failed for {template_path}, falling back to python-docx: {e}")
+        forget_render(cache_key)
+        return render_petition_legacy(context, template_path)
+
+    if plan.paragraphs is not None and _can_reuse(context):
+        docx = rendered.read()
+        rendered.seek(0)
+        _remember(cache_key, _CachedRender(key, plan.mtime, dict(context), docx))
+    else:
+        forget_render(cache_key)
+    return rendered
@@ -1,35 +1,387 @@
+"""
+Заявление о банкротстве через docxtpl/Jinja.
+
+Быстрый путь вместо прежней подстановки по runs через python-docx
+(render_petition_legacy): XML шаблона один раз чистится docxtpl
+(patch_xml склеивает плейсхолдеры, разорванные Word по runs) и компилируется
+общим Jinja Environment. Скомпилированные шаблоны живут в кэше окружения
+(пересобираются при изменении mtime файла шаблона), байткод — в
+FileSystemBytecodeCache, так что новый процесс не компилирует XML заново.
+
+Контекст (плейсхолдер -> значение) строится из карточки дела одинаково для
+обоих путей: docs_builder.build_petition_context().
+"""
+from __future__ import annotations
+
+import logging
+import re
+from copy import deepcopy
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from docx import Document
+from docx.text.paragraph import Paragraph
 from docxtpl import DocxTemplate
-import io
+from jinja2 import meta
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FunctionLoader,
+    StrictUndefined,
+    Template,
+    TemplateError,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-async def generate_petition_jinja(session: AsyncSession, case_id: int):
-    # Заглушка данных дела
-    context = {
-        'court_name': 'Арбитражный суд города Москвы №5',
-        'court_address': '',
-        'debtor_full_name': 'Иванов Иван Иванович',
-        'debtor_phone_or_absent': 'не указан',
-        'debtor_inn_or_absent': 'не указан',
-        'debtor_snils_or_absent': 'не указан',
-        'debtor_address': 'г. Москва, ул. Ленина, д.1',
-        'debtor_last_name_initials': 'Иванов И.И.',
-        'debtor_birth_date': '01.01.1980',
-        'passport_series': '45 12',
-        'passport_number': '123456',
-        'passport_issued_by': 'ОВД России',
-        'passport_date': '01.01.2000',
-        'passport_code': '123-456',
-        'debtor_inn': '1234567890',
-        'debtor_snils': '123-456-789 01',
-        'ip_status_text': 'ИП не зарегистрирован',
-        'date': '17.01.2026'
-    }
-    
-    tpl = DocxTemplate('templates/petitions/bankruptcy_petition.docx')
-    tpl.render(context)
-    
-    output = io.BytesIO()
-    tpl.save(output)
-    output.seek(0)
-    return output.getvalue(), 'заявление.docx'
+from bankrot_bot.services.docx_output import RenderedDocument, save_document
+
+logger = logging.getLogger(__name__)
+
+PETITION_TEMPLATE = Path("templates/petitions/bankruptcy_petition.docx")
+
+_BODY_PART = "body"
+
+# Списочные плейсхолдеры: значение — список строк, и параграф шаблона, в
+# котором стоит только этот плейсхолдер, повторяется по разу на элемент
+# (с тем же стилем параграфа и шрифтом). Так список кредиторов — это
+# отдельные короткие параграфы, а не одна огромная строка с переносами.
+PARAGRAPH_LIST_PLACEHOLDERS = frozenset({"creditors_block"})
+LIST_ITEM = "_list_item"
+
+_PARAGRAPH_RE = re.compile(r"<w:p(?: [^>]*)?>(?:(?!<w:p[ >]).)*?</w:p>", re.DOTALL)
+_TEXT_RE = re.compile(r"<w:t(?: [^>]*)?>([^<]*)</w:t>")
+_SOLE_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def expand_list_paragraphs(xml: str) -> str:
+    """
+    Обернуть параграфы со списочным плейсхолдером в цикл Jinja.
+
+    Результат тот же, что дал бы {%p for %} docxtpl:
+    {% for _list_item in creditors_block %}<w:p>…{{ _list_item }}…</w:p>{% endfor %}
+    """
+    def wrap(m: re.Match) -> str:
+        paragraph = m.group(0)
+        sole = _SOLE_PLACEHOLDER_RE.fullmatch("".join(_TEXT_RE.findall(paragraph)).strip())
+        if not sole or sole.group(1) not in PARAGRAPH_LIST_PLACEHOLDERS:
+            return paragraph
+        name = sole.group(1)
+        item = _SOLE_PLACEHOLDER_RE.sub(
+            lambda p: f"{{{{ {LIST_ITEM} }}}}" if p.group(1) == name else p.group(0), paragraph
+        )
+        return f"{{% for {LIST_ITEM} in {name} %}}{item}{{% endfor %}}"
+
+    return _PARAGRAPH_RE.sub(wrap, xml)
+
+
+# ========== Шаблоны: общий Environment ==========
+
+class _PetitionTemplateSource:
+    """
+    Источник XML частей шаблона для Jinja loader.
+
+    Имя шаблона в окружении: "<путь к docx>#<часть>", часть — "body" или
+    rId колонтитула. XML берётся после patch_xml() docxtpl, т.е. ровно в том
+    виде, в котором его компилирует DocxTemplate.render(), плюс циклы по
+    списочным плейсхолдерам (expand_list_paragraphs).
+    """
+
+    def __init__(self) -> None:
+        self._parts: dict[str, tuple[float, dict[str, str]]] = {}
+
+    @staticmethod
+    def mtime(path: str) -> float:
+        try:
+            return Path(path).stat().st_mtime
+        except OSError:
+            return -1.0
+
+    def _extract(self, path: str) -> dict[str, str]:
+        tpl = DocxTemplate(path)
+        tpl.init_docx()
+        parts = {_BODY_PART: expand_list_paragraphs(tpl.patch_xml(tpl.get_xml()))}
+        for uri in (DocxTemplate.HEADER_URI, DocxTemplate.FOOTER_URI):
+            for rel_key, part in tpl.get_headers_footers(uri):
+                parts[rel_key] = expand_list_paragraphs(tpl.patch_xml(tpl.get_part_xml(part)))
+        return parts
+
+    def parts(self, path: str) -> dict[str, str]:
+        mtime = self.mtime(path)
+        cached = self._parts.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, self._extract(path))
+            self._parts[path] = cached
+        return cached[1]
+
+    def load(self, name: str) -> Optional[tuple[str, str, Callable[[], bool]]]:
+        path, _, part = name.rpartition("#")
+        source = self.parts(path).get(part)
+        if source is None:
+            return None
+        # та же подготовка, что в DocxTemplate.render_xml_part
+        source = re.sub(r"<w:p([ >])", r"\n<w:p\1", source)
+        mtime = self.mtime(path)
+        return source, name, lambda: self.mtime(path) == mtime
+
+
+_SOURCE = _PetitionTemplateSource()
+
+def _finalize(value: Any) -> Any:
+    # списочный плейсхолдер не в отдельном параграфе — строки через перенос
+    return "\n".join(map(str, value)) if isinstance(value, list) else value
+
+
+# Значения экранируются (autoescape) — "&", "<" в названиях кредиторов не ломают XML;
+# незаполненный плейсхолдер — ошибка (StrictUndefined), а не пустое место.
+JINJA_ENV = Environment(
+    loader=FunctionLoader(_SOURCE.load),
+    autoescape=True,
+    undefined=StrictUndefined,
+    finalize=_finalize,
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=True,
+    cache_size=50,
+)
+
+
+class _PrecompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate, который берёт скомпилированные части из JINJA_ENV."""
+
+    def __init__(self, template_path: Path) -> None:
+        self.template_key = str(template_path)
+        super().__init__(self.template_key)
+
+    def _render_compiled(self, part_name: str, part: Any, context: dict[str, Any]) -> str:
+        template: Template = JINJA_ENV.get_template(f"{self.template_key}#{part_name}")
+        self.current_rendering_part = part
+        dst_xml = template.render(context)
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (dst_xml
+                   .replace("{_{", "{{")
+                   .replace("}_}", "}}")
+                   .replace("{_%", "{%")
+                   .replace("%_}", "%}"))
+        return self.resolve_listing(dst_xml)
+
+    def build_xml(self, context: dict[str, Any], jinja_env: Optional[Environment] = None) -> str:
+        return self._render_compiled(_BODY_PART, self.docx._part, context)
+
+    def build_headers_footers_xml(self, context: dict[str, Any], uri: str, jinja_env: Optional[Environment] = None):
+        for rel_key, part in self.get_headers_footers(uri):
+            encoding = self.get_headers_footers_encoding(self.get_part_xml(part))
+            yield rel_key, self._render_compiled(rel_key, part, context).encode(encoding)
+
+
+# ========== Манифест плейсхолдеров ==========
+
+class MissingPlaceholdersError(ValueError):
+    """В контексте нет значений для плейсхолдеров шаблона."""
+
+    def __init__(self, template_path: Path, missing: list[str]) -> None:
+        super().__init__(f"Template {template_path} placeholders without values: {', '.join(missing)}")
+        self.missing = missing
+
+
+@dataclass(frozen=True)
+class TemplateManifest:
+    """Набор плейсхолдеров шаблона (включая разорванные Word по runs)."""
+
+    path: str
+    mtime: float
+    placeholders: frozenset[str]
+
+    def missing(self, context: dict[str, Any]) -> list[str]:
+        """Плейсхолдеры, для которых в контексте нет значения."""
+        return sorted(self.placeholders.difference(context))
+
+
+_MANIFESTS: dict[str, TemplateManifest] = {}
+
+
+def template_manifest(template_path: Path = PETITION_TEMPLATE) -> TemplateManifest:
+    """
+    Манифест шаблона: извлекается один раз при загрузке шаблона
+    (из того же XML после patch_xml, что компилирует Jinja) и
+    пересчитывается только при изменении файла.
+    """
+    key = str(template_path)
+    mtime = _SOURCE.mtime(key)
+    manifest = _MANIFESTS.get(key)
+    if manifest is None or manifest.mtime != mtime:
+        names: set[str] = set()
+        for source in _SOURCE.parts(key).values():
+            names |= meta.find_undeclared_variables(JINJA_ENV.parse(source))
+        manifest = TemplateManifest(key, mtime, frozenset(names))
+        _MANIFESTS[key] = manifest
+        logger.info(f"Template manifest {key}: {len(names)} placeholders")
+    return manifest
+
+
+def check_context(context: dict[str, Any], template_path: Path = PETITION_TEMPLATE) -> None:
+    """
+    Проверить контекст по манифесту до рендеринга.
+
+    Raises:
+        MissingPlaceholdersError: Не для всех плейсхолдеров шаблона есть значения
+    """
+    missing = template_manifest(template_path).missing(context)
+    if missing:
+        raise MissingPlaceholdersError(template_path, missing)
+
+
+# ========== Рендеринг ==========
+
+def render_petition_jinja(context: dict[str, Any], template_path: Path = PETITION_TEMPLATE) -> RenderedDocument:
+    """
+    Быстрый путь: отрендерить заявление скомпилированным Jinja-шаблоном.
+
+    Raises:
+        jinja2.TemplateError: Ошибка шаблона или незаполненный плейсхолдер
+    """
+    tpl = _PrecompiledDocxTemplate(template_path)
+    tpl.render(context, JINJA_ENV)
+    return save_document(tpl)
+
+
+def _set_paragraph_text_keep_style(paragraph, new_text: str) -> None:
+    """
+    Надёжная замена текста в параграфе: плейсхолдеры могут быть разорваны по runs.
+    Сохраняем стиль параграфа, но runs пересоздаём.
+    """
+    if paragraph.runs:
+        for r in paragraph.runs:
+            r.text = ""
+    paragraph.add_run(new_text)
+
+
+def _iter_paragraphs(doc: Document):
+    """Параграфы документа, включая ячейки таблиц (и вложенных таблиц)."""
+    yield from doc.paragraphs
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                yield from cell.paragraphs
+                for nested in cell.tables:
+                    for nrow in nested.rows:
+                        for ncell in nrow.cells:
+                            yield from ncell.paragraphs
+
+
+def _legacy_value(value: Any) -> str:
+    if value is None:
+        return ""
+    return "\n".join(map(str, value)) if isinstance(value, list) else str(value)
+
+
+def _expand_list_paragraphs_legacy(doc: Document, context: dict[str, Any]) -> None:
+    """Списочные плейсхолдеры: копия параграфа на каждый элемент списка."""
+    for p in list(_iter_paragraphs(doc)):
+        sole = _SOLE_PLACEHOLDER_RE.fullmatch(p.text.strip())
+        if not sole or not isinstance(context.get(sole.group(1)), list):
+            continue
+        for item in context[sole.group(1)]:
+            clone = Paragraph(deepcopy(p._p), p._parent)
+            _set_paragraph_text_keep_style(clone, str(item))
+            p._p.addprevious(clone._p)
+        p._p.getparent().remove(p._p)
+
+
+def render_petition_legacy(context: dict[str, Any], template_path: Path = PETITION_TEMPLATE) -> RenderedDocument:
+    """
+    Прежний путь: подстановка {{key}} по тексту параграфов через python-docx.
+
+    Оставлен как запасной вариант для шаблонов, которые Jinja не компилирует,
+    и как эталон в тестах эквивалентности.
+
+    Raises:
+        ValueError: Если в документе остались незаменённые плейсхолдеры
+    """
+    doc = Document(str(template_path))
+    _expand_list_paragraphs_legacy(doc, context)
+
+    def replace(text: str) -> str:
+        for k, v in context.items():
+            placeholder = f"{{{{{k}}}}}"
+            if placeholder in text:
+                text = text.replace(placeholder, _legacy_value(v))
+        return text
+
+    paragraphs = list(_iter_paragraphs(doc))
+    for p in paragraphs:
+        text = p.text
+        if text and "{{" in text:
+            new_text = replace(text)
+            if new_text != text:
+                _set_paragraph_text_keep_style(p, new_text)
+
+    # второй проход — добиваем плейсхолдеры, разорванные Word по runs
+    for p in paragraphs:
+        for run in p.runs:
+            if "{{" in run.text:
+                run.text = replace(run.text)
+
+    left = sorted({m for p in paragraphs for m in re.findall(r"\{\{[^}]+\}\}", p.text or "")})
+    if left:
+        logger.error("UNREPLACED_PLACEHOLDERS: %s", left)
+        raise ValueError("В документе остались не заменённые плейсхолдеры вида {{...}}")
+
+    return save_document(doc)
+
+
+def render_petition(context: dict[str, Any], template_path: Path = PETITION_TEMPLATE) -> RenderedDocument:
+    """
+    Отрендерить заявление: Jinja-шаблон, при ошибке шаблона — прежний путь.
+
+    Контекст сначала сверяется с манифестом шаблона — при нехватке значений
+    рендеринг не начинается.
+
+    Returns:
+        Файловый объект с DOCX (позиция в начале); закрыть после использования
+
+    Raises:
+        MissingPlaceholdersError: Не для всех плейсхолдеров шаблона есть значения
+    """
+    check_context(context, template_path)
+    try:
+        return render_petition_jinja(context, template_path)
+    except TemplateError as e:
+        logger.warning(f"Jinja render failed for {template_path}, falling back to python-docx: {e}")
+        return render_petition_legacy(context, template_path)
+
+
+async def generate_petition_jinja(
+    session: AsyncSession,
+    case_id: int,
+    owner_user_id: int,
+) -> tuple[RenderedDocument, str]:
+    """
+    Сгенерировать заявление по данным дела.
+
+    Карточка и реквизиты дела — из cases_db, кредиторы — из case_parties
+    (если они заведены), иначе из карточки.
+
+    Returns:
+        (файловый объект с DOCX, имя файла)
+
+    Raises:
+        ValueError: Дело не найдено
+    """
+    from bankrot_bot.services.case_financials import format_parties_for_doc, get_case_parties
+    from bankrot_bot.services.cases_db import get_case, get_case_card
+    from bankrot_bot.services.docs_builder import build_petition_context
+    from bankrot_bot.services.docx_incremental import render_petition_incremental
+
+    case_row = get_case(owner_user_id, case_id)
+    if not case_row:
+        raise ValueError(f"Case {case_id} not found")
+    card = get_case_card(owner_user_id, case_id)
+
+    parties = await get_case_parties(session, case_id, role="creditor")
+    creditors_from_db = format_parties_for_doc(parties, role="creditor") if parties else None
 
+    now = datetime.now()
+    context = build_petition_context(case_row, card, creditors_from_db, now=now)
+    fname = f"bankruptcy_petition_case_{case_id}_{now.strftime('%Y%m%d_%H%M%S')}.docx"
+    return render_petition_incremental((owner_user_id, case_id), context), fname
@@ -0,0 +1,103 @@
+"""
+Вывод сгенерированных DOCX без двойной буферизации.
+
+Раньше генераторы сохраняли документ в BytesIO, копировали его в bytes
+(output.read()/getvalue()), а BufferedInputFile держал ещё одну копию.
+Теперь документ пишется один раз в SpooledTemporaryFile: небольшие файлы
+остаются в памяти, большие (> DOCX_SPOOL_THRESHOLD_KB) уходят во временный
+файл на диске. Дальше этот файловый объект читается кусками — либо
+хранилищем (save_stream), либо aiogram при отправке (DocumentInputFile).
+"""
+from __future__ import annotations
+
+import hashlib
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import IO, Any, AsyncGenerator, Union
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+RenderedDocument = IO[bytes]
+
+# DOCX_SPOOL_THRESHOLD_KB из load_settings() (init_docx_output)
+_spool_threshold = 1024 * 1024
+
+
+def init_docx_output(spool_threshold_kb: int) -> None:
+    """
+    Задать порог, после которого документ уходит из памяти во временный файл.
+
+    Must be called during bot startup (и в каждом воркере пула рендеринга).
+    """
+    global _spool_threshold
+    _spool_threshold = spool_threshold_kb * 1024
+
+
+def spooled_file() -> RenderedDocument:
+    """Пустой spooled-файл с порогом DOCX_SPOOL_THRESHOLD_KB."""
+    return tempfile.SpooledTemporaryFile(max_size=_spool_threshold)
+
+
+def save_document(doc: Any) -> RenderedDocument:
+    """
+    Сохранить python-docx Document (или DocxTemplate) в spooled-файл.
+
+    Returns:
+        Файловый объект, позиционированный на начало. Вызывающий закрывает его
+        (with ... as out:), после чего временный файл удаляется.
+    """
+    out = spooled_file()
+    doc.save(out)
+    out.seek(0)
+    return out
+
+
+def document_content_key(src: Union[Path, str, IO[bytes]]) -> str:
+    """
+    Ключ содержимого документа (путь или файловый объект).
+
+    DOCX — zip-архив, и python-docx пишет в него время сохранения, поэтому
+    два одинаковых рендера побайтно различаются только метками времени zip.
+    Для zip сравниваем имена, CRC и размеры записей из центрального каталога
+    (без распаковки); для остальных файлов — sha256 всего содержимого.
+    Позиция файлового объекта не сохраняется.
+    """
+    try:
+        with zipfile.ZipFile(src) as zf:
+            h = hashlib.sha256(b"zip:")
+            for info in sorted(zf.infolist(), key=lambda i: i.filename):
+                h.update(f"{info.filename}\0{info.CRC}\0{info.file_size}\n".encode())
+            return h.hexdigest()
+    except zipfile.BadZipFile:
+        pass
+
+    h = hashlib.sha256(b"raw:")
+    f = open(src, "rb") if isinstance(src, (str, Path)) else src
+    try:
+        f.seek(0)
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    finally:
+        if f is not src:
+            f.close()
+    return h.hexdigest()
+
+
+class DocumentInputFile(InputFile):
+    """
+    InputFile для aiogram поверх отрендеренного документа.
+
+    Читает файловый объект кусками по chunk_size, без копирования
+    всего содержимого в bytes.
+    """
+
+    def __init__(self, fileobj: RenderedDocument, filename: str, chunk_size: int = 64 * 1024) -> None:
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.fileobj = fileobj
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.fileobj.seek(0)
+        while chunk := self.fileobj.read(self.chunk_size):
+            yield chunk
@@ -0,0 +1,154 @@
+"""
+Хранилище FSM в Redis.
+
+RedisStorage создаётся поверх общего пула соединений (REDIS_POOL_SIZE) со
+сроком жизни ключей состояния и данных (FSM_STATE_TTL_SEC / FSM_DATA_TTL_SEC).
+Тот же клиент (storage.redis) используют GigaChat и ResultStore.
+
+set_state_data() записывает состояние и данные одним pipelined вызовом
+(MULTI/EXEC) вместо отдельных set_state()/update_data(): update_data — это
+ещё и get_data, то есть два запроса к Redis.
+
+CachedRedisStorage держит в процессе короткоживущий (FSM_CACHE_TTL_SEC)
+read-through кэш состояния и данных: middleware aiogram читает состояние на
+каждом апдейте, хэндлеры — ещё раз, и повторные чтения не ходят в Redis.
+Записи идут в Redis и сразу в кэш (write-through). Корректно, пока апдейты
+одного пользователя обрабатывает один процесс (polling или sticky-маршрутизация
+по user_id); иначе чужая запись видна не раньше, чем через TTL кэша.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import ConnectionPool, Redis
+
+from bankrot_bot.metrics import Counter
+
+StateType = Optional[Union[str, State]]
+
+REDIS_CALLS = Counter("fsm_redis_calls_total", "FSM storage round trips to Redis by operation", ("op",))
+CACHE_HITS = Counter("fsm_cache_hits_total", "FSM reads served from the in-process cache", ("part",))
+
+
+class CachedRedisStorage(RedisStorage):
+    """RedisStorage с in-process read-through / write-through кэшем."""
+
+    def __init__(self, redis: Redis, *, cache_ttl: float = 5.0, cache_size: int = 10_000, **kwargs: Any) -> None:
+        super().__init__(redis, **kwargs)
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        # (key, "state"|"data") -> (expires_at, state или JSON данных)
+        self._cache: OrderedDict[tuple[StorageKey, str], tuple[float, Optional[str]]] = OrderedDict()
+
+    def _cached(self, key: StorageKey, part: str) -> tuple[bool, Optional[str]]:
+        entry = self._cache.get((key, part))
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self._cache[(key, part)]
+            return False, None
+        # LRU: прочитанная запись вытесняется последней
+        self._cache.move_to_end((key, part))
+        CACHE_HITS.inc(part=part)
+        return True, entry[1]
+
+    def _remember(self, key: StorageKey, part: str, value: Optional[str]) -> None:
+        if self.cache_ttl <= 0:
+            return
+        self._cache[(key, part)] = (time.monotonic() + self.cache_ttl, value)
+        self._cache.move_to_end((key, part))
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def remember_written(self, key: StorageKey, state: StateType, data: dict[str, Any]) -> None:
+        """Обновить кэш после записи в обход set_state/set_data (set_state_data)."""
+        self._remember(key, "state", state.state if isinstance(state, State) else state)
+        self._remember(key, "data", self.json_dumps(data) if data else None)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        hit, value = self._cached(key, "state")
+        if hit:
+            return value
+        REDIS_CALLS.inc(op="get_state")
+        value = await super().get_state(key)
+        self._remember(key, "state", value)
+        return value
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        REDIS_CALLS.inc(op="set_state")
+        await super().set_state(key, state)
+        self._remember(key, "state", state.state if isinstance(state, State) else state)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        hit, raw = self._cached(key, "data")
+        if not hit:
+            REDIS_CALLS.inc(op="get_data")
+            value = await self.redis.get(self.key_builder.build(key, "data"))
+            raw = value.decode("utf-8") if isinstance(value, bytes) else value
+            self._remember(key, "data", raw)
+        # каждый вызов получает свою копию, как при чтении из Redis
+        return self.json_loads(raw) if raw else {}
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        REDIS_CALLS.inc(op="set_data")
+        await super().set_data(key, data)
+        self._remember(key, "data", self.json_dumps(data) if data else None)
+
+
+def create_fsm_storage(settings: dict[str, Any]) -> RedisStorage:
+    """RedisStorage по load_settings(): пул соединений, TTL ключей, кэш в процессе."""
+    pool = ConnectionPool.from_url(
+        settings["REDIS_URL"],
+        max_connections=settings["REDIS_POOL_SIZE"],
+        socket_keepalive=True,
+        health_check_interval=30,
+    )
+    return CachedRedisStorage(
+        Redis(connection_pool=pool),
+        cache_ttl=settings["FSM_CACHE_TTL_SEC"],
+        state_ttl=settings["FSM_STATE_TTL_SEC"] or None,
+        data_ttl=settings["FSM_DATA_TTL_SEC"] or None,
+    )
+
+
+async def set_state_data(state: FSMContext, new_state: StateType, data: dict[str, Any]) -> None:
+    """
+    Заменить состояние и данные FSM за один запрос к Redis.
+
+    Семантика как у state.set_state(new_state) + state.set_data(data):
+    None-состояние и пустые данные удаляют ключи. Для других хранилищ
+    (MemoryStorage в тестах) — обычные вызовы.
+
+    Args:
+        state: FSMContext хэндлера
+        new_state: Новое состояние (State, строка или None)
+        data: Полные данные (не дополнение — сначала объедините с get_data())
+    """
+    storage = state.storage
+    if not isinstance(storage, RedisStorage):
+        await state.set_state(new_state)
+        await state.set_data(data)
+        return
+
+    state_key = storage.key_builder.build(state.key, "state")
+    data_key = storage.key_builder.build(state.key, "data")
+    async with storage.redis.pipeline(transaction=True) as pipe:
+        if new_state is None:
+            pipe.delete(state_key)
+        else:
+            value = new_state.state if isinstance(new_state, State) else new_state
+            pipe.set(state_key, value, ex=storage.state_ttl)
+        if data:
+            pipe.set(data_key, storage.json_dumps(data), ex=storage.data_ttl)
+        else:
+            pipe.delete(data_key)
+        await pipe.execute()
+    REDIS_CALLS.inc(op="set_state_data")
+    if isinstance(storage, CachedRedisStorage):
+        storage.remember_written(state.key, new_state, data)
@@ -1,57 +1,685 @@
+"""
+Клиент GigaChat.
+
+Одна долгоживущая aiohttp.ClientSession на процесс (GigaChatClient):
+создаётся при старте бота (init_gigachat), закрывается при остановке
+(shutdown_gigachat). Соединения с OAuth и API переиспользуются через
+TCPConnector с keepalive и кэшем DNS, поэтому запрос не платит за DNS,
+TCP и TLS-рукопожатие каждый раз.
+
+OAuth-токен ведёт TokenManager: фоновое обновление до истечения,
+single-flight обновление по 401 и общий токен в Redis для нескольких
+процессов бота. Готовые ответы кэшируются в Redis (ResponseCache).
+
+Запросы к API ограничены семафором с таймаутом ожидания в очереди,
+повторяются с экспоненциальной паузой (и Retry-After) при 429/5xx и сетевых
+ошибках и проходят через CircuitBreaker: после серии неудач запросы сразу
+завершаются GigaChatUnavailable с понятным пользователю текстом.
+"""
 import asyncio
+import contextlib
+import hashlib
 import json
+import logging
+import random
 import time
 import uuid
-from typing import Optional
+from typing import Any, AsyncIterator, Callable, Optional
 
 import aiohttp
 
+from bankrot_bot.metrics import Counter, Gauge
 
-_GC_TOKEN: Optional[str] = None
-_GC_TOKEN_EXPIRES_AT: float = 0.0
-_GC_TOKEN_LOCK = asyncio.Lock()
+logger = logging.getLogger(__name__)
 
+OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+CHAT_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
 
-async def get_access_token(
-    session: aiohttp.ClientSession,
-    *,
-    auth_key: str,
-    scope: str,
-    force_refresh: bool = False,
-) -> str:
-    global _GC_TOKEN, _GC_TOKEN_EXPIRES_AT
-    now = time.time()
+# токен обновляется заранее, за столько секунд до истечения
+TOKEN_REFRESH_AHEAD = 300.0
+# пауза перед повтором после неудачного обновления в фоне
+TOKEN_RETRY_DELAY = 10.0
+# фоновое обновление не чаще этого, даже если refresh_ahead больше срока токена
+TOKEN_MIN_REFRESH_DELAY = 5.0
+_REDIS_TOKEN_PREFIX = "gigachat:token:"
+_REDIS_RESPONSE_PREFIX = "gigachat:resp:"
+
+# ответы, после которых запрос повторяется
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# отказ в доступе (в т.ч. 401 после обновления токена) — сбой для размыкателя
+AUTH_FAILURE_STATUSES = frozenset({401, 403})
+RETRY_BASE_DELAY = 1.0
+# Retry-After больше этого не ждём — запрос завершается ошибкой
+RETRY_MAX_DELAY = 30.0
+
+REQUESTS = Counter(
+    "gigachat_requests_total",
+    "GigaChat API requests by outcome (ok, error, queue_timeout, circuit_open)",
+    ("outcome",),
+)
+RETRIES = Counter("gigachat_retries_total", "GigaChat API retries by reason", ("reason",))
+IN_FLIGHT = Gauge("gigachat_requests_in_flight", "GigaChat API requests holding a concurrency slot")
+QUEUED = Gauge("gigachat_requests_queued", "GigaChat API requests waiting for a concurrency slot")
+CIRCUIT_STATE = Gauge("gigachat_circuit_state", "1 for the current circuit breaker state", ("state",))
+CIRCUIT_TRANSITIONS = Counter(
+    "gigachat_circuit_transitions_total", "Circuit breaker transitions by target state", ("state",)
+)
+
+
+class GigaChatUnavailable(RuntimeError):
+    """GigaChat недоступен или перегружен; текст можно показать пользователю."""
+
+
+class TokenFetchError(RuntimeError):
+    """OAuth ответил не 200; status и Retry-After — для решения о повторе."""
+
+    def __init__(self, status: int, text: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"OAuth HTTP {status}: {text}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после failure_threshold неудачных запросов подряд (open)
+    запросы отклоняются сразу; через reset_timeout один пробный запрос
+    (half_open) решает, замкнуть цепь или снова разомкнуть.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        # время запуска пробного запроса; пробный запрос, не вернувший
+        # результата (отмена, таймаут очереди), через reset_timeout заменяется новым
+        self._probe_at = 0.0
+        self.state = self.CLOSED
+        for state in (self.CLOSED, self.OPEN, self.HALF_OPEN):
+            CIRCUIT_STATE.set(1 if state == self.state else 0, state=state)
+
+    def _move(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"GigaChat circuit {self.state} -> {state}")
+        CIRCUIT_STATE.set(0, state=self.state)
+        CIRCUIT_STATE.set(1, state=state)
+        CIRCUIT_TRANSITIONS.inc(state=state)
+        self.state = state
+
+    def check(self) -> None:
+        """Пропустить запрос или сразу отклонить (GigaChatUnavailable)."""
+        if self.state == self.OPEN:
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                REQUESTS.inc(outcome="circuit_open")
+                raise GigaChatUnavailable(
+                    f"GigaChat временно недоступен. Попробуйте через {int(wait) + 1} сек."
+                )
+            self._move(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            now = time.monotonic()
+            if now - self._probe_at < self.reset_timeout:
+                REQUESTS.inc(outcome="circuit_open")
+                raise GigaChatUnavailable("GigaChat восстанавливается. Попробуйте чуть позже.")
+            self._probe_at = now
+
+    def success(self) -> None:
+        self.failures = 0
+        self._probe_at = 0.0
+        self._move(self.CLOSED)
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probe_at = 0.0
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._move(self.OPEN)
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _parse_expiry(data: dict[str, Any]) -> float:
+    if "expires_in" in data:
+        return time.time() + int(data["expires_in"])
+    if "expires_at" in data:
+        raw = int(data["expires_at"])
+        return (raw / 1000) if raw > 10_000_000_000 else float(raw)
+    return time.time() + 1800
 
-    async with _GC_TOKEN_LOCK:
-        if (not force_refresh) and _GC_TOKEN and now < _GC_TOKEN_EXPIRES_AT:
-            return _GC_TOKEN
 
-        url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+class TokenManager:
+    """
+    OAuth-токен GigaChat.
+
+    - Чтение (get) не ждёт блокировок, пока токен действителен.
+    - Фоновая задача (run_refresher) обновляет токен за refresh_ahead секунд
+      до истечения, так что запросы пользователей OAuth не ждут. Упреждение
+      не больше половины срока жизни токена: слишком большой
+      GIGACHAT_TOKEN_REFRESH_AHEAD_SEC не превращается в непрерывные запросы к OAuth.
+    - Обновление single-flight: одновременные вызовы (в т.ч. после 401)
+      ждут одну и ту же задачу.
+    - С Redis токен общий для всех процессов бота: сначала берётся из Redis,
+      а за OAuth ходит только процесс, взявший блокировку.
+    """
+
+    def __init__(
+        self,
+        *,
+        auth_key: str,
+        scope: str,
+        session_factory: Callable[[], aiohttp.ClientSession],
+        redis: Optional[Any] = None,
+        refresh_ahead: float = TOKEN_REFRESH_AHEAD,
+    ) -> None:
+        self.auth_key = auth_key
+        self.scope = scope
+        self._session_factory = session_factory
+        self.redis = redis
+        self.refresh_ahead = refresh_ahead
+        self.token: Optional[str] = None
+        self.expires_at: float = 0.0
+        # срок жизни токена, выданного OAuth (известен после первого _fetch)
+        self._lifetime: Optional[float] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        digest = hashlib.sha256(f"{auth_key}:{scope}".encode()).hexdigest()[:16]
+        self._redis_key = f"{_REDIS_TOKEN_PREFIX}{digest}"
+
+    @property
+    def ahead(self) -> float:
+        """Упреждение обновления: refresh_ahead, но не больше половины срока жизни токена."""
+        if self._lifetime is None:
+            return self.refresh_ahead
+        return min(self.refresh_ahead, self._lifetime / 2)
+
+    def valid(self, margin: float = 30.0) -> bool:
+        return self.token is not None and time.time() < self.expires_at - margin
+
+    async def get(self) -> str:
+        """Действующий токен; обновляет только если его нет или он истёк."""
+        if self.valid():
+            return self.token
+        return await self.refresh()
+
+    async def refresh(self, stale: Optional[str] = None) -> str:
+        """
+        Обновить токен (single-flight).
+
+        stale: токен, получивший 401; если его уже заменили — вернуть новый.
+        """
+        if stale is not None and self.token != stale and self.valid():
+            return self.token
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh(stale))
+        # shield: отмена одного ожидающего запроса не отменяет общее обновление
+        return await asyncio.shield(self._refreshing)
+
+    async def _refresh(self, stale: Optional[str]) -> str:
+        if self.redis is None:
+            return self._adopt(*await self._fetch())
+
+        shared = await self._read_shared()
+        if shared and shared[0] != stale and shared[1] - time.time() > self.ahead:
+            return self._adopt(*shared)
+
+        lock = self.redis.lock(f"{self._redis_key}:lock", timeout=60, blocking_timeout=45)
+        if await lock.acquire():
+            try:
+                # пока ждали блокировку, токен мог обновить другой процесс
+                shared = await self._read_shared()
+                if shared and shared[0] != stale and shared[1] - time.time() > self.ahead:
+                    return self._adopt(*shared)
+                token, expires_at = await self._fetch()
+                ttl = int(expires_at - time.time())
+                if ttl > 0:
+                    await self.redis.set(
+                        self._redis_key, json.dumps({"token": token, "expires_at": expires_at}), ex=ttl
+                    )
+                return self._adopt(token, expires_at)
+            finally:
+                try:
+                    await lock.release()
+                except Exception as e:  # блокировка истекла сама — не ошибка обновления
+                    logger.debug(f"GigaChat token lock release: {e!r}")
+
+        # блокировку не дождались — обновляем сами, без записи в Redis
+        logger.warning("GigaChat token lock wait timed out, refreshing locally")
+        return self._adopt(*await self._fetch())
+
+    async def _read_shared(self) -> Optional[tuple[str, float]]:
+        try:
+            raw = await self.redis.get(self._redis_key)
+        except Exception as e:
+            logger.warning(f"GigaChat token: Redis read failed: {e!r}")
+            return None
+        if not raw:
+            return None
+        data = json.loads(raw)
+        return data["token"], float(data["expires_at"])
+
+    def _adopt(self, token: str, expires_at: float) -> str:
+        self.token, self.expires_at = token, expires_at
+        return token
+
+    async def _fetch(self) -> tuple[str, float]:
         headers = {
-            "Authorization": f"Basic {auth_key}",
+            "Authorization": f"Basic {self.auth_key}",
             "RqUID": str(uuid.uuid4()),
             "Content-Type": "application/x-www-form-urlencoded",
         }
-
-        async with session.post(url, headers=headers, data={"scope": scope}, timeout=30) as r:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with self._session_factory().post(
+            OAUTH_URL, headers=headers, data={"scope": self.scope}, timeout=timeout
+        ) as r:
             text = await r.text()
             if r.status != 200:
-                raise RuntimeError(text)
-
+                raise TokenFetchError(r.status, text, _retry_after(r.headers))
         data = json.loads(text)
-        token = data["access_token"]
+        expires_at = _parse_expiry(data)
+        self._lifetime = max(expires_at - time.time(), 0.0)
+        logger.info("GigaChat token refreshed")
+        return data["access_token"], expires_at
+
+    async def run_refresher(self) -> None:
+        """Фоновое обновление токена заранее (запускается клиентом при старте)."""
+        while True:
+            if self.token is not None:
+                delay = self.expires_at - self.ahead - time.time()
+                await asyncio.sleep(max(delay, TOKEN_MIN_REFRESH_DELAY))
+            try:
+                await self.refresh(stale=self.token)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"GigaChat token background refresh failed: {e!r}")
+                await asyncio.sleep(TOKEN_RETRY_DELAY)
+
+
+class ResponseCache:
+    """
+    Кэш ответов модели в Redis.
+
+    Ключ — sha256 от (model, system_prompt, user_text, temperature): повтор
+    того же запроса (например, после сетевой ошибки) возвращает прошлый ответ
+    сразу. Ошибки Redis не мешают запросу — кэш просто пропускается.
+    """
+
+    def __init__(self, redis: Any, ttl: int) -> None:
+        self.redis = redis
+        self.ttl = ttl
+
+    @staticmethod
+    def key(model: str, system_prompt: str, user_text: str, temperature: float) -> str:
+        raw = json.dumps([model, system_prompt, user_text, temperature], ensure_ascii=False)
+        return _REDIS_RESPONSE_PREFIX + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"GigaChat cache: Redis read failed: {e!r}")
+            return None
+        if raw is None:
+            return None
+        return raw.decode("utf-8") if isinstance(raw, bytes) else raw
+
+    async def set(self, key: str, text: str) -> None:
+        try:
+            await self.redis.set(key, text, ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"GigaChat cache: Redis write failed: {e!r}")
+
+
+class GigaChatClient:
+    """Долгоживущий клиент GigaChat с общим пулом соединений."""
 
-        if "expires_in" in data:
-            exp = time.time() + int(data["expires_in"])
-        elif "expires_at" in data:
-            raw = int(data["expires_at"])
-            exp = (raw / 1000) if raw > 10_000_000_000 else raw
-        else:
-            exp = time.time() + 1800
+    def __init__(
+        self,
+        *,
+        auth_key: str,
+        scope: str,
+        model: str,
+        limit: int = 20,
+        limit_per_host: int = 10,
+        keepalive_timeout: float = 60.0,
+        dns_ttl: int = 300,
+        timeout: float = 90.0,
+        redis: Optional[Any] = None,
+        refresh_ahead: float = TOKEN_REFRESH_AHEAD,
+        cache: Optional[ResponseCache] = None,
+        max_concurrent: int = 10,
+        queue_timeout: float = 15.0,
+        max_retries: int = 3,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.auth_key = auth_key
+        self.scope = scope
+        self.model = model
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.tokens = TokenManager(
+            auth_key=auth_key,
+            scope=scope,
+            session_factory=lambda: self.session,
+            redis=redis,
+            refresh_ahead=refresh_ahead,
+        )
+        self._refresher: Optional[asyncio.Task] = None
+        self.cache = cache
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._slots: Optional[asyncio.Semaphore] = None
 
-        _GC_TOKEN = token
-        _GC_TOKEN_EXPIRES_AT = float(exp) - 30
-        return _GC_TOKEN
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Сессия (создаётся при первом обращении внутри event loop)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def start(self) -> None:
+        """Открыть сессию и запустить фоновое обновление токена (при старте бота)."""
+        _ = self.session
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self.tokens.run_refresher())
+
+    async def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _payload(
+        self, system_prompt: str, user_text: str, model: Optional[str], temperature: float, stream: bool
+    ) -> dict[str, Any]:
+        payload = {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_text},
+            ],
+            "temperature": temperature,
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _cache_key(
+        self, system_prompt: str, user_text: str, model: Optional[str], temperature: float
+    ) -> Optional[str]:
+        if self.cache is None:
+            return None
+        return ResponseCache.key(model or self.model, system_prompt, user_text, temperature)
+
+    async def _post_once(self, payload: dict[str, Any]) -> aiohttp.ClientResponse:
+        """POST в API с токеном; при 401 — один повтор с обновлённым токеном."""
+
+        async def _call(tkn: str) -> aiohttp.ClientResponse:
+            headers = {"Authorization": f"Bearer {tkn}", "Content-Type": "application/json"}
+            if payload.get("stream"):
+                headers["Accept"] = "text/event-stream"
+                # общий таймаут не ограничивает длинный ответ — только паузы между фрагментами
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=self.timeout)
+                return await self.session.post(CHAT_URL, headers=headers, json=payload, timeout=timeout)
+            return await self.session.post(CHAT_URL, headers=headers, json=payload)
+
+        token = await self.tokens.get()
+        r = await _call(token)
+        if r.status == 401:
+            await r.release()
+            r = await _call(await self.tokens.refresh(stale=token))
+        return r
+
+    async def _post(self, payload: dict[str, Any]) -> aiohttp.ClientResponse:
+        """
+        POST с повторами: 429/5xx и сетевые ошибки повторяются до max_retries
+        раз с паузой Retry-After или base * 2**attempt со случайным разбросом.
+
+        Успехом для размыкателя считается только 2xx; 401/403 — сбой, прочие
+        4xx (ошибка самого запроса) размыкатель не трогают. Ошибки OAuth
+        (TokenFetchError) обрабатываются по тем же кодам.
+
+        Raises:
+            GigaChatUnavailable: Повторы исчерпаны
+            RuntimeError: Ответ не 2xx, который повторять бессмысленно
+            TokenFetchError: OAuth ответил кодом, который повторять бессмысленно
+        """
+        attempt = 0
+        while True:
+            delay: Optional[float] = None
+            try:
+                r = await self._post_once(payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error: BaseException = e
+                reason = "network"
+            except TokenFetchError as e:
+                if e.status not in RETRY_STATUSES:
+                    if e.status in AUTH_FAILURE_STATUSES:
+                        self.breaker.failure()
+                    REQUESTS.inc(outcome="error")
+                    raise
+                error = e
+                reason = f"oauth_{e.status}"
+                delay = e.retry_after
+            else:
+                if 200 <= r.status < 300:
+                    self.breaker.success()
+                    return r
+                if r.status not in RETRY_STATUSES:
+                    text = await r.text()
+                    await r.release()
+                    if r.status in AUTH_FAILURE_STATUSES:
+                        self.breaker.failure()
+                    REQUESTS.inc(outcome="error")
+                    raise RuntimeError(f"HTTP {r.status}: {text}")
+                error = RuntimeError(f"HTTP {r.status}: {await r.text()}")
+                reason = str(r.status)
+                delay = _retry_after(r.headers)
+                await r.release()
+
+            if delay is None:
+                delay = random.uniform(0, RETRY_BASE_DELAY * 2 ** attempt)
+            if attempt >= self.max_retries or delay > RETRY_MAX_DELAY:
+                self.breaker.failure()
+                REQUESTS.inc(outcome="error")
+                raise GigaChatUnavailable("GigaChat сейчас не отвечает. Попробуйте позже.") from error
+            RETRIES.inc(reason=reason)
+            logger.info(f"GigaChat {reason}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @contextlib.asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """
+        Место среди max_concurrent запросов; ждать дольше queue_timeout не будем.
+
+        Разомкнутый CircuitBreaker отклоняет запрос ещё до очереди.
+        """
+        self.breaker.check()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        QUEUED.inc()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            REQUESTS.inc(outcome="queue_timeout")
+            raise GigaChatUnavailable("GigaChat перегружен запросами. Попробуйте через минуту.") from None
+        finally:
+            QUEUED.dec()
+        IN_FLIGHT.inc()
+        try:
+            yield
+        finally:
+            IN_FLIGHT.dec()
+            self._slots.release()
+
+    async def chat(
+        self,
+        *,
+        system_prompt: str,
+        user_text: str,
+        model: Optional[str] = None,
+        temperature: float = 0.2,
+        use_cache: bool = True,
+    ) -> str:
+        """
+        Один ответ модели на (system_prompt, user_text).
+
+        use_cache=False — не брать ответ из кэша (новый вариант), но сохранить его.
+        """
+        key = self._cache_key(system_prompt, user_text, model, temperature)
+        if key and use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        async with self._slot():
+            r = await self._post(self._payload(system_prompt, user_text, model, temperature, stream=False))
+            async with r:
+                data = await r.json()
+        REQUESTS.inc(outcome="ok")
+        text = data["choices"][0]["message"]["content"].strip()
+        if key and text:
+            await self.cache.set(key, text)
+        return text
+
+    async def chat_stream(
+        self,
+        *,
+        system_prompt: str,
+        user_text: str,
+        model: Optional[str] = None,
+        temperature: float = 0.2,
+        use_cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Ответ модели по частям (SSE, "stream": true).
+
+        Отдаёт фрагменты текста (delta.content) по мере генерации; ответ из
+        кэша отдаётся одним фрагментом. Полностью полученный ответ кэшируется.
+        """
+        key = self._cache_key(system_prompt, user_text, model, temperature)
+        if key and use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        payload = self._payload(system_prompt, user_text, model, temperature, stream=True)
+        pieces: list[str] = []
+        async with self._slot():
+            r = await self._post(payload)
+            async with r:
+                async for event in _iter_sse(r.content):
+                    if event == "[DONE]":
+                        break
+                    for choice in json.loads(event).get("choices") or ():
+                        piece = (choice.get("delta") or {}).get("content")
+                        if piece:
+                            pieces.append(piece)
+                            yield piece
+        REQUESTS.inc(outcome="ok")
+        text = "".join(pieces).strip()
+        if key and text:
+            await self.cache.set(key, text)
+
+
+async def _iter_sse(stream: aiohttp.StreamReader) -> AsyncIterator[str]:
+    """Данные событий Server-Sent Events (строки data:, склеенные по событию)."""
+    data: list[str] = []
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        line = line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield "\n".join(data)
+                data = []
+            continue
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip(" "))
+    if data:
+        yield "\n".join(data)
+
+
+# ========== Инициализация ==========
+
+_client: Optional[GigaChatClient] = None
+
+
+def init_gigachat(settings: dict[str, Any], redis: Optional[Any] = None) -> GigaChatClient:
+    """
+    Создать общий клиент GigaChat по load_settings().
+
+    redis (redis.asyncio.Redis, например RedisStorage.redis) — общий для
+    процессов токен (если не GIGACHAT_TOKEN_SHARED=0) и кэш ответов
+    (если GIGACHAT_CACHE_TTL_SEC > 0).
+
+    Must be called once during bot startup, затем await client.start() в event loop.
+    """
+    global _client
+    cache_ttl = int(settings.get("GIGACHAT_CACHE_TTL_SEC") or 0)
+    _client = GigaChatClient(
+        auth_key=settings["GIGACHAT_AUTH_KEY"],
+        scope=settings["GIGACHAT_SCOPE"],
+        model=settings["GIGACHAT_MODEL"],
+        limit_per_host=int(settings.get("GIGACHAT_POOL_PER_HOST") or 10),
+        keepalive_timeout=float(settings.get("GIGACHAT_KEEPALIVE_SEC") or 60),
+        dns_ttl=int(settings.get("GIGACHAT_DNS_TTL_SEC") or 300),
+        timeout=float(settings.get("GIGACHAT_TIMEOUT_SEC") or 90),
+        redis=redis if settings.get("GIGACHAT_TOKEN_SHARED", True) else None,
+        refresh_ahead=float(settings.get("GIGACHAT_TOKEN_REFRESH_AHEAD_SEC") or TOKEN_REFRESH_AHEAD),
+        cache=ResponseCache(redis, cache_ttl) if redis is not None and cache_ttl > 0 else None,
+        max_concurrent=int(settings.get("GIGACHAT_MAX_CONCURRENT") or 10),
+        queue_timeout=float(settings.get("GIGACHAT_QUEUE_TIMEOUT_SEC") or 15),
+        max_retries=int(settings.get("GIGACHAT_MAX_RETRIES", 3)),
+        breaker=CircuitBreaker(
+            failure_threshold=int(settings.get("GIGACHAT_BREAKER_FAILURES") or 5),
+            reset_timeout=float(settings.get("GIGACHAT_BREAKER_RESET_SEC") or 30),
+        ),
+    )
+    return _client
+
+
+def get_gigachat() -> Optional[GigaChatClient]:
+    """Общий клиент или None, если init_gigachat() не вызывался."""
+    return _client
+
+
+async def shutdown_gigachat() -> None:
+    """Закрыть сессию клиента (при завершении бота)."""
+    if _client is not None:
+        await _client.close()
 
 
 async def gigachat_chat(
@@ -61,36 +689,48 @@ async def gigachat_chat(
     model: str,
     system_prompt: str,
     user_text: str,
+    use_cache: bool = True,
 ) -> str:
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_text},
-        ],
-        "temperature": 0.2,
-    }
-
-    async with aiohttp.ClientSession() as session:
-        token = await get_access_token(session, auth_key=auth_key, scope=scope)
-
-        async def _call(tkn: str):
-            headers = {"Authorization": f"Bearer {tkn}", "Content-Type": "application/json"}
-            return await session.post(
-                "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=90,
-            )
+    """
+    Запрос к GigaChat через общий клиент.
+
+    Без init_gigachat() (скрипты, тесты) создаётся временный клиент на один
+    запрос, без кэша ответов. use_cache=False — запросить новый ответ.
+    """
+    client = _client
+    if client is not None and client.auth_key == auth_key and client.scope == scope:
+        return await client.chat(
+            system_prompt=system_prompt, user_text=user_text, model=model, use_cache=use_cache
+        )
+
+    client = GigaChatClient(auth_key=auth_key, scope=scope, model=model)
+    try:
+        return await client.chat(system_prompt=system_prompt, user_text=user_text)
+    finally:
+        await client.close()
 
-        r = await _call(token)
-        if r.status == 401:
-            await r.release()
-            token = await get_access_token(session, auth_key=auth_key, scope=scope, force_refresh=True)
-            r = await _call(token)
 
-        if r.status != 200:
-            raise RuntimeError(await r.text())
+async def gigachat_chat_stream(
+    *,
+    auth_key: str,
+    scope: str,
+    model: str,
+    system_prompt: str,
+    user_text: str,
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    """Потоковый вариант gigachat_chat(): фрагменты ответа по мере генерации."""
+    client = _client
+    if client is not None and client.auth_key == auth_key and client.scope == scope:
+        async for piece in client.chat_stream(
+            system_prompt=system_prompt, user_text=user_text, model=model, use_cache=use_cache
+        ):
+            yield piece
+        return
 
-        data = await r.json()
-        return data["choices"][0]["message"]["content"].strip()
+    client = GigaChatClient(auth_key=auth_key, scope=scope, model=model)
+    try:
+        async for piece in client.chat_stream(system_prompt=system_prompt, user_text=user_text):
+            yield piece
+    finally:
+        await client.close()
@@ -0,0 +1,66 @@
+"""
+Денежные суммы в целых копейках.
+
+Сумма разбирается один раз — при вводе (parse_amount_kopeks) или при чтении
+из БД (Decimal из Numeric(15, 2)) — и дальше живёт как int копеек: итоги
+считаются целочисленным сложением, а рубли/копейки для текста документа
+получаются через divmod при форматировании.
+
+Кредитор (словарь из карточки или format_parties_for_doc) хранит сумму в
+поле "amount_kopeks". В старых карточках есть только строки debt_rubles /
+debt_kopeks — они разбираются один раз в creditor_kopeks().
+"""
+from __future__ import annotations
+
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Iterable, Optional
+
+Kopeks = int
+
+AMOUNT_KEY = "amount_kopeks"
+
+
+def to_kopeks(amount: Optional[Decimal]) -> Kopeks:
+    """Decimal (рубли) -> копейки, с округлением до копейки."""
+    if not amount:
+        return 0
+    return int((amount * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_parts(rubles: Any, kopeks: Any) -> Optional[Kopeks]:
+    """
+    Рубли и копейки из отдельных полей старых карточек -> копейки.
+
+    Берутся только цифры; копейки сверх 99 переносятся в рубли.
+    None — если не указано ни то, ни другое.
+    """
+    r = "".join(ch for ch in str(rubles) if ch.isdigit()) if rubles is not None else ""
+    k = "".join(ch for ch in str(kopeks) if ch.isdigit()) if kopeks is not None else ""
+    if not r and not k:
+        return None
+    return int(r or 0) * 100 + int(k or 0)
+
+
+def creditor_kopeks(creditor: Optional[dict]) -> Optional[Kopeks]:
+    """Сумма долга кредитора в копейках или None, если сумма не указана."""
+    creditor = creditor or {}
+    amount = creditor.get(AMOUNT_KEY)
+    if isinstance(amount, int):
+        return amount
+    return from_parts(creditor.get("debt_rubles"), creditor.get("debt_kopeks"))
+
+
+def total_kopeks(creditors: Optional[Iterable[dict]]) -> Kopeks:
+    """Итог по кредиторам (целочисленная сумма)."""
+    return sum(creditor_kopeks(c) or 0 for c in creditors or ())
+
+
+def split(amount: Kopeks) -> tuple[int, int]:
+    """Копейки -> (рубли, копейки)."""
+    return divmod(amount, 100)
+
+
+def format_amount(amount: Kopeks) -> str:
+    """Копейки -> "1234.50" (для таблиц форм)."""
+    rubles, kopeks = divmod(amount, 100)
+    return f"{rubles}.{kopeks:02d}"
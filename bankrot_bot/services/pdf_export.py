@@ -0,0 +1,309 @@
+"""
+Экспорт сгенерированных DOCX в PDF (суды принимают PDF).
+
+Конвертация идёт через пул долгоживущих headless LibreOffice, обёрнутых в
+unoserver (XML-RPC): офис стартует один раз на процесс, а не на каждый
+документ. Процессы либо запускаются самим ботом (PDF_WORKERS штук,
+порты от PDF_UNOSERVER_BASE_PORT), либо берутся готовые по адресам
+PDF_UNOSERVER_ADDRS (например, контейнер unoserver из docker-compose).
+
+Каждая конвертация ограничена PDF_TIMEOUT_SEC; зависший локальный процесс
+перезапускается. Конвертер возвращается в пул только после того, как его
+XML-RPC вызов действительно завершился (у сокета тот же таймаут, поэтому
+поток с вызовом не висит вечно). Результат кэшируется в хранилище документов
+по ключу содержимого DOCX (pdf-cache/<hash>.pdf): повторная отправка того же
+документа конвертацию не запускает. Старый кэш чистит retention
+(RETENTION_PDF_CACHE_DAYS / RETENTION_PDF_CACHE_MB).
+
+Выключено по умолчанию (PDF_EXPORT=0).
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import xmlrpc.client
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from bankrot_bot.services.docx_output import document_content_key
+from bankrot_bot.services.storage import DocumentStorage, key_filename
+
+logger = logging.getLogger(__name__)
+
+PDF_CACHE_PREFIX = "pdf-cache/"
+
+
+class PdfConversionError(RuntimeError):
+    """Не удалось сконвертировать документ в PDF."""
+
+
+class _TimeoutTransport(xmlrpc.client.Transport):
+    """HTTP-транспорт XML-RPC с таймаутом сокета (у ServerProxy его нет)."""
+
+    def __init__(self, timeout: float) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+    def make_connection(self, host: Any) -> Any:
+        conn = super().make_connection(host)
+        conn.timeout = self.timeout
+        return conn
+
+
+@dataclass
+class _Converter:
+    """Один процесс unoserver (свой или внешний)."""
+
+    host: str
+    port: int
+    uno_port: Optional[int] = None
+    process: Optional[asyncio.subprocess.Process] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+
+class PdfConverterPool:
+    """
+    Пул конвертеров unoserver.
+
+    Свободные конвертеры лежат в очереди; конвертация берёт один, а после —
+    возвращает. Так каждый процесс LibreOffice обрабатывает не больше одного
+    документа одновременно.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = 2,
+        base_port: int = 2003,
+        command: str = "unoserver",
+        addresses: Optional[list[str]] = None,
+        timeout: float = 60.0,
+        startup_timeout: float = 30.0,
+    ) -> None:
+        self.command = command
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        if addresses:
+            self._converters = [self._parse_address(a) for a in addresses]
+        else:
+            # unoserver: XML-RPC на port, сам офис слушает uno_port
+            self._converters = [
+                _Converter("127.0.0.1", base_port + 2 * i, uno_port=base_port + 2 * i + 1)
+                for i in range(max(1, workers))
+            ]
+        self._free: asyncio.Queue[_Converter] = asyncio.Queue()
+        self._started = False
+        self._lock = asyncio.Lock()
+        # возврат конвертеров после таймаута/отмены: ждут завершения вызова
+        self._releasing: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _parse_address(address: str) -> _Converter:
+        host, _, port = address.strip().rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid unoserver address: {address!r}. Use host:port")
+        return _Converter(host, int(port))
+
+    @property
+    def owns_processes(self) -> bool:
+        return any(c.uno_port is not None for c in self._converters)
+
+    async def _spawn(self, conv: _Converter) -> None:
+        try:
+            conv.process = await asyncio.create_subprocess_exec(
+                self.command,
+                "--interface", conv.host,
+                "--port", str(conv.port),
+                "--uno-port", str(conv.uno_port),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError as e:
+            raise PdfConversionError(
+                f"{self.command} не найден: установите LibreOffice и unoserver или задайте PDF_UNOSERVER_ADDRS"
+            ) from e
+        await self._wait_ready(conv)
+
+    async def _wait_ready(self, conv: _Converter) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.startup_timeout
+        while True:
+            if conv.process is not None and conv.process.returncode is not None:
+                raise PdfConversionError(f"unoserver on port {conv.port} exited with {conv.process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection(conv.host, conv.port)
+                writer.close()
+                await writer.wait_closed()
+                return
+            except OSError:
+                if loop.time() > deadline:
+                    raise PdfConversionError(f"unoserver on port {conv.port} did not start in {self.startup_timeout}s")
+                await asyncio.sleep(0.5)
+
+    async def _kill(self, conv: _Converter) -> None:
+        proc, conv.process = conv.process, None
+        if proc is None or proc.returncode is not None:
+            return
+        proc.kill()
+        try:
+            await asyncio.wait_for(proc.wait(), 10)
+        except asyncio.TimeoutError:
+            logger.warning(f"unoserver on port {conv.port} did not exit after kill")
+
+    async def start(self) -> None:
+        """Запустить процессы (для внешних адресов — только проверить доступность)."""
+        async with self._lock:
+            if self._started:
+                return
+            for conv in self._converters:
+                if conv.uno_port is not None:
+                    await self._spawn(conv)
+                self._free.put_nowait(conv)
+            self._started = True
+            logger.info(
+                f"PDF converter pool started: {len(self._converters)} "
+                f"{'local' if self.owns_processes else 'remote'} unoserver(s)"
+            )
+
+    async def stop(self) -> None:
+        """Остановить свои процессы."""
+        async with self._lock:
+            for task in list(self._releasing):
+                task.cancel()
+            await asyncio.gather(*self._releasing, return_exceptions=True)
+            for conv in self._converters:
+                await self._kill(conv)
+            self._free = asyncio.Queue()
+            self._started = False
+
+    @staticmethod
+    def _call(conv: _Converter, data: bytes, timeout: float) -> bytes:
+        proxy = xmlrpc.client.ServerProxy(conv.url, transport=_TimeoutTransport(timeout), allow_none=True)
+        # convert(inpath, indata, outpath, convert_to) — при outpath=None результат возвращается
+        result = proxy.convert(None, xmlrpc.client.Binary(data), None, "pdf")
+        return result.data if isinstance(result, xmlrpc.client.Binary) else bytes(result)
+
+    async def _release(self, conv: _Converter, call: asyncio.Future, *, restart: bool) -> None:
+        """Вернуть конвертер в пул, когда его вызов завершился (при restart — после перезапуска)."""
+        try:
+            if restart and conv.uno_port is not None:
+                # зависший/упавший офис: убиваем, поток с XML-RPC получит обрыв соединения
+                await self._kill(conv)
+            # после kill — обрыв, иначе не дольше таймаута сокета
+            await asyncio.wait({call})
+            if not call.cancelled() and call.exception() is not None:
+                logger.debug(f"Abandoned unoserver call on port {conv.port} ended with {call.exception()!r}")
+            if restart and conv.uno_port is not None:
+                try:
+                    await self._spawn(conv)
+                except PdfConversionError as e:
+                    logger.error(f"unoserver restart failed: {e}")
+        finally:
+            self._free.put_nowait(conv)
+
+    def _release_later(self, conv: _Converter, call: asyncio.Future, *, restart: bool) -> None:
+        task = asyncio.create_task(self._release(conv, call, restart=restart))
+        self._releasing.add(task)
+        task.add_done_callback(self._releasing.discard)
+
+    async def convert(self, data: bytes) -> bytes:
+        """
+        DOCX (bytes) -> PDF (bytes).
+
+        Raises:
+            PdfConversionError: Таймаут или ошибка конвертера
+        """
+        await self.start()
+        conv = await self._free.get()
+        call = asyncio.ensure_future(asyncio.to_thread(self._call, conv, data, self.timeout))
+        try:
+            done, _ = await asyncio.wait({call}, timeout=self.timeout)
+            if not done:
+                raise asyncio.TimeoutError()
+            result = call.result()
+        except (asyncio.TimeoutError, OSError, xmlrpc.client.Error) as e:
+            if conv.uno_port is not None:
+                logger.warning(f"Restarting unoserver on port {conv.port} after error: {e!r}")
+            self._release_later(conv, call, restart=True)
+            reason = f"timeout {self.timeout:g}s" if isinstance(e, asyncio.TimeoutError) else repr(e)
+            raise PdfConversionError(f"PDF conversion failed: {reason}") from e
+        except BaseException:
+            # отмена ожидающего: конвертер вернётся в пул, когда вызов закончится
+            self._release_later(conv, call, restart=False)
+            raise
+        self._free.put_nowait(conv)
+        return result
+
+
+# ========== Инициализация ==========
+
+_pool: Optional[PdfConverterPool] = None
+
+
+def init_pdf_export(settings: dict[str, Any]) -> Optional[PdfConverterPool]:
+    """
+    Настроить экспорт в PDF по load_settings(). При PDF_EXPORT=0 — выключен.
+
+    Процессы стартуют при первой конвертации (или явно через get_pdf_pool().start()).
+    """
+    global _pool
+    if not settings.get("PDF_EXPORT"):
+        _pool = None
+        return None
+    addresses = [a for a in (settings.get("PDF_UNOSERVER_ADDRS") or "").split(",") if a.strip()]
+    _pool = PdfConverterPool(
+        workers=int(settings.get("PDF_WORKERS") or 2),
+        base_port=int(settings.get("PDF_UNOSERVER_BASE_PORT") or 2003),
+        command=settings.get("PDF_UNOSERVER_CMD") or "unoserver",
+        addresses=addresses or None,
+        timeout=float(settings.get("PDF_TIMEOUT_SEC") or 60),
+    )
+    return _pool
+
+
+def get_pdf_pool() -> Optional[PdfConverterPool]:
+    """Пул конвертеров или None, если экспорт в PDF выключен."""
+    return _pool
+
+
+async def shutdown_pdf_export() -> None:
+    """Остановить процессы конвертеров (при завершении бота)."""
+    if _pool is not None:
+        await _pool.stop()
+
+
+def pdf_filename(docx_name: str) -> str:
+    """'petition_case_1_….docx' -> 'petition_case_1_….pdf'."""
+    stem = docx_name[:-5] if docx_name.lower().endswith(".docx") else docx_name
+    return f"{stem}.pdf"
+
+
+async def export_pdf(storage: DocumentStorage, docx_key: str) -> str:
+    """
+    PDF для документа из хранилища (с кэшем по содержимому DOCX).
+
+    Returns:
+        Ключ PDF в хранилище (pdf-cache/<hash>.pdf)
+
+    Raises:
+        PdfConversionError: Экспорт выключен или конвертация не удалась
+    """
+    pool = get_pdf_pool()
+    if pool is None:
+        raise PdfConversionError("PDF export is disabled (PDF_EXPORT=0)")
+
+    buf = io.BytesIO()
+    async for chunk in storage.iter_chunks(docx_key):
+        buf.write(chunk)
+
+    pdf_key = f"{PDF_CACHE_PREFIX}{document_content_key(buf)}.pdf"
+    if await storage.exists(pdf_key):
+        logger.info(f"PDF cache hit for {key_filename(docx_key)}")
+        return pdf_key
+
+    pdf = await pool.convert(buf.getvalue())
+    return await storage.save_stream(pdf_key, io.BytesIO(pdf))
@@ -0,0 +1,125 @@
+"""
+Пул процессов для рендеринга DOCX.
+
+Заполнение шаблонов python-docx/docxtpl — чистая работа CPU под GIL, поэтому
+массовую генерацию выносим в ProcessPoolExecutor. Процессы долгоживущие:
+шаблоны Jinja компилируются в каждом воркере один раз, дальше переиспользуются.
+
+В воркер передаются только простые данные (контекст, строки таблиц), а
+результат пишется в файл по указанному пути — байты документа через IPC
+не гоняются.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_workers: int = 0
+_spool_threshold_kb: int = 1024
+
+
+def init_render_pool(workers: int = 0, *, spool_threshold_kb: int = 1024) -> None:
+    """
+    Задать размер пула (0 = по числу CPU). Сам пул создаётся лениво.
+
+    spool_threshold_kb (DOCX_SPOOL_THRESHOLD_KB) передаётся в воркеры при их
+    запуске — spawn-процессы не видят настроек родителя.
+
+    Must be called during bot startup; повторный вызов с другими параметрами
+    пересоздаёт пул при следующем использовании.
+    """
+    global _workers, _spool_threshold_kb
+    workers = workers or os.cpu_count() or 1
+    if _pool is not None and (workers, spool_threshold_kb) != (_workers, _spool_threshold_kb):
+        shutdown_render_pool()
+    _workers = workers
+    _spool_threshold_kb = spool_threshold_kb
+
+
+def render_pool_size() -> int:
+    """Число процессов в пуле."""
+    return _workers or os.cpu_count() or 1
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Пул процессов рендеринга (создаётся при первом обращении)."""
+    global _pool
+    if _pool is None:
+        workers = render_pool_size()
+        # spawn: воркеры не наследуют event loop и потоки родителя
+        _pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(_spool_threshold_kb,),
+        )
+        logger.info(f"Render pool started: {workers} workers")
+    return _pool
+
+
+def shutdown_render_pool() -> None:
+    """Остановить пул (при завершении бота)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        logger.info("Render pool stopped")
+
+
+async def run_in_render_pool(func: Callable[..., T], *args: Any) -> T:
+    """Выполнить func(*args) в пуле процессов. func должна быть функцией уровня модуля."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_render_pool(), partial(func, *args))
+
+
+# ========== Задачи для воркеров ==========
+
+def _init_worker(spool_threshold_kb: int) -> None:
+    from bankrot_bot.services.docx_output import init_docx_output
+
+    init_docx_output(spool_threshold_kb)
+
+
+def render_petition_to_file(context: dict[str, Any], out_path: str) -> int:
+    """Заявление о банкротстве -> out_path. Возвращает размер файла."""
+    from bankrot_bot.services.docx_jinja import render_petition
+
+    with render_petition(context) as rendered, open(out_path, "wb") as out:
+        while chunk := rendered.read(64 * 1024):
+            out.write(chunk)
+    return Path(out_path).stat().st_size
+
+
+def render_creditors_list_to_file(data: tuple, out_path: str) -> int:
+    """Список кредиторов и должников (данные из load_creditors_list_data) -> out_path."""
+    from bankrot_bot.services.docx_forms import build_creditors_list
+
+    build_creditors_list(*data).save(out_path)
+    return Path(out_path).stat().st_size
+
+
+def render_inventory_to_file(data: tuple, out_path: str) -> int:
+    """Опись имущества (данные из load_inventory_data) -> out_path."""
+    from bankrot_bot.services.docx_forms import build_inventory
+
+    build_inventory(*data).save(out_path)
+    return Path(out_path).stat().st_size
+
+
+def render_text_to_file(title: str, text: str, out_path: str) -> int:
+    """Текстовый документ (ответ GigaChat) -> out_path."""
+    from bankrot_bot.services.docx_forms import build_text_document
+
+    build_text_document(title, text).save(out_path)
+    return Path(out_path).stat().st_size
@@ -0,0 +1,107 @@
+"""
+Хранилище результатов GigaChat для экспорта.
+
+Ответ модели (проект ходатайства/мирового) кладётся в Redis сжатым (zlib)
+с ограничением размера и сроком жизни, а пользователь получает короткий
+handle — он зашит в кнопку экспорта (export:word:<handle>). Текст не
+держится в памяти процесса и доступен любому воркеру бота.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import secrets
+import zlib
+from dataclasses import dataclass
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_PREFIX = "ai:result:"
+
+
+class ResultTooLarge(ValueError):
+    """Текст результата больше допустимого размера."""
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    kind: str
+    text: str
+
+
+class ResultStore:
+    """Результаты в Redis: zlib, TTL на запись, ограничение размера."""
+
+    def __init__(self, redis: Any, *, ttl: int, max_bytes: int) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    async def put(self, text: str, *, owner_id: int, kind: str) -> str:
+        """
+        Сохранить результат.
+
+        Args:
+            text: Текст ответа модели
+            owner_id: Telegram user_id владельца (чужой handle не откроется)
+            kind: Вид документа ("motion", "settlement")
+
+        Returns:
+            handle для get()
+
+        Raises:
+            ResultTooLarge: Текст длиннее max_bytes (в UTF-8)
+        """
+        raw = text.encode("utf-8")
+        if len(raw) > self.max_bytes:
+            raise ResultTooLarge(f"{len(raw)} > {self.max_bytes} bytes")
+        header = json.dumps({"owner": owner_id, "kind": kind}).encode("utf-8")
+        payload = zlib.compress(header + b"\n" + raw)
+        handle = secrets.token_urlsafe(9)
+        await self.redis.set(_PREFIX + handle, payload, ex=self.ttl)
+        logger.debug(f"Stored result {handle}: {len(raw)} -> {len(payload)} bytes")
+        return handle
+
+    async def get(self, handle: str, *, owner_id: int) -> Optional[StoredResult]:
+        """Результат по handle или None (истёк, не найден, чужой)."""
+        payload = await self.redis.get(_PREFIX + handle)
+        if payload is None:
+            return None
+        header, _, raw = zlib.decompress(payload).partition(b"\n")
+        meta = json.loads(header)
+        if meta.get("owner") != owner_id:
+            return None
+        return StoredResult(kind=meta.get("kind") or "", text=raw.decode("utf-8"))
+
+
+# ========== Инициализация ==========
+
+_store: Optional[ResultStore] = None
+
+
+def init_result_store(redis: Any, settings: dict[str, Any]) -> ResultStore:
+    """
+    Создать хранилище результатов по load_settings().
+
+    Must be called once during bot startup.
+    """
+    global _store
+    _store = ResultStore(
+        redis,
+        ttl=int(settings.get("RESULT_TTL_SEC") or 7 * 24 * 3600),
+        max_bytes=int(settings.get("RESULT_MAX_KB") or 256) * 1024,
+    )
+    return _store
+
+
+def get_result_store() -> ResultStore:
+    """
+    Хранилище результатов.
+
+    Raises:
+        RuntimeError: init_result_store() не вызывался
+    """
+    if _store is None:
+        raise RuntimeError("Result store not initialized. Call init_result_store() during startup.")
+    return _store
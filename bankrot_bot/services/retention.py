@@ -0,0 +1,432 @@
+"""
+Политика хранения сгенерированных документов.
+
+Каждое нажатие «Сформировать» кладёт новый файл с меткой времени в
+GENERATED_DIR/cases/<cid>/, и без чистки каталог растёт бесконечно.
+Модуль строит план очистки по политике и применяет его:
+
+- keep_last: сколько последних файлов каждого вида хранить в деле;
+- max_age_days: удалять файлы старше N дней;
+- max_case_bytes / max_total_bytes: лимиты объёма на дело и на весь каталог;
+- dedup: одинаковые по содержимому рендеры заменяются жёсткими ссылками;
+- pdf_cache_*: срок и объём кэша PDF (GENERATED_DIR/pdf-cache, см. pdf_export) —
+  его файлы не защищены и при необходимости конвертируются заново.
+
+Самый свежий файл каждого вида в деле не удаляется никогда —
+на него ссылается кнопка «Последний документ».
+
+Порядок и возраст файлов считаются по метке времени в имени
+(…_YYYYmmdd_HHMMSS), а не по mtime: слинкованные копии делят один inode.
+По той же причине объём считается по inode: место освобождает только
+удаление последней ссылки.
+
+Запуск вручную (отчёт без изменений):
+    python -m bankrot_bot.services.retention --dry-run
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from bankrot_bot.services.docx_output import document_content_key
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+_DAY = 24 * 60 * 60
+# PDF_CACHE_PREFIX из pdf_export
+_PDF_CACHE_DIR = "pdf-cache"
+_STAMP_RE = re.compile(r"_(\d{8}_\d{6})(?:\.[^.]*)?$")
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Параметры политики хранения (0/None = ограничение выключено)."""
+
+    keep_last: int = 20
+    max_age_days: int = 0
+    max_case_bytes: int = 0
+    max_total_bytes: int = 0
+    dedup: bool = True
+    pdf_cache_max_age_days: int = 30
+    pdf_cache_max_bytes: int = 0
+
+    @classmethod
+    def from_settings(cls, settings: dict[str, Any]) -> "RetentionPolicy":
+        """Собрать политику из словаря load_settings()."""
+        return cls(
+            keep_last=int(settings.get("RETENTION_KEEP_LAST") or 0),
+            max_age_days=int(settings.get("RETENTION_MAX_AGE_DAYS") or 0),
+            max_case_bytes=int(settings.get("RETENTION_MAX_CASE_MB") or 0) * _MB,
+            max_total_bytes=int(settings.get("RETENTION_MAX_TOTAL_MB") or 0) * _MB,
+            dedup=bool(settings.get("RETENTION_DEDUP", True)),
+            pdf_cache_max_age_days=int(settings.get("RETENTION_PDF_CACHE_DAYS") or 0),
+            pdf_cache_max_bytes=int(settings.get("RETENTION_PDF_CACHE_MB") or 0) * _MB,
+        )
+
+
+@dataclass
+class _Entry:
+    path: Path
+    case_id: str
+    kind: str
+    size: int
+    # время создания из имени файла (mtime, если метки в имени нет)
+    created: float
+    inode: tuple[int, int]
+    # число жёстких ссылок на inode (st_nlink)
+    links: int = 1
+    protected: bool = False
+
+
+@dataclass
+class RetentionReport:
+    """Результат прохода: что удалено/слинковано и сколько места освобождено."""
+
+    dry_run: bool
+    files_scanned: int = 0
+    bytes_scanned: int = 0
+    deleted: list[tuple[Path, str]] = field(default_factory=list)
+    deduplicated: list[tuple[Path, Path]] = field(default_factory=list)
+    bytes_freed: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+def document_kind(filename: str) -> str:
+    """
+    Вид документа по имени файла.
+
+    'bankruptcy_petition_case_6_20260117_101500.docx' -> 'bankruptcy_petition'
+    Для нестандартных имён видом считается расширение файла.
+    """
+    stem, _, _ = filename.partition("_case_")
+    if stem and stem != filename:
+        return stem
+    return Path(filename).suffix.lower() or "other"
+
+
+def document_timestamp(filename: str) -> Optional[float]:
+    """
+    Время создания документа из метки в имени (…_YYYYmmdd_HHMMSS.docx).
+
+    mtime для упорядочивания не годится: жёсткие ссылки после дедупликации
+    делят один inode, а значит и один mtime.
+
+    Returns:
+        Unix-время или None, если метки в имени нет
+    """
+    m = _STAMP_RE.search(filename)
+    if m is None:
+        return None
+    try:
+        return datetime.strptime(m.group(1), "%Y%m%d_%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+
+def _scan_case_dir(case_dir: Path) -> list[_Entry]:
+    """Один проход scandir по делу (stat берётся из DirEntry, без лишних вызовов)."""
+    entries: list[_Entry] = []
+    with os.scandir(case_dir) as it:
+        for de in it:
+            if not de.is_file(follow_symlinks=False) or de.name.startswith("."):
+                continue
+            st = de.stat(follow_symlinks=False)
+            entries.append(
+                _Entry(
+                    path=Path(de.path),
+                    case_id=case_dir.name,
+                    kind=document_kind(de.name),
+                    size=st.st_size,
+                    created=document_timestamp(de.name) or st.st_mtime,
+                    inode=(st.st_dev, st.st_ino),
+                    links=st.st_nlink,
+                )
+            )
+    return entries
+
+
+class _DiskUsage:
+    """
+    Место, занятое набором файлов, с учётом жёстких ссылок.
+
+    Каждый inode считается один раз; remove() уменьшает объём, только когда
+    удалена последняя ссылка на inode. links — начальное число ссылок на
+    inode (по умолчанию — ссылки внутри набора).
+    """
+
+    def __init__(self, entries: list[_Entry], links: Optional[dict[tuple[int, int], int]] = None) -> None:
+        sizes = {e.inode: e.size for e in entries}
+        self.used = sum(sizes.values())
+        if links is None:
+            links = {}
+            for e in entries:
+                links[e.inode] = links.get(e.inode, 0) + 1
+        self._links = dict(links)
+
+    def remove(self, e: _Entry) -> int:
+        """Убрать ссылку e; возвращает освобождённые байты (0, если ссылки на inode остались)."""
+        left = self._links.get(e.inode, 1) - 1
+        self._links[e.inode] = left
+        if left > 0:
+            return 0
+        self.used -= e.size
+        return e.size
+
+
+def _plan_case(entries: list[_Entry], policy: RetentionPolicy, now: float) -> list[tuple[_Entry, str]]:
+    """Выбрать файлы дела на удаление (по количеству, возрасту и объёму)."""
+    to_delete: dict[Path, tuple[_Entry, str]] = {}
+
+    by_kind: dict[str, list[_Entry]] = {}
+    for e in entries:
+        by_kind.setdefault(e.kind, []).append(e)
+
+    for items in by_kind.values():
+        items.sort(key=lambda e: (e.created, e.path.name), reverse=True)
+        items[0].protected = True
+        for idx, e in enumerate(items[1:], start=1):
+            if policy.keep_last and idx >= policy.keep_last:
+                to_delete[e.path] = (e, f"keep_last={policy.keep_last}")
+            elif policy.max_age_days and now - e.created > policy.max_age_days * _DAY:
+                to_delete[e.path] = (e, f"max_age_days={policy.max_age_days}")
+
+    if policy.max_case_bytes:
+        survivors = [e for e in entries if e.path not in to_delete]
+        usage = _DiskUsage(survivors)
+        for e in sorted(survivors, key=lambda e: e.created):
+            if usage.used <= policy.max_case_bytes:
+                break
+            if e.protected:
+                continue
+            to_delete[e.path] = (e, f"max_case_bytes={policy.max_case_bytes}")
+            usage.remove(e)
+
+    return list(to_delete.values())
+
+
+def _plan_pdf_cache(entries: list[_Entry], policy: RetentionPolicy, now: float) -> list[tuple[_Entry, str]]:
+    """Файлы кэша PDF на удаление: старше срока, затем самые старые сверх объёма."""
+    planned: list[tuple[_Entry, str]] = []
+    used = sum(e.size for e in entries)
+    for e in sorted(entries, key=lambda e: e.created):
+        if policy.pdf_cache_max_age_days and now - e.created > policy.pdf_cache_max_age_days * _DAY:
+            planned.append((e, f"pdf_cache_days={policy.pdf_cache_max_age_days}"))
+        elif policy.pdf_cache_max_bytes and used > policy.pdf_cache_max_bytes:
+            planned.append((e, f"pdf_cache_bytes={policy.pdf_cache_max_bytes}"))
+        else:
+            continue
+        used -= e.size
+    return planned
+
+
+def _plan_dedup(entries: list[_Entry]) -> list[tuple[_Entry, _Entry]]:
+    """
+    Пары (дубликат, оригинал) для замены жёсткой ссылкой.
+
+    Сначала группируем по размеру — хешируются только файлы с совпадающим
+    размером, уже слинкованные (один inode) пропускаются.
+    """
+    by_size: dict[int, list[_Entry]] = {}
+    for e in entries:
+        by_size.setdefault(e.size, []).append(e)
+
+    pairs: list[tuple[_Entry, _Entry]] = []
+    for group in by_size.values():
+        if len({e.inode for e in group}) < 2:
+            continue
+        canonical: dict[str, _Entry] = {}
+        for e in sorted(group, key=lambda e: e.created):
+            try:
+                key = document_content_key(e.path)
+            except OSError as ex:
+                logger.warning(f"Retention: cannot hash {e.path}: {ex}")
+                continue
+            orig = canonical.setdefault(key, e)
+            if orig is not e and orig.inode != e.inode:
+                pairs.append((e, orig))
+    return pairs
+
+
+def _hardlink_replace(dup: Path, orig: Path) -> None:
+    """
+    Атомарно заменить dup жёсткой ссылкой на orig.
+
+    После замены у dup те же mtime и права, что у orig (общий inode), —
+    поэтому порядок файлов берётся из меток в именах, а не из mtime.
+    """
+    tmp = dup.with_name(f".{dup.name}.link")
+    os.link(orig, tmp)
+    try:
+        os.replace(tmp, dup)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def apply_retention(
+    generated_dir: Path,
+    policy: RetentionPolicy,
+    *,
+    dry_run: bool = False,
+    now: Optional[float] = None,
+) -> RetentionReport:
+    """
+    Применить политику хранения к GENERATED_DIR/cases и GENERATED_DIR/pdf-cache.
+
+    Args:
+        generated_dir: Корень сгенерированных документов
+        policy: Политика хранения
+        dry_run: Только посчитать план, ничего не удалять
+        now: Текущее время (для тестов)
+
+    Returns:
+        RetentionReport с удалёнными/слинкованными файлами
+    """
+    now = time.time() if now is None else now
+    report = RetentionReport(dry_run=dry_run)
+    cases_root = Path(generated_dir) / "cases"
+
+    scanned: list[_Entry] = []
+    survivors: list[_Entry] = []
+    planned: list[tuple[_Entry, str]] = []
+
+    case_dirs: list[Path] = []
+    if cases_root.is_dir():
+        with os.scandir(cases_root) as it:
+            case_dirs = [Path(de.path) for de in it if de.is_dir(follow_symlinks=False)]
+
+    for case_dir in case_dirs:
+        try:
+            entries = _scan_case_dir(case_dir)
+        except OSError as e:
+            report.errors.append(f"{case_dir}: {e}")
+            continue
+        scanned.extend(entries)
+        report.files_scanned += len(entries)
+        report.bytes_scanned += sum(e.size for e in entries)
+
+        case_delete = _plan_case(entries, policy, now)
+        planned.extend(case_delete)
+        doomed = {e.path for e, _ in case_delete}
+        survivors.extend(e for e in entries if e.path not in doomed)
+
+    if policy.max_total_bytes:
+        # место, занятое физически: жёсткие ссылки считаем один раз
+        usage = _DiskUsage(survivors)
+        for e in sorted(survivors, key=lambda e: e.created):
+            if usage.used <= policy.max_total_bytes:
+                break
+            if e.protected:
+                continue
+            planned.append((e, f"max_total_bytes={policy.max_total_bytes}"))
+            usage.remove(e)
+        doomed = {e.path for e, _ in planned}
+        survivors = [e for e in survivors if e.path not in doomed]
+
+    pdf_cache = Path(generated_dir) / _PDF_CACHE_DIR
+    if pdf_cache.is_dir() and (policy.pdf_cache_max_age_days or policy.pdf_cache_max_bytes):
+        try:
+            entries = _scan_case_dir(pdf_cache)
+        except OSError as e:
+            report.errors.append(f"{pdf_cache}: {e}")
+            entries = []
+        scanned.extend(entries)
+        report.files_scanned += len(entries)
+        report.bytes_scanned += sum(e.size for e in entries)
+        planned.extend(_plan_pdf_cache(entries, policy, now))
+
+    # освобождается место только при удалении последней ссылки (в т.ч. вне GENERATED_DIR)
+    disk = _DiskUsage(scanned, links={e.inode: e.links for e in scanned})
+    for e, reason in planned:
+        if not dry_run:
+            try:
+                e.path.unlink()
+            except FileNotFoundError:
+                continue
+            except OSError as ex:
+                report.errors.append(f"{e.path}: {ex}")
+                continue
+        report.deleted.append((e.path, reason))
+        report.bytes_freed += disk.remove(e)
+
+    if policy.dedup:
+        for dup, orig in _plan_dedup(survivors):
+            if not dry_run:
+                try:
+                    _hardlink_replace(dup.path, orig.path)
+                except OSError as ex:
+                    report.errors.append(f"{dup.path}: {ex}")
+                    continue
+            report.deduplicated.append((dup.path, orig.path))
+            report.bytes_freed += disk.remove(dup)
+
+    logger.info(
+        f"Retention{' (dry-run)' if dry_run else ''}: scanned={report.files_scanned} "
+        f"deleted={len(report.deleted)} deduplicated={len(report.deduplicated)} "
+        f"freed={report.bytes_freed} errors={len(report.errors)}"
+    )
+    return report
+
+
+def format_report(report: RetentionReport, limit: int = 20) -> str:
+    """Человекочитаемый отчёт (для админ-команды и CLI)."""
+    head = "🧹 Очистка архива документов" + (" (пробный прогон)" if report.dry_run else "")
+    lines = [
+        head,
+        f"Просмотрено: {report.files_scanned} файлов, {report.bytes_scanned / _MB:.1f} МБ",
+        f"К удалению: {len(report.deleted)}" if report.dry_run else f"Удалено: {len(report.deleted)}",
+        f"Дубликатов (жёсткие ссылки): {len(report.deduplicated)}",
+        f"Освобождается: {report.bytes_freed / _MB:.1f} МБ",
+    ]
+    for path, reason in report.deleted[:limit]:
+        lines.append(f"- {path.parent.name}/{path.name} ({reason})")
+    if len(report.deleted) > limit:
+        lines.append(f"… и ещё {len(report.deleted) - limit}")
+    for err in report.errors[:limit]:
+        lines.append(f"⚠️ {err}")
+    return "\n".join(lines)
+
+
+async def retention_loop(generated_dir: Path, policy: RetentionPolicy, interval_sec: float) -> None:
+    """
+    Фоновая задача: периодически применять политику хранения.
+
+    Работа с файлами идёт в отдельном потоке, чтобы не блокировать event loop.
+    """
+    logger.info(f"Retention job started: every {interval_sec:.0f}s, policy={policy}")
+    while True:
+        try:
+            await asyncio.to_thread(apply_retention, generated_dir, policy)
+        except Exception as e:
+            logger.error(f"Retention job failed: {e}", exc_info=True)
+        await asyncio.sleep(interval_sec)
+
+
+def main() -> None:
+    """CLI: python -m bankrot_bot.services.retention [--dry-run]."""
+    from bankrot_bot.config import load_settings
+
+    parser = argparse.ArgumentParser(description="Очистка GENERATED_DIR по политике хранения")
+    parser.add_argument("--dry-run", action="store_true", help="только показать план")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    report = apply_retention(
+        settings["GENERATED_DIR"],
+        RetentionPolicy.from_settings(settings),
+        dry_run=args.dry_run,
+    )
+    print(format_report(report, limit=1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Хранилище сгенерированных документов.
+
+Генераторы и архив дела работают не с GENERATED_DIR напрямую, а через
+DocumentStorage, поэтому webhook-воркеры можно запускать на нескольких
+машинах с общим S3-совместимым хранилищем (MinIO в docker-compose).
+
+Ключи объектов: "cases/<case_id>/<filename>".
+Загрузка и выгрузка идут потоково, кусками по chunk_size — файл целиком в
+памяти не держится.
+
+Выбор бэкенда — STORAGE_BACKEND=local|s3 (см. .env.example).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncGenerator, AsyncIterator, BinaryIO, Optional
+
+from aiogram import Bot
+from aiogram.types import FSInputFile, InputFile
+
+from bankrot_bot.services.retention import document_timestamp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def case_key(case_id: int | str, filename: str) -> str:
+    """Ключ документа дела в хранилище."""
+    return f"cases/{case_id}/{filename}"
+
+
+def key_filename(key: str) -> str:
+    """Имя файла из ключа."""
+    return key.rsplit("/", 1)[-1]
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    """Метаданные объекта в хранилище."""
+
+    key: str
+    size: int
+    mtime: float
+
+    @property
+    def name(self) -> str:
+        return key_filename(self.key)
+
+
+class DocumentStorage(ABC):
+    """Интерфейс хранилища документов."""
+
+    @abstractmethod
+    async def save_stream(self, key: str, fileobj: BinaryIO) -> str:
+        """Сохранить содержимое файлового объекта (с текущей позиции) под ключом key."""
+
+    @abstractmethod
+    def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """Потоково прочитать объект."""
+
+    @abstractmethod
+    async def list(self, prefix: str) -> list[StoredObject]:
+        """Объекты с ключом, начинающимся с prefix."""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Есть ли объект."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Удалить объект (отсутствующий — не ошибка)."""
+
+    async def save_file(self, key: str, path: Path) -> str:
+        """Сохранить локальный файл под ключом key."""
+        with open(path, "rb") as f:
+            return await self.save_stream(key, f)
+
+    def input_file(self, key: str, filename: Optional[str] = None) -> InputFile:
+        """InputFile для aiogram, который читает объект прямо из хранилища."""
+        return StorageInputFile(self, key, filename=filename)
+
+    async def list_case_documents(self, case_id: int | str, suffix: str = ".docx") -> list[str]:
+        """
+        Имена документов дела, последние сверху.
+
+        В одном каталоге дела лежат документы разных видов (заявление,
+        список кредиторов, опись), поэтому по имени сортировать нельзя.
+        Порядок — по метке времени в имени (…_YYYYmmdd_HHMMSS), для имён
+        без метки — по времени изменения объекта.
+        """
+        objects = [o for o in await self.list(case_key(case_id, "")) if o.name.lower().endswith(suffix)]
+        objects.sort(key=lambda o: (document_timestamp(o.name) or o.mtime, o.name), reverse=True)
+        return [o.name for o in objects]
+
+
+class StorageInputFile(InputFile):
+    """Файл для отправки в Telegram, читаемый из DocumentStorage кусками."""
+
+    def __init__(
+        self,
+        storage: DocumentStorage,
+        key: str,
+        filename: Optional[str] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        super().__init__(filename=filename or key_filename(key), chunk_size=chunk_size)
+        self.storage = storage
+        self.key = key
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in self.storage.iter_chunks(self.key, self.chunk_size):
+            yield chunk
+
+
+# ========== Локальная файловая система ==========
+
+class LocalStorage(DocumentStorage):
+    """Хранилище в локальном каталоге (GENERATED_DIR)."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        """Путь к объекту на диске (с защитой от выхода за пределы root)."""
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _write(self, key: str, fileobj: BinaryIO) -> None:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as out:
+                shutil.copyfileobj(fileobj, out, DEFAULT_CHUNK_SIZE)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    async def save_stream(self, key: str, fileobj: BinaryIO) -> str:
+        await asyncio.to_thread(self._write, key, fileobj)
+        return key
+
+    async def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.path_for(key), "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                yield chunk
+        finally:
+            f.close()
+
+    def _list(self, prefix: str) -> list[StoredObject]:
+        base = self.path_for(prefix.rstrip("/")) if prefix.strip("/") else self.root
+        if not base.is_dir():
+            return []
+        out: list[StoredObject] = []
+        with os.scandir(base) as it:
+            for de in it:
+                if de.is_file() and not de.name.startswith("."):
+                    st = de.stat()
+                    rel = Path(de.path).relative_to(self.root).as_posix()
+                    out.append(StoredObject(key=rel, size=st.st_size, mtime=st.st_mtime))
+        return out
+
+    async def list(self, prefix: str) -> list[StoredObject]:
+        return await asyncio.to_thread(self._list, prefix)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            return self.path_for(key).is_file()
+        except ValueError:
+            return False
+
+    async def delete(self, key: str) -> None:
+        self.path_for(key).unlink(missing_ok=True)
+
+    def input_file(self, key: str, filename: Optional[str] = None) -> InputFile:
+        # aiogram сам читает файл с диска кусками
+        return FSInputFile(self.path_for(key), filename=filename)
+
+
+# ========== S3-совместимое хранилище (S3 / MinIO) ==========
+
+class S3Storage(DocumentStorage):
+    """
+    S3-совместимое хранилище.
+
+    Требует boto3 (опциональная зависимость). Клиент boto3 синхронный,
+    поэтому все вызовы уходят в поток; загрузка идёт через upload_fileobj
+    (multipart, кусками), выгрузка — через StreamingBody.iter_chunks().
+    """
+
+    def __init__(
+        self,
+        *,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        prefix: str = "",
+    ) -> None:
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 требует пакет boto3 (pip install boto3)") from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key or None,
+            aws_secret_access_key=secret_key or None,
+            region_name=region or None,
+        )
+        self._transfer = TransferConfig(
+            multipart_threshold=8 * 1024 * 1024,
+            multipart_chunksize=8 * 1024 * 1024,
+            max_concurrency=4,
+        )
+
+    def _full(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _strip(self, full_key: str) -> str:
+        return full_key[len(self.prefix) + 1:] if self.prefix else full_key
+
+    async def save_stream(self, key: str, fileobj: BinaryIO) -> str:
+        await asyncio.to_thread(
+            self._client.upload_fileobj, fileobj, self.bucket, self._full(key), Config=self._transfer
+        )
+        return key
+
+    async def iter_chunks(self, key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        resp = await asyncio.to_thread(self._client.get_object, Bucket=self.bucket, Key=self._full(key))
+        body = resp["Body"]
+        chunks = body.iter_chunks(chunk_size)
+        try:
+            while chunk := await asyncio.to_thread(next, chunks, b""):
+                yield chunk
+        finally:
+            body.close()
+
+    def _list(self, prefix: str) -> list[StoredObject]:
+        out: list[StoredObject] = []
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._full(prefix)):
+            for obj in page.get("Contents", []):
+                out.append(
+                    StoredObject(
+                        key=self._strip(obj["Key"]),
+                        size=int(obj["Size"]),
+                        mtime=obj["LastModified"].timestamp(),
+                    )
+                )
+        return out
+
+    async def list(self, prefix: str) -> list[StoredObject]:
+        return await asyncio.to_thread(self._list, prefix)
+
+    async def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await asyncio.to_thread(self._client.head_object, Bucket=self.bucket, Key=self._full(key))
+            return True
+        except ClientError:
+            return False
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._client.delete_object, Bucket=self.bucket, Key=self._full(key))
+
+
+# ========== Инициализация ==========
+
+_storage: Optional[DocumentStorage] = None
+
+
+def build_storage(settings: dict[str, Any]) -> DocumentStorage:
+    """Создать хранилище по настройкам load_settings()."""
+    backend = (settings.get("STORAGE_BACKEND") or "local").lower()
+    if backend == "local":
+        return LocalStorage(settings["GENERATED_DIR"])
+    if backend == "s3":
+        return S3Storage(
+            bucket=settings["S3_BUCKET"],
+            endpoint_url=settings.get("S3_ENDPOINT_URL"),
+            access_key=settings.get("S3_ACCESS_KEY"),
+            secret_key=settings.get("S3_SECRET_KEY"),
+            region=settings.get("S3_REGION"),
+            prefix=settings.get("S3_PREFIX") or "",
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND={backend!r}. Use local|s3")
+
+
+def init_storage(settings: dict[str, Any]) -> DocumentStorage:
+    """
+    Инициализировать хранилище документов.
+
+    Must be called once during bot startup before generators/handlers use get_storage().
+    """
+    global _storage
+    _storage = build_storage(settings)
+    logger.info(f"Document storage initialized: {type(_storage).__name__}")
+    return _storage
+
+
+def get_storage() -> DocumentStorage:
+    """
+    Текущее хранилище документов.
+
+    Raises:
+        RuntimeError: If init_storage() not called
+    """
+    if _storage is None:
+        raise RuntimeError("Document storage not initialized. Call init_storage() at startup.")
+    return _storage
@@ -0,0 +1,117 @@
+"""
+Потоковый вывод ответа модели в сообщение Telegram.
+
+Текст приходит фрагментами (gigachat_chat_stream) и показывается сразу:
+сначала отправляется сообщение-заглушка, затем оно редактируется по мере
+поступления текста. Редактирования идут не чаще TG_STREAM_EDIT_INTERVAL_SEC
+на сообщение (лимиты Telegram на edit в одном чате); при RetryAfter
+следующее редактирование откладывается на указанное Telegram время.
+Текст длиннее лимита сообщения продолжается в новом сообщении. Если поток
+обрывается (ошибка GigaChat, разомкнутый размыкатель), курсор убирается:
+остаётся полученный текст или пометка, что ответ не получен.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import time
+from typing import AsyncIterator
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+# по умолчанию; бот передаёт TG_STREAM_EDIT_INTERVAL_SEC из load_settings()
+STREAM_EDIT_INTERVAL = 1.5
+MESSAGE_LIMIT = 4096
+# признак, что текст ещё дописывается
+CURSOR = " ▌"
+# заглушка, если поток оборвался до первого фрагмента
+NO_ANSWER = "⚠️ Ответ не получен."
+
+
+def _cut(text: str, limit: int) -> int:
+    """Где разрезать текст длиннее limit: по последнему переводу строки, если есть."""
+    pos = text.rfind("\n", 0, limit)
+    return pos + 1 if pos > limit // 2 else limit
+
+
+class _StreamedMessage:
+    def __init__(self, message: Message, interval: float, *, fresh: bool = False) -> None:
+        self.message = message
+        self.interval = interval
+        self.shown = message.text or ""
+        # только что отправленное с текстом сообщение не редактируем сразу
+        self.next_edit = time.monotonic() + interval if fresh else 0.0
+
+    async def edit(self, text: str, *, force: bool = False) -> None:
+        if text == self.shown:
+            return
+        now = time.monotonic()
+        if not force and now < self.next_edit:
+            return
+        while True:
+            try:
+                await self.message.edit_text(text)
+                break
+            except TelegramRetryAfter as e:
+                if not force:
+                    self.next_edit = time.monotonic() + e.retry_after
+                    return
+                # финальный текст должен дойти — ждём, сколько просит Telegram
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e).lower():
+                    raise
+                break
+        self.shown = text
+        self.next_edit = time.monotonic() + self.interval
+
+
+async def stream_to_message(
+    message: Message,
+    chunks: AsyncIterator[str],
+    *,
+    placeholder: str,
+    interval: float = STREAM_EDIT_INTERVAL,
+    limit: int = MESSAGE_LIMIT,
+) -> str:
+    """
+    Показывать поток текста в чате, редактируя сообщение по мере генерации.
+
+    Args:
+        message: Сообщение пользователя (ответ отправляется в его чат)
+        chunks: Фрагменты текста
+        placeholder: Текст заглушки до первого фрагмента
+        interval: Минимальная пауза между редактированиями одного сообщения
+        limit: Максимальная длина сообщения
+
+    Returns:
+        Полный текст ответа (strip)
+    """
+    current = _StreamedMessage(await message.answer(placeholder), interval)
+    text = ""
+    offset = 0  # начало текста текущего сообщения
+    try:
+        async for piece in chunks:
+            text += piece
+            tail = text[offset:].lstrip()
+            offset += len(text[offset:]) - len(tail)
+            while len(tail) + len(CURSOR) > limit:
+                cut = _cut(tail, limit)
+                await current.edit(tail[:cut].rstrip() or tail[:cut], force=True)
+                offset += cut
+                tail = text[offset:]
+                sent = await message.answer(tail[:limit - len(CURSOR)] + CURSOR)
+                current = _StreamedMessage(sent, interval, fresh=True)
+            if tail:
+                await current.edit(tail + CURSOR)
+    except BaseException:
+        # сообщение не должно остаться «дописывающимся»; ошибку покажет вызывающий
+        with contextlib.suppress(Exception):
+            await current.edit(text[offset:].strip()[:limit] or NO_ANSWER, force=True)
+        raise
+
+    tail = text[offset:].strip()
+    if tail:
+        await current.edit(tail, force=True)
+    return text.strip()
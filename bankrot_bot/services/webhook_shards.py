@@ -0,0 +1,292 @@
+"""
+Шардирование апдейтов вебхука по пользователю.
+
+В режиме WEBHOOK_SHARDS > 0 приём и обработка апдейтов разделены:
+- web.py (uvicorn с любым числом воркеров) проверяет апдейт и кладёт его
+  в Redis-список шарда tg:updates:<shard>, shard = crc32(user_id) % WEBHOOK_SHARDS;
+- процессы бота (TELEGRAM_MODE=webhook) забирают апдейты своих шардов
+  (WEBHOOK_SHARD) и передают их в Dispatcher.
+
+Апдейт не теряется, если процесс бота упал: BLMOVE переносит его из очереди
+в список tg:processing:<shard>, а оттуда он удаляется (LREM) только после
+feed_update. При старте воркер возвращает оставшееся в processing в начало
+очереди шарда — такие апдейты обрабатываются повторно (at-least-once).
+Поэтому каждый шард должен обслуживать ровно один процесс.
+
+Все апдейты одного пользователя попадают в один шард, а значит в один
+процесс — FSM без гонок между процессами, и in-process кэш FSM корректен.
+Внутри процесса апдейты разных пользователей обрабатываются параллельно,
+одного пользователя — строго по очереди (UserSerialExecutor).
+
+Смена WEBHOOK_SHARDS перераспределяет пользователей: менять при остановленных
+воркерах и пустых очередях.
+
+Без шардов web.py сам обрабатывает апдейты, но тоже не в HTTP-запросе:
+UpdateQueue — ограниченная очередь в процессе с пулом обработчиков; ответ
+Telegram уходит сразу после постановки в очередь.
+
+Обе очереди ограничены WEBHOOK_QUEUE_MAX: при переполнении web.py отвечает
+503, и Telegram повторит доставку позже.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import zlib
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bankrot_bot.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PREFIX = "tg:updates:"
+PROCESSING_PREFIX = "tg:processing:"
+
+QUEUE_DEPTH = Gauge("webhook_queue_depth", "Updates waiting in the webhook queue", ("queue",))
+IN_PROGRESS = Gauge("webhook_updates_in_progress", "Updates being processed by the in-process queue workers")
+UPDATES = Counter("webhook_updates_total", "Webhook updates by outcome (accepted, rejected)", ("outcome",))
+
+
+def update_owner_id(update: Update) -> int:
+    """Пользователь апдейта (для апдейтов без пользователя — чат или update_id)."""
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is None and getattr(event, "message", None) is not None:
+        chat = event.message.chat
+    return chat.id if chat is not None else update.update_id
+
+
+def shard_for(owner_id: int, shards: int) -> int:
+    """Номер шарда; crc32, а не hash(): одинаков во всех процессах."""
+    return zlib.crc32(str(owner_id).encode()) % shards
+
+
+def parse_shards(raw: str, shards: int) -> list[int]:
+    """WEBHOOK_SHARD ("0", "0,2", пусто — все) -> номера шардов."""
+    if not raw.strip():
+        return list(range(shards))
+    indexes = sorted({int(part) for part in raw.split(",") if part.strip()})
+    if any(not 0 <= i < shards for i in indexes):
+        raise ValueError(f"WEBHOOK_SHARD={raw!r} вне диапазона 0..{shards - 1}")
+    return indexes
+
+
+class UserSerialExecutor:
+    """
+    Параллельно по пользователям, последовательно для одного пользователя.
+
+    submit() ставит задачу за предыдущей задачей того же пользователя;
+    одновременно выполняется не больше concurrency задач, а принятых,
+    но не завершённых — не больше max_pending (submit ждёт места).
+    """
+
+    def __init__(self, concurrency: int = 16, max_pending: Optional[int] = None) -> None:
+        self._running = asyncio.Semaphore(concurrency)
+        self._pending = asyncio.Semaphore(max_pending or concurrency * 4)
+        self._tails: dict[int, asyncio.Task] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, owner_id: int, job: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        await self._pending.acquire()
+        previous = self._tails.get(owner_id)
+        task = asyncio.create_task(self._run(previous, job))
+        self._tails[owner_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._done(owner_id, t))
+        return task
+
+    def _done(self, owner_id: int, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._tails.get(owner_id) is task:
+            del self._tails[owner_id]
+        self._pending.release()
+
+    async def _run(self, previous: Optional[asyncio.Task], job: Callable[[], Awaitable[Any]]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._running:
+            try:
+                await job()
+            except Exception:
+                logger.exception("Update processing failed")
+
+    async def drain(self) -> None:
+        """Дождаться всех принятых задач."""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+
+class ShardPublisher:
+    """Сторона web.py: апдейт -> Redis-список его шарда."""
+
+    def __init__(self, redis: Any, shards: int, max_len: int = 0) -> None:
+        self.redis = redis
+        self.shards = shards
+        self.max_len = max_len
+
+    async def publish(self, update: Update, raw: bytes) -> Optional[int]:
+        """
+        Положить апдейт (исходный JSON raw) в очередь шарда.
+
+        Returns:
+            Номер шарда или None, если очередь шарда заполнена (max_len;
+            проверка по LLEN, граница приблизительная при параллельных вызовах)
+        """
+        shard = shard_for(update_owner_id(update), self.shards)
+        key = f"{QUEUE_PREFIX}{shard}"
+        if self.max_len and await self.redis.llen(key) >= self.max_len:
+            UPDATES.inc(outcome="rejected")
+            return None
+        depth = await self.redis.rpush(key, raw)
+        QUEUE_DEPTH.set(depth, queue=f"shard-{shard}")
+        UPDATES.inc(outcome="accepted")
+        return shard
+
+
+class UpdateQueue:
+    """
+    Очередь апдейтов в процессе web.py (режим без шардов).
+
+    offer() не ждёт: апдейт либо принят, либо очередь полна. Один потребитель
+    раздаёт апдейты в UserSerialExecutor — порядок для пользователя сохраняется.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, *, maxsize: int = 1000, concurrency: int = 16) -> None:
+        self.dp = dp
+        self.bot = bot
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize)
+        self.executor = UserSerialExecutor(concurrency)
+        self._consumer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+    def offer(self, update: Update) -> bool:
+        """Поставить апдейт в очередь; False — очередь заполнена."""
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            UPDATES.inc(outcome="rejected")
+            return False
+        UPDATES.inc(outcome="accepted")
+        QUEUE_DEPTH.set(self.queue.qsize(), queue="local")
+        return True
+
+    async def _consume(self) -> None:
+        while True:
+            update = await self.queue.get()
+            QUEUE_DEPTH.set(self.queue.qsize(), queue="local")
+            await self.executor.submit(update_owner_id(update), lambda u=update: self._process(u))
+
+    async def _process(self, update: Update) -> None:
+        IN_PROGRESS.inc()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        finally:
+            IN_PROGRESS.dec()
+
+    async def stop(self) -> None:
+        """Дообработать принятые апдейты и остановить потребителя."""
+        while not self.queue.empty() and self._consumer is not None and not self._consumer.done():
+            await asyncio.sleep(0.05)
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+        await self.executor.drain()
+
+
+async def requeue_unfinished(redis: Any, shard: int) -> int:
+    """
+    Вернуть в начало очереди шарда апдейты, взятые, но не обработанные до конца.
+
+    Порядок сохраняется: из processing берётся самый новый и кладётся в
+    голову очереди, так что самый старый оказывается первым.
+
+    Returns:
+        Сколько апдейтов возвращено
+    """
+    moved = 0
+    while await redis.lmove(f"{PROCESSING_PREFIX}{shard}", f"{QUEUE_PREFIX}{shard}", "RIGHT", "LEFT") is not None:
+        moved += 1
+    return moved
+
+
+async def _process_claimed(redis: Any, processing: str, raw: bytes, update: Update, dp: Dispatcher, bot: Bot) -> None:
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        logger.exception("Update processing failed")
+    # при отмене (остановка процесса) апдейт остаётся в processing и вернётся в очередь при старте
+    await redis.lrem(processing, 1, raw)
+
+
+async def _read_shard(
+    redis: Any,
+    shard: int,
+    executor: UserSerialExecutor,
+    dp: Dispatcher,
+    bot: Bot,
+    poll_timeout: int,
+) -> None:
+    queue, processing = f"{QUEUE_PREFIX}{shard}", f"{PROCESSING_PREFIX}{shard}"
+    while True:
+        raw = await redis.blmove(queue, processing, poll_timeout, "LEFT", "RIGHT")
+        if raw is None:
+            continue
+        try:
+            update = Update.model_validate_json(raw)
+        except ValueError as e:
+            logger.error(f"Dropping malformed update from {queue}: {e}")
+            await redis.lrem(processing, 1, raw)
+            continue
+        await executor.submit(
+            update_owner_id(update),
+            lambda u=update, r=raw: _process_claimed(redis, processing, r, u, dp, bot),
+        )
+
+
+async def run_shard_worker(
+    redis: Any,
+    shards: list[int],
+    dp: Dispatcher,
+    bot: Bot,
+    *,
+    concurrency: int = 16,
+    poll_timeout: int = 5,
+) -> None:
+    """
+    Обрабатывать апдейты шардов shards до отмены задачи.
+
+    На каждый шард — свой цикл BLMOVE (порядок внутри шарда сохраняется),
+    обработка идёт в общем UserSerialExecutor: параллельно по пользователям,
+    по порядку для одного пользователя. Перед стартом возвращает в очередь
+    апдейты, оставшиеся в processing после прошлого запуска.
+    """
+    for shard in shards:
+        moved = await requeue_unfinished(redis, shard)
+        if moved:
+            logger.warning(f"Shard {shard}: requeued {moved} unfinished update(s)")
+
+    executor = UserSerialExecutor(concurrency)
+    logger.info(f"Webhook shard worker started: shards {shards}")
+    readers = [
+        asyncio.create_task(_read_shard(redis, shard, executor, dp, bot, poll_timeout)) for shard in shards
+    ]
+    try:
+        await asyncio.gather(*readers)
+    finally:
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await executor.drain()
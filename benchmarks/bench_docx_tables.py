@@ -0,0 +1,101 @@
+"""
+Бенчмарк заполнения таблиц форм (docx_forms).
+
+Сравнивает прежний способ (table.add_row() + копирование шрифта через
+python-docx на каждую строку) с клонированием строки-образца <w:tr>
+(fill_table_rows) на 10/100/1000 строк.
+
+Запуск из корня репозитория (БД не нужна):
+    python benchmarks/bench_docx_tables.py [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from docx import Document  # noqa: E402
+from docx.table import Table  # noqa: E402
+
+from bankrot_bot.services.docx_forms import (  # noqa: E402
+    find_table_by_text,
+    find_template_row_index,
+    replace_table_rows,
+    set_cell_text,
+)
+from bankrot_bot.services.docx_output import save_document  # noqa: E402
+
+TEMPLATE = ROOT / "templates/forms/creditors_list_template.docx"
+SIZES = (10, 100, 1000)
+
+
+def _rows(n: int) -> list[list[str]]:
+    return [
+        [str(i), f"ООО «Кредитор {i}»", f"Договор № {i} от 01.01.2024", f"{i * 1000:.2f}", "RUB"]
+        for i in range(1, n + 1)
+    ]
+
+
+def legacy_fill(table: Table, rows: list[list[str]]) -> None:
+    """Прежняя реализация: add_row() и перенос шрифта через прокси python-docx."""
+    template_row = table.rows[find_template_row_index(table)]
+    while len(table.rows) > 1:
+        table._element.remove(table.rows[-1]._element)
+    for values in rows:
+        new_row = table.add_row()
+        for idx, cell in enumerate(new_row.cells):
+            if idx < len(values):
+                set_cell_text(cell, values[idx])
+                if idx < len(template_row.cells):
+                    t_cell = template_row.cells[idx]
+                    if t_cell.paragraphs and t_cell.paragraphs[0].runs:
+                        t_run = t_cell.paragraphs[0].runs[0]
+                        if cell.paragraphs and cell.paragraphs[0].runs:
+                            run = cell.paragraphs[0].runs[0]
+                            run.font.size = t_run.font.size
+                            run.font.name = t_run.font.name
+
+
+def clone_fill(table: Table, rows: list[list[str]]) -> None:
+    replace_table_rows(table, rows)
+
+
+def _measure(fill: Callable[[Table, list[list[str]]], None], n: int, repeat: int) -> tuple[float, float, int]:
+    fill_times, total_times = [], []
+    size = 0
+    rows = _rows(n)
+    for _ in range(repeat):
+        doc = Document(str(TEMPLATE))
+        table = find_table_by_text(doc, "Сведения о кредиторах")
+        t0 = time.perf_counter()
+        fill(table, rows)
+        t1 = time.perf_counter()
+        with save_document(doc) as out:
+            out.seek(0, 2)
+            size = out.tell()
+        t2 = time.perf_counter()
+        fill_times.append(t1 - t0)
+        total_times.append(t2 - t0)
+    return statistics.median(fill_times), statistics.median(total_times), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="docx_forms: add_row vs клонирование <w:tr>")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'method':>8} {'fill, ms':>10} {'fill+save, ms':>14} {'size, KB':>9}")
+    for n in SIZES:
+        for name, fill in (("legacy", legacy_fill), ("clone", clone_fill)):
+            fill_t, total_t, size = _measure(fill, n, args.repeat)
+            print(f"{n:>6} {name:>8} {fill_t * 1000:>10.1f} {total_t * 1000:>14.1f} {size / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Бенчмарк обращений FSM к Redis (fsm_storage).
+
+Прогоняет через aiogram Dispatcher анкету ходатайства в том виде, в каком
+её ведёт bot.py (start_flow / ответы на шаги / cancel_flow), и считает
+запросы к Redis для RedisStorage и CachedRedisStorage. Redis — заглушка в
+памяти: MULTI/EXEC пайплайна считается одним запросом.
+
+Запуск из корня репозитория (Redis и БД не нужны):
+    python benchmarks/bench_fsm_redis.py [--users 1]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.filters import StateFilter  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.state import State, StatesGroup  # noqa: E402
+from aiogram.fsm.storage.redis import RedisStorage  # noqa: E402
+from aiogram.types import Message, Update  # noqa: E402
+
+from bankrot_bot.services.fsm_storage import CachedRedisStorage  # noqa: E402
+
+FLOW_KEY = "flow"
+STEPS = ("fio", "case_number", "court", "judge", "reason")
+# меню, выбор ходатайства, тип суда, ответы на шаги, снова меню
+SCRIPT = ("menu", "motion", "arbitr", *(f"answer {i}" for i in range(len(STEPS))), "menu")
+
+
+class CountingRedis:
+    """Заглушка redis.asyncio: GET/SET/DELETE и пайплайн; calls — число запросов."""
+
+    def __init__(self) -> None:
+        self.values: dict[str, Any] = {}
+        self.calls = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        self.calls += 1
+        return self.values.get(key)
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None) -> None:
+        self.calls += 1
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    async def delete(self, *keys: str) -> None:
+        self.calls += 1
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction: bool = True) -> "_Pipeline":
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, redis: CountingRedis) -> None:
+        self.redis = redis
+        self.ops: list[tuple[str, tuple]] = []
+
+    async def __aenter__(self) -> "_Pipeline":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None) -> None:
+        self.ops.append(("set", (key, value)))
+
+    def delete(self, *keys: str) -> None:
+        self.ops.append(("delete", keys))
+
+    async def execute(self) -> list:
+        self.redis.calls += 1
+        for op, args in self.ops:
+            if op == "set":
+                key, value = args
+                self.redis.values[key] = value.encode() if isinstance(value, str) else value
+            else:
+                for key in args:
+                    self.redis.values.pop(key, None)
+        self.ops = []
+        return []
+
+
+class Motion(StatesGroup):
+    court_type = State()
+    answers = State()
+
+
+async def start_flow(state: FSMContext, flow_state: State, **flow: Any) -> None:
+    await state.set_state(flow_state)
+    await state.update_data({FLOW_KEY: {"step": 0, "answers": {}, **flow}})
+
+
+async def cancel_flow(state: FSMContext) -> None:
+    if await state.get_state() in {Motion.court_type.state, Motion.answers.state}:
+        await state.set_state(None)
+    data = await state.get_data()
+    if FLOW_KEY in data:
+        data.pop(FLOW_KEY)
+        await state.set_data(data)
+
+
+def build_dispatcher(storage: RedisStorage) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+
+    @dp.message(F.text == "motion")
+    async def motion(message: Message, state: FSMContext) -> None:
+        await start_flow(state, Motion.court_type)
+
+    @dp.message(StateFilter(Motion.court_type))
+    async def court_type(message: Message, state: FSMContext) -> None:
+        await start_flow(state, Motion.answers, court_type=message.text)
+
+    @dp.message(StateFilter(Motion.answers))
+    async def answer(message: Message, state: FSMContext) -> None:
+        flow = (await state.get_data()).get(FLOW_KEY) or {"step": 0, "answers": {}}
+        step = int(flow["step"])
+        flow["answers"][STEPS[step]] = message.text
+        flow["step"] = step + 1
+        await state.update_data({FLOW_KEY: flow})
+        if step + 1 == len(STEPS):
+            await cancel_flow(state)
+
+    @dp.message()
+    async def menu(message: Message, state: FSMContext) -> None:
+        await state.get_data()
+
+    return dp
+
+
+def _update(update_id: int, user_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+            "text": text,
+        },
+    })
+
+
+async def count_round_trips(storage_cls: type[RedisStorage], users: int = 1, **kwargs: Any) -> tuple[int, int]:
+    """Прогнать SCRIPT для users пользователей; (запросов к Redis, апдейтов)."""
+    redis = CountingRedis()
+    dp = build_dispatcher(storage_cls(redis, **kwargs))
+    bot = Bot("42:TEST")
+    update_id = 0
+    for user_id in range(1, users + 1):
+        for text in SCRIPT:
+            update_id += 1
+            await dp.feed_update(bot, _update(update_id, user_id, text))
+    await bot.session.close()
+    return redis.calls, update_id
+
+
+async def _main(users: int) -> None:
+    print(f"{'storage':>20} {'updates':>8} {'redis calls':>12} {'per update':>11}")
+    for name, cls, kwargs in (
+        ("RedisStorage", RedisStorage, {}),
+        ("CachedRedisStorage", CachedRedisStorage, {"cache_ttl": 5.0}),
+    ):
+        calls, updates = await count_round_trips(cls, users, **kwargs)
+        print(f"{name:>20} {updates:>8} {calls:>12} {calls / updates:>11.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FSM: запросы к Redis без кэша и с кэшем в процессе")
+    parser.add_argument("--users", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(_main(args.users))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Бенчмарк генераторов документов.
+
+Генераторы:
+    build_bankruptcy_petition_doc — заявление через docs_builder (с записью в хранилище)
+    generate_petition_jinja       — заявление через handlers/docs.py
+    render_creditors_list         — список кредиторов и должников
+    render_inventory              — опись имущества
+
+Для заявлений кэш инкрементального рендера сбрасывается перед каждым
+прогоном — меряется полный рендер.
+
+Синтетические дела с 1/100/1000 кредиторов (и столько же должников и
+единиц имущества) заводятся в SQLite-копии обеих баз: SQLAlchemy
+(case_parties, case_assets) и legacy sqlite (cases, case_cards). Вместо
+SQLite можно указать Postgres через --database-url.
+
+Каждый сценарий (генератор × размер) выполняется в отдельном процессе,
+поэтому пиковый RSS относится только к нему. Выводятся p50/p95 времени,
+пиковый RSS и размер документа.
+
+Базовая линия хранится в benchmarks/baseline_generators.json:
+    python benchmarks/bench_generators.py --save-baseline
+    python benchmarks/bench_generators.py --compare [--tolerance 0.25]
+При --compare код выхода 1, если p50 или пиковый RSS хуже базовой линии
+больше чем на tolerance.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_generators.py [--repeat 20] [--sizes 1,100,1000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BASELINE = ROOT / "benchmarks/baseline_generators.json"
+GENERATORS = (
+    "build_bankruptcy_petition_doc",
+    "generate_petition_jinja",
+    "render_creditors_list",
+    "render_inventory",
+)
+SIZES = (1, 100, 1000)
+OWNER_ID = 900_000
+# номера дел бенчмарка не пересекаются с реальными (на случай Postgres)
+CASE_ID_BASE = 900_000
+
+
+def _case_id(size: int) -> int:
+    return CASE_ID_BASE + size
+
+
+def _card(size: int) -> dict[str, Any]:
+    return {
+        "court_name": "Арбитражный суд города Москвы",
+        "court_address": "115225, г. Москва, ул. Большая Тульская, д. 17",
+        "debtor_full_name": "Иванова Мария Петровна",
+        "debtor_last_name": "Иванова",
+        "debtor_first_name": "Мария",
+        "debtor_middle_name": "Петровна",
+        "debtor_gender": "female",
+        "debtor_birth_date": "01.02.1985",
+        "debtor_address": "г. Москва, ул. Ленина, д. 1, кв. 2",
+        "debtor_inn": "771234567890",
+        "debtor_snils": "123-456-789 01",
+        "passport_series": "45 12",
+        "passport_number": "123456",
+        "passport_issued_by": "ОВД района Арбат г. Москвы",
+        "passport_date": "10.03.2005",
+        "passport_code": "770-001",
+        "marital_status": "married",
+        "spouse_full_name": "Иванов Иван Иванович",
+        "total_debt_rubles": str(size * 1000),
+        "total_debt_kopeks": "00",
+        "creditors": [
+            {"name": f"ООО «Кредитор {i}»", "debt_rubles": str(i * 1000), "debt_kopeks": "50"}
+            for i in range(1, size + 1)
+        ],
+    }
+
+
+# ========== Подготовка данных ==========
+
+def _seed_legacy(db_path: str) -> None:
+    with sqlite3.connect(db_path) as con:
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS cases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_user_id INTEGER NOT NULL,
+            code_name TEXT NOT NULL,
+            case_number TEXT,
+            court TEXT,
+            judge TEXT,
+            fin_manager TEXT,
+            stage TEXT,
+            notes TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        """)
+        con.execute("""
+        CREATE TABLE IF NOT EXISTS case_cards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_user_id INTEGER NOT NULL,
+            case_id INTEGER NOT NULL,
+            data TEXT,
+            court_name TEXT,
+            court_address TEXT,
+            judge_name TEXT,
+            debtor_full_name TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(owner_user_id, case_id)
+        );
+        """)
+        for size in SIZES:
+            cid = _case_id(size)
+            con.execute(
+                "INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cid, OWNER_ID, f"bench-{size}", "А40-1/2026", "Арбитражный суд г. Москвы",
+                 "Судья", "Петров П.П.", "draft", None, "2026-01-01", "2026-01-01"),
+            )
+            con.execute(
+                "INSERT OR REPLACE INTO case_cards (owner_user_id, case_id, data) VALUES (?, ?, ?)",
+                (OWNER_ID, cid, json.dumps(_card(size), ensure_ascii=False)),
+            )
+
+
+async def _seed_orm() -> None:
+    from sqlalchemy import delete
+
+    from bankrot_bot.database import Base, engine, get_session
+    from bankrot_bot.models import Case, CaseAsset, CaseParty
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with get_session() as session:
+        ids = [_case_id(s) for s in SIZES]
+        await session.execute(delete(CaseParty).where(CaseParty.case_id.in_(ids)))
+        await session.execute(delete(CaseAsset).where(CaseAsset.case_id.in_(ids)))
+        await session.execute(delete(Case).where(Case.id.in_(ids)))
+        for size in SIZES:
+            cid = _case_id(size)
+            session.add(Case(id=cid, user_id=OWNER_ID, debtor_name="Иванова Мария Петровна",
+                             debtor_inn="771234567890", case_number="А40-1/2026",
+                             court="Арбитражный суд г. Москвы", manager_name="Петров П.П."))
+            await session.flush()
+            for i in range(1, size + 1):
+                session.add(CaseParty(case_id=cid, role="creditor", name=f"ООО «Кредитор {i}»",
+                                      basis=f"Кредитный договор № {i} от 01.01.2024",
+                                      amount=Decimal(i * 1000) + Decimal("0.50"), currency="RUB"))
+                session.add(CaseParty(case_id=cid, role="debtor", name=f"Должник {i}",
+                                      basis=f"Расписка № {i}", amount=Decimal(i * 100), currency="RUB"))
+                session.add(CaseAsset(case_id=cid, kind="Недвижимость" if i % 2 else "Транспорт",
+                                      description=f"Объект {i}, кадастровый № 77:01:0001001:{i}",
+                                      qty_or_area=f"{i}.5 кв.м", value=Decimal(i * 10000)))
+    await engine.dispose()
+
+
+# ========== Сценарий (в отдельном процессе) ==========
+
+async def _run_once(generator: str, cid: int, storage: Any) -> int:
+    from bankrot_bot.services.cases_db import get_case, get_case_card
+    from bankrot_bot.services.docx_incremental import forget_render
+
+    forget_render((OWNER_ID, cid))
+
+    if generator == "build_bankruptcy_petition_doc":
+        from bankrot_bot.services.docs_builder import build_bankruptcy_petition_doc
+
+        key = await build_bankruptcy_petition_doc(get_case(OWNER_ID, cid), get_case_card(OWNER_ID, cid))
+        size = storage.path_for(key).stat().st_size
+        await storage.delete(key)
+        return size
+
+    if generator == "generate_petition_jinja":
+        from bankrot_bot.database import get_session
+        from bankrot_bot.services.docx_jinja import generate_petition_jinja
+
+        async with get_session() as session:
+            rendered, _ = await generate_petition_jinja(session, cid, OWNER_ID)
+    elif generator == "render_creditors_list":
+        from bankrot_bot.services.docx_forms import render_creditors_list
+
+        rendered = await render_creditors_list(cid)
+    elif generator == "render_inventory":
+        from bankrot_bot.services.docx_forms import render_inventory
+
+        rendered = await render_inventory(cid)
+    else:
+        raise ValueError(f"Unknown generator: {generator}")
+
+    with rendered:
+        rendered.seek(0, 2)
+        return rendered.tell()
+
+
+def _scenario(generator: str, size: int, repeat: int, legacy_db: str, out_dir: str) -> dict[str, Any]:
+    from bankrot_bot.services.cases_db import init_cases_db
+    from bankrot_bot.services.storage import init_storage
+
+    init_cases_db(legacy_db)
+    storage = init_storage({"STORAGE_BACKEND": "local", "GENERATED_DIR": out_dir})
+    cid = _case_id(size)
+
+    async def run() -> tuple[list[float], int]:
+        output_size = await _run_once(generator, cid, storage)  # прогрев: импорт, компиляция шаблонов
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            output_size = await _run_once(generator, cid, storage)
+            times.append(time.perf_counter() - t0)
+        from bankrot_bot.database import engine
+
+        await engine.dispose()
+        return times, output_size
+
+    times, output_size = asyncio.run(run())
+    p50 = statistics.median(times)
+    p95 = statistics.quantiles(times, n=20, method="inclusive")[-1] if len(times) > 1 else times[0]
+    return {
+        "p50_ms": round(p50 * 1000, 2),
+        "p95_ms": round(p95 * 1000, 2),
+        # ru_maxrss на Linux — в КБ
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "output_kb": round(output_size / 1024, 1),
+    }
+
+
+# ========== Отчёт и базовая линия ==========
+
+def _compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "peak_rss_mb"):
+            if base.get(metric) and cur[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]} -> {cur[metric]}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк генераторов документов")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    parser.add_argument("--generators", default=",".join(GENERATORS))
+    parser.add_argument("--database-url", help="SQLAlchemy URL (по умолчанию временная SQLite)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    unknown_sizes = set(sizes) - set(SIZES)
+    if unknown_sizes:
+        parser.error(f"sizes: only {SIZES} are seeded")
+    generators = [g for g in args.generators.split(",") if g]
+
+    workdir = tempfile.mkdtemp(prefix="bench_generators_")
+    # переменная читается bankrot_bot.database при импорте — в т.ч. в дочерних процессах
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    legacy_db = os.path.join(workdir, "legacy.db")
+    out_dir = os.path.join(workdir, "generated")
+
+    os.chdir(ROOT)  # пути шаблонов относительные
+    _seed_legacy(legacy_db)
+    asyncio.run(_seed_orm())
+
+    ctx = multiprocessing.get_context("spawn")
+    results: dict[str, dict] = {}
+    print(f"{'generator':<30} {'size':>5} {'p50, ms':>9} {'p95, ms':>9} {'RSS, MB':>8} {'out, KB':>8}")
+    for generator in generators:
+        for size in sizes:
+            with ctx.Pool(1) as pool:
+                r = pool.apply(_scenario, (generator, size, args.repeat, legacy_db, out_dir))
+            results[f"{generator}/{size}"] = r
+            print(f"{generator:<30} {size:>5} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+                  f"{r['peak_rss_mb']:>8.1f} {r['output_kb']:>8.1f}")
+
+    if args.save_baseline:
+        baseline = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        BASELINE.write_text(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved: {BASELINE.relative_to(ROOT)}")
+
+    if args.compare:
+        if not BASELINE.exists():
+            sys.exit(f"No baseline: {BASELINE.relative_to(ROOT)}")
+        baseline = json.loads(BASELINE.read_text(encoding="utf-8"))["results"]
+        regressions = _compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"No regressions (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,27 +3,28 @@ import json
 import logging
 import os
 import sqlite3
+import tempfile
 import time
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 load_dotenv()
 
 from bankrot_bot.logging_setup import setup_logging
-#from bankrot_bot.services.gigachat import gigachat_chat
+from bankrot_bot.services.gigachat import (
+    GigaChatUnavailable,
+    gigachat_chat_stream,
+    init_gigachat,
+    shutdown_gigachat,
+)
+from bankrot_bot.services.tg_stream import stream_to_message
 
 logger = logging.getLogger(__name__)
 
 
-from bankrot_bot.services.blocks import (
-    build_creditors_header_block,
-    build_creditors_block,
-    sum_creditors_total,
-    build_vehicle_block,
-    build_attachments_list,
-)
+from bankrot_bot.services.docs_builder import build_bankruptcy_petition_doc
 from bankrot_bot.services.public_docs import (
     get_categories,
     get_docs_in_category,
@@ -35,12 +36,11 @@ from bankrot_bot.services.case_financials import (
     add_case_party,
     delete_case_party,
     calculate_parties_totals,
-    format_parties_for_doc,
     get_case_assets,
     add_case_asset,
     delete_case_asset,
     calculate_assets_total,
-    parse_amount_input,
+    parse_amount_kopeks,
     normalize_amount_to_string,
     string_to_decimal,
 )
@@ -48,6 +48,40 @@ from bankrot_bot.services.docx_forms import (
     render_creditors_list,
     render_inventory,
 )
+from bankrot_bot.services.storage import (
+    case_key,
+    get_storage,
+    init_storage,
+    key_filename,
+    LocalStorage,
+)
+from bankrot_bot.services.pdf_export import (
+    PdfConversionError,
+    export_pdf,
+    get_pdf_pool,
+    init_pdf_export,
+    pdf_filename,
+    shutdown_pdf_export,
+)
+from bankrot_bot.services.render_pool import (
+    init_render_pool,
+    render_pool_size,
+    render_text_to_file,
+    run_in_render_pool,
+    shutdown_render_pool,
+)
+from bankrot_bot.services.result_store import ResultTooLarge, get_result_store, init_result_store
+from bankrot_bot.services.batch_docs import parse_case_selection, run_batch
+from bankrot_bot.services.docx_jinja import PETITION_TEMPLATE
+from bankrot_bot.services.docx_incremental import init_render_cache
+from bankrot_bot.services.docx_output import DocumentInputFile, init_docx_output
+from bankrot_bot.services.money import AMOUNT_KEY, creditor_kopeks, split as split_kopeks
+from bankrot_bot.services.retention import (
+    RetentionPolicy,
+    apply_retention,
+    format_report,
+    retention_loop,
+)
 
 import aiohttp
 setup_logging()
@@ -55,10 +89,10 @@ from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, CommandStart, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import CallbackQuery, FSInputFile, BufferedInputFile, Message, InlineKeyboardMarkup, ReplyKeyboardMarkup
+from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, ReplyKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from docx import Document
 from bankrot_bot.config import load_settings
+from bankrot_bot.metrics import start_metrics_server
 
 # Database and handlers
 from bankrot_bot.database import init_db as init_pg_db
@@ -128,700 +162,32 @@ class AddAsset(StatesGroup):
     description = State()
     value = State()
 
+class MotionFlow(StatesGroup):
+    """Анкета ходатайства (GigaChat)."""
+    court_type = State()
+    answers = State()
+
+class SettlementFlow(StatesGroup):
+    """Анкета мирового соглашения (GigaChat)."""
+    answers = State()
+
 # =========================
 # env
 # =========================
 
 
-def build_gender_forms(gender: str | None) -> dict:
-    """
-    Возвращает слова в нужном роде для плейсхолдеров шаблона:
-    {{debtor_having_word}}, {{debtor_registered_word}}, {{debtor_living_word}},
-    {{debtor_not_registered_word}}, {{debtor_insolvent_word}}
-    """
-    g = (gender or "").strip().lower()
-    if g == "female":
-        return {
-            "debtor_having_word": "имеющая",
-            "debtor_registered_word": "зарегистрированная",
-            "debtor_living_word": "проживающая",
-            "debtor_not_registered_word": "не зарегистрирована",
-            "debtor_insolvent_word": "несостоятельной",
-        }
-    # по умолчанию male
-    return {
-        "debtor_having_word": "имеющий",
-        "debtor_registered_word": "зарегистрированный",
-        "debtor_living_word": "проживающий",
-        "debtor_not_registered_word": "не зарегистрирован",
-        "debtor_insolvent_word": "несостоятельным",
-    }
-
-
-def build_debtor_last_name_initials(card: dict) -> str:
-    """
-    Из 'Иванов Иван Иванович' делает 'Иванов И. И.'
-    Если ФИО пустое/неполное — возвращает как есть.
-    """
-    full_name = (card.get("debtor_full_name") or "").strip()
-    parts = [p for p in full_name.split() if p]
-    if len(parts) >= 2:
-        last = parts[0]
-        first_i = parts[1][0].upper() + "."
-        patro_i = (parts[2][0].upper() + ".") if len(parts) >= 3 and parts[2] else ""
-        return (last + " " + first_i + (" " + patro_i if patro_i else "")).strip()
-    return full_name
-
-
-def build_family_status_block(card: dict) -> str:
-    """
-    Возвращает текстовый блок о семейном положении/детях для {{family_status_block}}.
-    Поля ожидаются: marital_status, spouse_full_name, has_minor_children, children_count,
-    marriage_certificate_number, marriage_certificate_date
-    """
-    marital_status = (card.get("marital_status") or "").strip()
-    spouse_full_name = (card.get("spouse_full_name") or "").strip()
-    has_minor_children = card.get("has_minor_children")
-    children_count = card.get("children_count")
-    cert_no = (card.get("marriage_certificate_number") or "").strip()
-    cert_date = (card.get("marriage_certificate_date") or "").strip()
-
-    lines: list[str] = []
-
-    if marital_status == "married":
-        line = "Состоит в браке"
-        if spouse_full_name:
-            line += f" с {spouse_full_name}"
-        line += "."
-        lines.append(line)
-
-        if cert_no:
-            cert_line = f"Свидетельство о заключении брака № {cert_no}"
-            if cert_date:
-                cert_line += f" от {cert_date}"
-            cert_line += "."
-            lines.append(cert_line)
-
-    elif marital_status == "single":
-        lines.append("В браке не состоит.")
-
-    if has_minor_children is True:
-        cnt = ""
-        if children_count not in (None, ""):
-            cnt = f" ({children_count} ребёнок(детей))"
-        lines.append(f"Имеет несовершеннолетних детей{cnt}.")
-    elif has_minor_children is False:
-        lines.append("Несовершеннолетних детей нет.")
-
-    return "\n".join(lines)
-
-
-def _old_build_creditors_block(creditors: list[dict] | None) -> str:
-    """
-    Поддерживает 2 формата кредиторов:
-
-    1) Новый (опросник):
-       {
-         "name": "...",
-         "inn": "...", "ogrn": "...",
-         "debt_rubles": "...", "debt_kopeks": "...",
-         "note": "ОКБ/договор/и т.п."
-       }
-
-    2) Старый:
-       {
-         "name": "...",
-         "obligations": [{"amount_rubles":123,"amount_kopeks":45,"source":"ОКБ"}]
-       }
-    """
-    if not isinstance(creditors, list) or not creditors:
-        return ""
-
-    def _digits(s: str) -> str:
-        return "".join(ch for ch in str(s) if ch.isdigit())
-
-    lines: list[str] = []
-
-    for i, c in enumerate(creditors, start=1):
-        if not isinstance(c, dict):
-            continue
-
-        name = str((c.get("name") or "Кредитор")).strip()
-
-        # --- идентификаторы (для нового формата) ---
-        inn = str(c.get("inn") or "").strip()
-        ogrn = str(c.get("ogrn") or "").strip()
-        ids = []
-        if inn:
-            ids.append(f"ИНН {inn}")
-        if ogrn:
-            ids.append(f"ОГРН {ogrn}")
-        name_with_ids = name + (f" ({', '.join(ids)})" if ids else "")
-
-        # --- новый формат суммы ---
-        debt_r = c.get("debt_rubles")
-        debt_k = c.get("debt_kopeks")
-        note = str(c.get("note") or "").strip()
-
-        money_new = ""
-        if debt_r not in (None, "", "-"):
-            dr = _digits(debt_r)
-            if dr != "":
-                money_new = f"{int(dr)} руб."
-        if debt_k not in (None, "", "-"):
-            dk = _digits(debt_k)
-            if dk != "":
-                money_new = (money_new + " " if money_new else "") + f"{int(dk):02d} коп."
-
-        if money_new and note:
-            line_new = f"{i}) {name_with_ids} — {money_new} ({note})"
-        elif money_new:
-            line_new = f"{i}) {name_with_ids} — {money_new}"
-        elif note:
-            line_new = f"{i}) {name_with_ids} — ({note})"
-        else:
-            line_new = f"{i}) {name_with_ids}"
-
-        # --- старый формат obligations имеет приоритет, если он реально заполнен ---
-        obs = c.get("obligations")
-        if isinstance(obs, list) and any(isinstance(x, dict) for x in obs):
-            obs_txt: list[str] = []
-            for ob in obs:
-                if not isinstance(ob, dict):
-                    continue
-                r = ob.get("amount_rubles")
-                k = ob.get("amount_kopeks")
-                src = (ob.get("source") or "").strip()
-
-                money_parts: list[str] = []
-                if r is not None and str(r).strip() != "":
-                    money_parts.append(f"{int(r)} руб.")
-                if k is not None and str(k).strip() != "":
-                    money_parts.append(f"{int(k):02d} коп.")
-                money = " ".join(money_parts).strip()
-
-                if money and src:
-                    obs_txt.append(f"{money} ({src})")
-                elif money:
-                    obs_txt.append(money)
-                elif src:
-                    obs_txt.append(f"({src})")
-
-            if obs_txt:
-                lines.append(f"{i}) {name} — " + "; ".join(obs_txt))
-            else:
-                lines.append(f"{i}) {name}")
-        else:
-            lines.append(line_new)
-
-    return "\n".join(lines)
-
-def _old_sum_creditors_total(creditors: list[dict] | None) -> tuple[int, int]:
-    """
-    Возвращает (rubles, kopeks) как сумму по всем кредиторам.
-    Поддерживает оба формата:
-      - obligations: [{amount_rubles, amount_kopeks, ...}]
-      - debt_rubles / debt_kopeks
-    """
-    if not isinstance(creditors, list) or not creditors:
-        return (0, 0)
-
-    def _to_int(x) -> int:
-        if x is None:
-            return 0
-        s = "".join(ch for ch in str(x) if ch.isdigit())
-        return int(s) if s else 0
-
-    total_k = 0
-
-    for c in creditors:
-        if not isinstance(c, dict):
-            continue
-
-        obs = c.get("obligations")
-        if isinstance(obs, list) and any(isinstance(o, dict) for o in obs):
-            for ob in obs:
-                if not isinstance(ob, dict):
-                    continue
-                r = _to_int(ob.get("amount_rubles"))
-                k = _to_int(ob.get("amount_kopeks"))
-                total_k += r * 100 + k
-            continue
-
-        # новый формат
-        r = _to_int(c.get("debt_rubles"))
-        k = _to_int(c.get("debt_kopeks"))
-        total_k += r * 100 + k
-
-    return (total_k // 100, total_k % 100)
-
-def _old_build_vehicle_block(card: dict) -> str:
-    """
-    Если авто нет — 'Отсутствует'.
-    Если есть список vehicles или vehicle — печатаем списком.
-    """
-    vehicles: list[dict] = []
-
-    vlist = card.get("vehicles")
-    if isinstance(vlist, list):
-        vehicles.extend([v for v in vlist if isinstance(v, dict)])
-
-    one = card.get("vehicle")
-    if isinstance(one, dict):
-        vehicles.append(one)
-
-    if not vehicles:
-        return "Транспортные средства отсутствуют."
-
-    lines: list[str] = []
-    for i, v in enumerate(vehicles, start=1):
-        brand_model = (v.get("brand_model") or "").strip()
-        plate = (v.get("plate_number") or "").strip()
-        vin = (v.get("vin") or "").strip()
-        year = (v.get("year") or "").strip()
-        parts = [p for p in [brand_model, plate, vin, year] if p]
-        desc = "; ".join(parts) if parts else "Автомобиль"
-        lines.append(f"{i}) {desc}")
-
-    return "\n".join(lines)
-
-
-def _old_build_attachments_list(card: dict) -> str:
-    items: list[str] = []
-    if card.get("passport_series") and card.get("passport_number"):
-        items.append("Копия паспорта гражданина РФ.")
-    if card.get("debtor_inn"):
-        items.append("Копия ИНН.")
-    if card.get("debtor_snils"):
-        items.append("Копия СНИЛС.")
-    if card.get("creditors"):
-        items.append("Документы, подтверждающие задолженность перед кредиторами.")
-
-    if not items:
-        return ""
-    return "\n".join(f"{i}) {x}" for i, x in enumerate(items, start=1))
-
-def _set_paragraph_text_keep_style(paragraph, new_text: str) -> None:
-    """
-    Надёжная замена текста в параграфе: плейсхолдеры могут быть разорваны по runs.
-    Сохраняем стиль параграфа, но runs пересоздаём.
-    """
-    if paragraph.runs:
-        for r in paragraph.runs:
-            r.text = ""
-    paragraph.add_run(new_text)
-
-
-def _replace_placeholders_strong(doc: Document, mapping: Dict[str, Any]) -> None:
-    """
-    Замена плейсхолдеров формата {{key}} по полному тексту параграфов и ячеек таблиц.
-    mapping: ключи БЕЗ фигурных скобок, например: {"court_name": "..." }
-    """
-    def apply_to_paragraph(p):
-        text = p.text
-        if not text or "{{" not in text:
-            return
-        changed = False
-        for k, v in mapping.items():
-            placeholder = f"{{{{{k}}}}}"
-            if placeholder in text:
-                text = text.replace(placeholder, "" if v is None else str(v))
-                changed = True
-        if changed:
-            _set_paragraph_text_keep_style(p, text)
-
-    for p in doc.paragraphs:
-        apply_to_paragraph(p)
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    apply_to_paragraph(p)
-                for nested in cell.tables:
-                    # рекурсивно для вложенных таблиц
-                    for nrow in nested.rows:
-                        for ncell in nrow.cells:
-                            for np in ncell.paragraphs:
-                                apply_to_paragraph(np)
-
-def _old_build_online_hearing_docx(case_row: Tuple) -> Path:
-    """
-    Генерация ходатайства о ВКС (онлайн-заседание).
-    Делает простой DOCX без шаблона, чтобы гарантированно не падать.
-    """
-    (
-        cid,
-        owner_user_id,
-        code_name,
-        case_number,
-        court,
-        judge,
-        fin_manager,
-        stage,
-        notes,
-        created_at,
-        updated_at,
-    ) = case_row
-
-    doc = Document()
-
-    # Шапка: кому и от кого
-    doc.add_paragraph("В Арбитражный суд")
-    doc.add_paragraph(court or "не указано")
-    doc.add_paragraph("")
-
-    prof = get_profile(owner_user_id)
-    if prof:
-        _, full_name, role, address, phone, email, *_ = prof
-        doc.add_paragraph("От: " + (full_name or "не указано"))
-        if role:
-            doc.add_paragraph("Статус: " + role)
-        if address:
-            doc.add_paragraph("Адрес: " + address)
-        if phone:
-            doc.add_paragraph("Телефон: " + phone)
-        if email:
-            doc.add_paragraph("Email: " + email)
-    else:
-        doc.add_paragraph("От: не указано")
-
-    doc.add_paragraph("")
-    doc.add_paragraph("ХОДАТАЙСТВО")
-    doc.add_paragraph("о проведении судебного заседания с использованием ВКС")
-    doc.add_paragraph("")
-
-    if case_number:
-        doc.add_paragraph(f"Дело № {case_number}")
-    if judge:
-        doc.add_paragraph(f"Судья: {judge}")
-    if fin_manager:
-        doc.add_paragraph(f"Финансовый управляющий: {fin_manager}")
-
-    doc.add_paragraph("")
-    doc.add_paragraph("Прошу обеспечить участие в судебном заседании с использованием системы видеоконференц-связи.")
-    doc.add_paragraph("")
-    doc.add_paragraph("Дата: " + datetime.now().strftime("%d.%m.%Y"))
-    doc.add_paragraph("")
-    doc.add_paragraph("Подпись: ____________")
-
-    fname = f"online_hearing_case_{cid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-    case_dir = GENERATED_DIR / "cases" / str(cid)
-    case_dir.mkdir(parents=True, exist_ok=True)
-    out_path = case_dir / fname
-    doc.save(out_path)
-    return out_path
-
-
-async def build_bankruptcy_petition_doc(case_row: Tuple, card: dict) -> Path:
-    """
-    Генерация заявления о банкротстве по шаблону.
-    Подстановка строго по 23 плейсхолдерам шаблона + дефолты для пустых данных.
-
-    НОВОЕ: приоритетно используем данные из case_parties (если есть).
-    """
-    cid = case_row[0]
-
-    template_path = Path("templates/petitions/bankruptcy_petition.docx")
-    doc = Document(template_path)
-
-    # Попытка загрузить кредиторов из новых таблиц
-    creditors_from_db = []
-    try:
-        from bankrot_bot.database import get_session
-
-        async with get_session() as session:
-            parties = await get_case_parties(session, cid, role="creditor")
-            if parties:
-                creditors_from_db = format_parties_for_doc(parties, role="creditor")
-    except Exception as e:
-        logger.warning(f"Failed to load creditors from DB for case {cid}: {e}")
-
-    # --- дефолты ---
-    def _txt(v: Any) -> str:
-        v = "" if v is None else str(v).strip()
-        return v if v else "не указано"
-
-    def _money_rubles(v: Any) -> str:
-        v = "" if v is None else str(v).strip()
-        return v if v else "0"
-
-    def _money_kopeks(v: Any) -> str:
-        if v is None or str(v).strip() == "":
-            return "00"
-        try:
-            return f"{int(str(v).strip()):02d}"
-        except (ValueError, TypeError):
-            s = str(v).strip()
-            digits = "".join(ch for ch in s if ch.isdigit())
-            if digits == "":
-                return "00"
-            try:
-                return f"{int(digits):02d}"
-            except (ValueError, TypeError):
-                return "00"
-
-    # --- исходные данные ---
-    court_name = _txt(card.get("court_name") or (case_row[4] if len(case_row) > 4 else None))
-    court_address = _txt(card.get("court_address"))
-
-    financial_manager_info = _txt(
-        card.get("financial_manager_info") or (case_row[6] if len(case_row) > 6 else None)
-    )
-
-    debtor_full_name = _txt(card.get("debtor_full_name"))
-    debtor_address = _txt(card.get("debtor_address"))
-    debtor_birth_date = _txt(card.get("debtor_birth_date"))
-    debtor_inn = _txt(card.get("debtor_inn"))
-    debtor_snils = _txt(card.get("debtor_snils"))
-    debtor_phone = _txt(card.get("debtor_phone"))
-
-    passport_series = (card.get("passport_series") or "").strip()
-    passport_number = (card.get("passport_number") or "").strip()
-    debtor_passport = _txt(f"{passport_series} {passport_number}".strip())
-
-    debtor_passport_issued_by = _txt(card.get("passport_issued_by"))
-    debtor_passport_date = _txt(card.get("passport_date"))
-    debtor_passport_code = _txt(card.get("passport_code"))
-
-    raw_marital = card.get("marital_status")
-    raw_marital = ("" if raw_marital is None else str(raw_marital)).strip().lower()
-
-    debtor_address = (debtor_address or "").strip()
-    while ",," in debtor_address:
-        debtor_address = debtor_address.replace(",,", ",")
-    debtor_address = debtor_address.rstrip(" ,")
-
-    marital_map = {
-        "married": "Состоит в зарегистрированном браке.",
-        "single": "В браке не состоит.",
-        "divorced": "Брак расторгнут.",
-        "widowed": "Вдовец/вдова.",
-    }
-
-    # Если уже введён нормальный русский текст — оставляем как есть
-    if raw_marital in marital_map:
-        marital_status = marital_map[raw_marital]
-    else:
-        # если строка пустая -> дефолт "не указано"
-        # если строка не пустая (в т.ч. русский текст) -> используем как есть
-        marital_status = _txt(raw_marital)
-
-    certificate_number = card.get("certificate_number") or card.get("marriage_certificate_number")
-    certificate_date = card.get("certificate_date") or card.get("marriage_certificate_date")
-    certificate_number = _txt(certificate_number)
-    certificate_date = _txt(certificate_date)
-
-    # НОВАЯ ЛОГИКА: приоритет - creditors_from_db, потом card creditors
-    if creditors_from_db:
-        creditors = creditors_from_db
-    else:
-        creditors = card.get("creditors") if isinstance(card.get("creditors"), list) else []
-
-    auto_r, auto_k = sum_creditors_total(creditors)
-    if auto_r or auto_k:
-        total_debt_rubles = str(auto_r)
-        total_debt_kopeks = f"{auto_k:02d}"
-    else:
-        total_debt_rubles = _money_rubles(card.get("total_debt_rubles"))
-        total_debt_kopeks = _money_kopeks(card.get("total_debt_kopeks"))
-
-    deposit_deferral_request = card.get("deposit_deferral_request") or ""
-    # attachments_list по утверждённым дефолтам должен быть пустым, если нет данных
-    attachments_list = ""
-    try:
-        built_attachments = build_attachments_list(card)
-        if built_attachments and str(built_attachments).strip():
-            attachments_list = str(built_attachments)
-    except (KeyError, TypeError, AttributeError) as e:
-        logger.warning(f"Failed to build attachments list: {e}")
-        attachments_list = ""
-
-    # creditors_block: creditors_text приоритетно, иначе список, иначе нейтральный текст
-    creditors_text = card.get("creditors_text")
-    creditors_text = str(creditors_text).strip() if creditors_text is not None else ""
-    creditors = card.get("creditors") if isinstance(card.get("creditors"), list) else []
-
-    if creditors_text:
-        creditors_block = creditors_text
-    elif creditors:
-        creditors_block = build_creditors_block(creditors)
-    else:
-        creditors_block = "Сведения о кредиторах не представлены."
-
-    # creditors_header_block: короткий список для шапки (из того же источника, что и creditors_block)
-    if creditors:
-        creditors_header_block = build_creditors_header_block(creditors)
-    else:
-        creditors_header_block = "Сведения о кредиторах не представлены."
-
-    # vehicle_block: дефолт при отсутствии
-    vehicle_block = ""
-    try:
-        vehicle_block = build_vehicle_block(card) or ""
-    except (KeyError, TypeError, AttributeError) as e:
-        logger.warning(f"Failed to build vehicle block: {e}")
-        vehicle_block = ""
-    if not str(vehicle_block).strip():
-        vehicle_block = "Транспортные средства: отсутствуют."
-
-    # --- статус ИП (умная логика: справка или ЕГРИП) ---
-    ip_cert_number = (card.get("ip_certificate_number") or "").strip()
-    ip_cert_date = (card.get("ip_certificate_date") or "").strip()
-
-    if ip_cert_number and ip_cert_date:
-        ip_status_text = (
-            "не зарегистрирован в качестве индивидуального предпринимателя, "
-            f"что подтверждается справкой № {ip_cert_number} от {ip_cert_date}."
-        )
-    else:
-        ip_status_text = (
-            "не зарегистрирован в качестве индивидуального предпринимателя, "
-            "что подтверждается сведениями из ЕГРИП"
-        )
-
-    # нормализация, чтобы не было 'ЕГРИП..'
-    ip_status_text = (ip_status_text or "").strip()
-    while ".." in ip_status_text:
-        ip_status_text = ip_status_text.replace("..", ".")
-
-    mapping = {
-        "attachments_list": attachments_list,
-        "certificate_date": certificate_date,
-        "certificate_number": certificate_number,
-        "court_address": court_address,
-        "court_name": court_name,
-
-        # Кредиторы: шапка + основной блок
-        "creditors_block": creditors_block,
-        "creditors_header_block": creditors_header_block,
-
-        "date": datetime.now().strftime("%d.%m.%Y"),
-
-        "debtor_address": debtor_address,
-        "debtor_birth_date": debtor_birth_date,
-        "debtor_full_name": debtor_full_name,
-
-        # В шаблоне есть и обычные, и *_or_absent
-        "debtor_inn": debtor_inn if debtor_inn != "не указано" else "",
-        "debtor_inn_or_absent": debtor_inn if debtor_inn != "не указано" else "отсутствует",
-
-        "debtor_snils": debtor_snils if debtor_snils != "не указано" else "",
-        "debtor_snils_or_absent": debtor_snils if debtor_snils != "не указано" else "отсутствует",
-
-        "debtor_phone_or_absent": debtor_phone if debtor_phone != "не указано" else "отсутствует",
-
-        # Паспорт: ключи должны совпадать с плейсхолдерами шаблона
-        "passport_series": passport_series or "",
-        "passport_number": passport_number or "",
-        "passport_issued_by": debtor_passport_issued_by if debtor_passport_issued_by != "не указано" else "",
-        "passport_date": debtor_passport_date if debtor_passport_date != "не указано" else "",
-        "passport_code": debtor_passport_code if debtor_passport_code != "не указано" else "",
-
-        # Эти плейсхолдеры есть в шаблоне (ты их показывал в списке)
-        "debtor_last_name_initials": build_debtor_last_name_initials(card),
-
-        "financial_manager_info": financial_manager_info,
-        "family_status_block": build_family_status_block(card),
-        "ip_status_text": ip_status_text,
-
-        "marital_status": marital_status,
-
-        "total_debt_kopeks": total_debt_kopeks,
-        "total_debt_rubles": total_debt_rubles,
-
-        "vehicle_block": vehicle_block,
-
-        "deposit_deferral_request": deposit_deferral_request,
-    }
-
-    # гендерные формы (debtor_having_word, debtor_registered_word, debtor_living_word,
-    # debtor_not_registered_word, debtor_insolvent_word)
+async def send_pdf_copy(message: Message, key: str) -> None:
+    """Отправить PDF-версию документа из хранилища, если включён экспорт в PDF (PDF_EXPORT=1)."""
+    if get_pdf_pool() is None:
+        return
+    storage = get_storage()
     try:
-        gender_forms = build_gender_forms(card.get("debtor_gender"))
-        if isinstance(gender_forms, dict):
-            mapping.update(gender_forms)
-    except (KeyError, TypeError, AttributeError) as e:
-        # если пол не заполнен или функция упала — ставим нейтральные значения
-        logger.warning(f"Failed to build gender forms: {e}")
-        mapping.update(
-            {
-                "debtor_having_word": "имеющий(ая)",
-                "debtor_registered_word": "зарегистрированный(ая)",
-                "debtor_living_word": "проживающий(ая)",
-                "debtor_not_registered_word": "не зарегистрирован(а)",
-                "debtor_insolvent_word": "неплатёжеспособный(ая)",
-            }
-        )
-
-
-    _replace_placeholders_strong(doc, mapping)
-    # второй проход — добиваем плейсхолдеры, разорванные Word по runs
-    for p in doc.paragraphs:
-        for run in p.runs:
-            if "{{" in run.text:
-                for k, v in mapping.items():
-                    run.text = run.text.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
-
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    for run in p.runs:
-                        if "{{" in run.text:
-                            for k, v in mapping.items():
-                                run.text = run.text.replace(f"{{{{{k}}}}}", "" if v is None else str(v))
-
-
-    # Контроль: не должно остаться {{...}}
-    def _has_unreplaced_placeholders(d: Document) -> bool:
-        for p in d.paragraphs:
-            if "{{" in (p.text or ""):
-                return True
-        for t in d.tables:
-            for row in t.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        if "{{" in (p.text or ""):
-                            return True
-        return False
-
-    if _has_unreplaced_placeholders(doc):
-        import re
-
-        # диагностируем, что именно осталось в документе
-        left = set()
-
-        def _scan_paragraph_for_left(p):
-            txt = p.text or ""
-            for m in re.findall(r"\{\{[^}]+\}\}", txt):
-                left.add(m)
-
-        for p in doc.paragraphs:
-            _scan_paragraph_for_left(p)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        _scan_paragraph_for_left(p)
-                    for nested in cell.tables:
-                        for nrow in nested.rows:
-                            for ncell in nrow.cells:
-                                for p in ncell.paragraphs:
-                                    _scan_paragraph_for_left(p)
-
-        import logging
-        logging.exception("UNREPLACED_PLACEHOLDERS: %s", sorted(left))
-
-        raise ValueError("В документе остались не заменённые плейсхолдеры вида {{...}}")
-
-    fname = f"bankruptcy_petition_case_{cid}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-    case_dir = GENERATED_DIR / "cases" / str(cid)
-    case_dir.mkdir(parents=True, exist_ok=True)
-    out_path = case_dir / fname
-    doc.save(out_path)
-    return out_path
+        pdf_key = await export_pdf(storage, key)
+    except PdfConversionError as e:
+        logger.error(f"PDF export failed for {key}: {e}")
+        await message.answer("⚠️ Не удалось сформировать PDF, отправлен только DOCX.")
+        return
+    await message.answer_document(storage.input_file(pdf_key, filename=pdf_filename(key_filename(key))))
 
 
 async def _selected_case_id(state: FSMContext) -> int | None:
@@ -844,6 +210,10 @@ GENERATED_DIR = settings["GENERATED_DIR"]
 
 DB_PATH = settings["DB_PATH"]
 
+RETENTION_POLICY = RetentionPolicy.from_settings(settings)
+RETENTION_INTERVAL_MIN = settings["RETENTION_INTERVAL_MIN"]
+BATCH_MAX_CASES = settings["BATCH_MAX_CASES"]
+
 # Initialize cases_db module with database path
 from bankrot_bot.services.cases_db import (
     init_cases_db,
@@ -859,8 +229,14 @@ from bankrot_bot.services.cases_db import (
     migrate_case_cards_table,
     CASE_CARD_REQUIRED_FIELDS,
     CASE_CARDS_ALLOWED_COLUMNS,
+    select_cases,
 )
 init_cases_db(DB_PATH)
+init_storage(settings)
+init_docx_output(settings["DOCX_SPOOL_THRESHOLD_KB"])
+init_render_cache(settings["PETITION_RENDER_CACHE_SIZE"])
+init_render_pool(settings["RENDER_WORKERS"], spool_threshold_kb=settings["DOCX_SPOOL_THRESHOLD_KB"])
+init_pdf_export(settings)
 
 def _parse_ids(s: str) -> set[int]:
     out = set()
@@ -996,11 +372,11 @@ def upsert_case_card(owner_user_id: int, case_id: int, data: dict[str, Any]) ->
 # =========================
 # bot logic
 # =========================
-from aiogram.fsm.storage.redis import RedisStorage
+from bankrot_bot.services.fsm_storage import create_fsm_storage, set_state_data
+from bankrot_bot.services.webhook_shards import parse_shards, run_shard_worker
 
-# Configure Redis storage for FSM
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-storage = RedisStorage.from_url(redis_url)
+# Configure Redis storage for FSM (pooled connections, key TTLs)
+storage = create_fsm_storage(settings)
 dp = Dispatcher(storage=storage)
 
 # =========================
@@ -1046,21 +422,42 @@ dp.include_router(newcase_fsm.router)
 
 # 4. Direct dp handlers (callbacks, FSM, etc.) registered below have lowest priority
 
-USER_FLOW: Dict[int, Dict[str, Any]] = {}
-LAST_RESULT: Dict[int, str] = {}
+# Анкеты ходатайства/мирового живут в FSM (RedisStorage с TTL):
+# состояние MotionFlow/SettlementFlow, ответы — data["ai_flow"].
+# Готовый ответ модели лежит в ResultStore, его handle — в кнопке export:word:<handle>.
+FLOW_KEY = "ai_flow"
+AI_FLOW_STATES = {MotionFlow.court_type.state, MotionFlow.answers.state, SettlementFlow.answers.state}
 
 
-def cancel_flow(uid: int) -> None:
-    USER_FLOW.pop(uid, None)
+async def start_flow(state: FSMContext, flow_state: State, **flow: Any) -> None:
+    """Начать анкету заново (прочие данные FSM, например active_case_id, сохраняются)."""
+    await state.set_state(flow_state)
+    await state.update_data({FLOW_KEY: {"step": 0, "answers": {}, **flow}})
+
+
+async def cancel_flow(state: FSMContext) -> None:
+    """Выйти из анкеты; прочие данные FSM остаются."""
+    if await state.get_state() in AI_FLOW_STATES:
+        await state.set_state(None)
+    data = await state.get_data()
+    if FLOW_KEY in data:
+        data.pop(FLOW_KEY)
+        await state.set_data(data)
 
 
 # main_keyboard() definition removed - see line 4336 for active implementation
 
 
-def export_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура экспорта документа."""
+RESULT_TITLES = {
+    "motion": "Проект ходатайства",
+    "settlement": "Проект мирового соглашения",
+}
+
+
+def export_keyboard(handle: str) -> InlineKeyboardMarkup:
+    """Клавиатура экспорта документа (handle из ResultStore)."""
     kb = InlineKeyboardBuilder()
-    kb.button(text="📄 Экспорт (показать текст)", callback_data="export:word")
+    kb.button(text="📄 Скачать DOCX", callback_data=f"export:word:{handle}")
     kb.adjust(1)
     return kb.as_markup()
 
@@ -1156,7 +553,7 @@ def build_settlement_user_text(ans: Dict[str, str]) -> str:
 # =========================
 
 @dp.message(CommandStart())
-async def cmd_start(message: Message) -> None:
+async def cmd_start(message: Message, state: FSMContext) -> None:
     """
     Handle /start command.
 
@@ -1165,12 +562,13 @@ async def cmd_start(message: Message) -> None:
 
     Args:
         message: Incoming /start command message
+        state: FSM context (an unfinished motion/settlement flow is cancelled)
     """
     uid = message.from_user.id
     if not is_allowed(uid):
         logger.warning(f"Unauthorized /start attempt by user {uid}")
         return
-    cancel_flow(uid)
+    await cancel_flow(state)
 
     # Import refactored main menu (inline) and reply keyboard
     from keyboards import main_menu
@@ -1613,13 +1011,7 @@ async def case_docs(call: CallbackQuery, state: FSMContext):
     await state.update_data(docs_case_id=case_id)
 
     # показываем уже созданные файлы по делу (ТОЛЬКО новая структура)
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files = []
-    if case_dir.is_dir():
-        files = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    files = await get_storage().list_case_documents(case_id)
 
     # клавиатура: генерация + последний документ + архив
     kb = InlineKeyboardBuilder()
@@ -1656,28 +1048,17 @@ async def case_lastdoc_send(call: CallbackQuery):
         return
 
     case_id = int(call.data.split(":")[-1])
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    if not case_dir.is_dir():
-        await call.message.answer("Документы не найдены.")
-        await call.answer()
-        return
-
-    files = sorted(
-        [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-        reverse=True,
-    )
+    storage = get_storage()
+    files = await storage.list_case_documents(case_id)
     if not files:
         await call.message.answer("Документы не найдены.")
         await call.answer()
         return
 
-    path = case_dir / files[0]
-    if not path.is_file():
-        await call.message.answer("Файл не найден (возможно, удалён).")
-        await call.answer()
-        return
-
-    await call.message.answer_document(FSInputFile(path), caption=f"Последний документ по делу #{case_id}")
+    await call.message.answer_document(
+        storage.input_file(case_key(case_id, files[0])),
+        caption=f"Последний документ по делу #{case_id}",
+    )
     await call.answer()
 
 
@@ -1701,13 +1082,8 @@ async def case_archive(call: CallbackQuery):
     if page < 1:
         page = 1
 
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files_all = []
-    if case_dir.is_dir():
-        files_all = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    storage = get_storage()
+    files_all = await storage.list_case_documents(case_id)
 
     archive_files = files_all[1:] if len(files_all) > 1 else []
     per_page = 10
@@ -1761,13 +1137,8 @@ async def case_file_send_by_index(call: CallbackQuery):
         await call.answer()
         return
 
-    case_dir = GENERATED_DIR / "cases" / str(case_id)
-    files_all = []
-    if case_dir.is_dir():
-        files_all = sorted(
-            [p.name for p in case_dir.iterdir() if p.is_file() and p.suffix.lower() == ".docx"],
-            reverse=True,
-        )
+    storage = get_storage()
+    files_all = await storage.list_case_documents(case_id)
 
     archive_files = files_all[1:] if len(files_all) > 1 else []
     if idx < 0 or idx >= len(archive_files):
@@ -1775,14 +1146,13 @@ async def case_file_send_by_index(call: CallbackQuery):
         await call.answer()
         return
 
-    filename = archive_files[idx]
-    path = case_dir / filename
-    if not path.is_file():
+    key = case_key(case_id, archive_files[idx])
+    if not await storage.exists(key):
         await call.message.answer("Файл не найден (возможно, удалён).")
         await call.answer()
         return
 
-    await call.message.answer_document(FSInputFile(path))
+    await call.message.answer_document(storage.input_file(key))
     await call.answer()
 
 # case_file_send() DUPLICATE REMOVED - see line ~2350 for active implementation
@@ -1828,7 +1198,7 @@ async def case_generate_from_case_docs(call: CallbackQuery, state: FSMContext):
             await call.answer()
             return
 
-        validation = validate_case_card(card)
+        validation = validate_case_card(card, PETITION_TEMPLATE)
         missing = validation.get("missing", []) if isinstance(validation, dict) else (validation or [])
 
         if missing:
@@ -1840,11 +1210,12 @@ async def case_generate_from_case_docs(call: CallbackQuery, state: FSMContext):
             await call.answer()
             return
 
-        path = await build_bankruptcy_petition_doc(case_row, card)
+        key = await build_bankruptcy_petition_doc(case_row, card)
         await call.message.answer_document(
-            FSInputFile(path),
+            get_storage().input_file(key),
             caption=f"Готово ✅ Заявление о банкротстве (дело #{case_id})",
         )
+        await send_pdf_copy(call.message, key)
 
     else:
         await call.message.answer("Неизвестный тип документа.")
@@ -2113,7 +1484,7 @@ async def docs_petition(call: CallbackQuery, state: FSMContext):
         await call.answer()
         return
 
-    validation = validate_case_card(card)
+    validation = validate_case_card(card, PETITION_TEMPLATE)
     missing = validation.get("missing", [])
     if missing:
         await call.message.answer(
@@ -2128,11 +1499,12 @@ async def docs_petition(call: CallbackQuery, state: FSMContext):
         await call.answer()
         return
 
-    path = await build_bankruptcy_petition_doc(case_row, card)
+    key = await build_bankruptcy_petition_doc(case_row, card)
     await call.message.answer_document(
-        FSInputFile(path),
+        get_storage().input_file(key),
         caption=f"Готово ✅ Заявление о банкротстве для дела #{cid}",
     )
+    await send_pdf_copy(call.message, key)
     await call.answer()
 
 @dp.callback_query(F.data.startswith("case:file:"))
@@ -2167,18 +1539,19 @@ async def case_file_send(call: CallbackQuery) -> None:
         await call.answer()
         return
 
-    path = GENERATED_DIR / "cases" / cid_str / filename
-    if not path.is_file():
-        logger.info(f"File not found: {path}")
+    storage = get_storage()
+    key = case_key(cid_str, filename)
+    if not await storage.exists(key):
+        logger.info(f"File not found: {key}")
         await call.message.answer("Файл не найден")
         await call.answer()
         return
 
     try:
-        await call.message.answer_document(FSInputFile(path))
+        await call.message.answer_document(storage.input_file(key))
         await call.answer()
     except Exception as e:
-        logger.error(f"Failed to send file {path}: {e}")
+        logger.error(f"Failed to send file {key}: {e}")
         await call.message.answer("Ошибка при отправке файла")
         await call.answer()
 
@@ -2247,6 +1620,76 @@ async def card_set(message: Message, state: FSMContext):
     )
 
 
+@dp.message(Command("retention"))
+async def retention_cmd(message: Message):
+    """
+    Админ: очистка архива документов по политике хранения.
+
+    /retention        — пробный прогон (только отчёт)
+    /retention apply  — применить политику
+    """
+    uid = message.from_user.id
+    if not is_admin(uid):
+        return
+
+    parts = (message.text or "").split()
+    dry_run = not (len(parts) > 1 and parts[1].lower() == "apply")
+
+    if not isinstance(get_storage(), LocalStorage):
+        await message.answer("Очистка архива работает только с локальным хранилищем (STORAGE_BACKEND=local).")
+        return
+
+    report = await asyncio.to_thread(apply_retention, GENERATED_DIR, RETENTION_POLICY, dry_run=dry_run)
+    await message.answer(format_report(report))
+
+
+@dp.message(Command("batch_docs"))
+async def batch_docs_cmd(message: Message):
+    """
+    Админ: пакетная генерация документов по многим делам в один ZIP.
+
+    /batch_docs 12 15 20-25
+    /batch_docs all kinds=petition
+    /batch_docs owner=123456 stage=observation kinds=creditors,inventory
+    """
+    uid = message.from_user.id
+    if not is_admin(uid):
+        return
+
+    try:
+        selection = parse_case_selection((message.text or "").split()[1:])
+    except ValueError as e:
+        await message.answer(
+            f"{e}\n\nФормат: /batch_docs <номера|диапазоны|all> "
+            "[owner=<id>] [stage=<стадия>] [kinds=petition,creditors,inventory]"
+        )
+        return
+
+    rows = select_cases(
+        selection.case_ids,
+        owner_user_id=selection.owner_user_id,
+        stage=selection.stage,
+        limit=BATCH_MAX_CASES + 1,
+    )
+    if not rows:
+        await message.answer("Дела не найдены.")
+        return
+    if len(rows) > BATCH_MAX_CASES:
+        await message.answer(f"Слишком много дел (больше {BATCH_MAX_CASES}). Сузь выборку.")
+        return
+
+    await message.answer(f"Готовлю документы по {len(rows)} делам…")
+    result = await run_batch(rows, selection.kinds, concurrency=render_pool_size() * 2)
+    with result.zip_file:
+        await message.answer_document(
+            DocumentInputFile(result.zip_file, result.filename),
+            caption=(
+                f"Готово ✅ Документов: {len(result.ok)}, ошибок: {len(result.errors)}"
+                + (" (подробности в report.txt)" if result.errors else "")
+            ),
+        )
+
+
 @dp.message(Command("doc_test"))
 async def doc_test(message: Message):
     uid = message.from_user.id
@@ -3062,8 +2505,9 @@ async def case_card_value_set(message: Message, state: FSMContext):
             break
 
     if next_field:
-        await state.update_data(card_case_id=int(cid), card_field_key=next_field)
-        await state.set_state(CaseCardFill.waiting_value)
+        await set_state_data(
+            state, CaseCardFill.waiting_value, {**data, "card_case_id": int(cid), "card_field_key": next_field}
+        )
         prompt = CASE_CARD_FIELD_META[next_field]["prompt"]
         filled, total = _card_completion_status(card)
         await message.answer(
@@ -3073,7 +2517,7 @@ async def case_card_value_set(message: Message, state: FSMContext):
         )
         return
 
-    await state.clear()
+    await set_state_data(state, None, {})
     filled, total = _card_completion_status(card)
     await message.answer(f"✅ Карточка заполнена. Заполнено {filled}/{total}.")
 
@@ -3081,8 +2525,7 @@ def _format_creditor_line(i: int, c: dict) -> str:
     name = (c.get("name") or "—").strip()
     inn = (c.get("inn") or "").strip()
     ogrn = (c.get("ogrn") or "").strip()
-    debt_r = (c.get("debt_rubles") or "").strip()
-    debt_k = (c.get("debt_kopeks") or "").strip()
+    amount = creditor_kopeks(c)
 
     parts = [f"{i}) {name}"]
     ids = []
@@ -3092,10 +2535,9 @@ def _format_creditor_line(i: int, c: dict) -> str:
         ids.append(f"ОГРН {ogrn}")
     if ids:
         parts.append(" (" + ", ".join(ids) + ")")
-    if debt_r or debt_k:
-        dk = debt_k if debt_k else "00"
-        dr = debt_r if debt_r else "0"
-        parts.append(f" — {dr} руб. {dk} коп.")
+    if amount is not None:
+        dr, dk = split_kopeks(amount)
+        parts.append(f" — {dr} руб. {dk:02d} коп.")
     return "".join(parts)
 
 
@@ -3347,7 +2789,7 @@ async def creditors_step_address(message: Message, state: FSMContext):
         tmp["address"] = txt
     await state.update_data(creditor_tmp=tmp)
     await state.set_state(CreditorsFill.debt_rubles)
-    await message.answer("Сумма долга (рубли) (можно '-' чтобы пропустить).")
+    await message.answer("Сумма долга в рублях, например 150000 или 150 000,50 (можно '-' чтобы пропустить).")
 
 
 @dp.message(StateFilter(CreditorsFill.debt_rubles))
@@ -3357,11 +2799,18 @@ async def creditors_step_debt_rubles(message: Message, state: FSMContext):
     tmp = data.get("creditor_tmp") or {}
 
     if txt != "-" and txt:
-        digits = _safe_digits(txt)
-        if digits == "":
-            await message.answer("Нужно число (или '-' чтобы пропустить).")
+        # сумма разбирается один раз здесь и хранится в копейках
+        amount = parse_amount_kopeks(txt)
+        if amount is None:
+            await message.answer("Нужна сумма, например 150000 или 150 000,50 (или '-' чтобы пропустить).")
+            return
+        tmp[AMOUNT_KEY] = amount
+        if "," in txt or "." in txt:
+            # копейки уже указаны — отдельный шаг не нужен
+            await state.update_data(creditor_tmp=tmp)
+            await state.set_state(CreditorsFill.note)
+            await message.answer("Основание/комментарий (например: выписка ОКБ) (можно '-' чтобы пропустить).")
             return
-        tmp["debt_rubles"] = digits
     await state.update_data(creditor_tmp=tmp)
     await state.set_state(CreditorsFill.debt_kopeks)
     await message.answer("Сумма долга (копейки 0-99) (можно '-' чтобы пропустить).")
@@ -3386,7 +2835,7 @@ async def creditors_step_debt_kopeks(message: Message, state: FSMContext):
         if val < 0 or val > 99:
             await message.answer("Копейки должны быть 0-99.")
             return
-        tmp["debt_kopeks"] = f"{val:02d}"
+        tmp[AMOUNT_KEY] = tmp.get(AMOUNT_KEY, 0) + val
     await state.update_data(creditor_tmp=tmp)
     await state.set_state(CreditorsFill.note)
     await message.answer("Основание/комментарий (например: выписка ОКБ) (можно '-' чтобы пропустить).")
@@ -3641,64 +3090,110 @@ async def process_asset_value(message: Message, state: FSMContext):
 
 
 # =========================
-# Catch-all message handler (must be AFTER FSM handlers!)
+# Motion / settlement flows (FSM)
 # =========================
-@dp.message()
-async def main_text_router(message: Message, state: FSMContext):
-    # Если идёт FSM (создание дела и т.п.) — не мешаем
-    if await state.get_state() is not None:
+@dp.message(StateFilter(MotionFlow.court_type))
+async def motion_court_text(message: Message, state: FSMContext):
+    if not is_allowed(message.from_user.id):
         return
-    uid = message.from_user.id
-    if not is_allowed(uid):
-        return
-    
-    # ✅ Команды всегда разрешены
     if message.text and message.text.startswith("/"):
         return
-    
-    if uid not in USER_FLOW:
-        await message.answer("Сначала выбери задачу через /start.")
+    await message.answer("Выбери тип суда:", reply_markup=court_type_keyboard())
+
+
+@dp.message(StateFilter(MotionFlow.answers, SettlementFlow.answers))
+async def ai_flow_answer(message: Message, state: FSMContext):
+    if not is_allowed(message.from_user.id):
+        return
+    if message.text and message.text.startswith("/"):
         return
 
-    # дальше — твоя старая логика USER_FLOW (motion / settlement)
-    flow = USER_FLOW[uid]
-    text = (message.text or "").strip()
+    is_motion = await state.get_state() == MotionFlow.answers.state
+    steps = MOTION_STEPS if is_motion else SETTLEMENT_STEPS
+    keyboard = motion_actions_keyboard() if is_motion else settlement_actions_keyboard()
+    flow = (await state.get_data()).get(FLOW_KEY) or {"step": 0, "answers": {}}
 
-    if flow.get("flow") == "settlement":
-        step = int(flow.get("step", 0))
-        if step >= len(SETTLEMENT_STEPS):
-            cancel_flow(uid)
-            await message.answer("Анкета завершена. Меню 👇", reply_markup=main_keyboard())
-            return
+    step = int(flow.get("step", 0))
+    if step >= len(steps):
+        await cancel_flow(state)
+        await message.answer("Анкета завершена. Меню 👇", reply_markup=main_keyboard())
+        return
 
-        key = SETTLEMENT_STEPS[step][0]
-        flow["answers"][key] = text
-        step += 1
-        flow["step"] = step
+    flow["answers"][steps[step][0]] = (message.text or "").strip()
+    step += 1
+    flow["step"] = step
+    await state.update_data({FLOW_KEY: flow})
 
-        if step < len(SETTLEMENT_STEPS):
-            await message.answer(SETTLEMENT_STEPS[step][1], reply_markup=settlement_actions_keyboard())
-            return
+    if step < len(steps):
+        await message.answer(steps[step][1], reply_markup=keyboard)
+        return
 
-        await message.answer("Принял данные. Готовлю проект мирового…")
-        try:
-            user_text = build_settlement_user_text(flow.get("answers", {}))
-            result = await gigachat_chat(
+    if is_motion:
+        court_type = flow.get("court_type") or "arbitr"
+        system_prompt = system_prompt_for_motion(court_type)
+        user_text = build_motion_user_text(flow["answers"], court_type)
+        placeholder = "Принял данные. Готовлю проект ходатайства…"
+    else:
+        system_prompt = system_prompt_for_settlement()
+        user_text = build_settlement_user_text(flow["answers"])
+        placeholder = "Принял данные. Готовлю проект мирового…"
+
+    try:
+        result = await stream_to_message(
+            message,
+            gigachat_chat_stream(
                 auth_key=AUTH_KEY,
                 scope=SCOPE,
                 model=MODEL,
-                system_prompt=system_prompt_for_settlement(),
+                system_prompt=system_prompt,
                 user_text=user_text,
-            )
-            LAST_RESULT[uid] = result
-            await message.answer(result)
-            await message.answer("Экспорт 👇", reply_markup=export_keyboard())
-        except Exception as e:
-            await message.answer(f"Ошибка GigaChat:\n{e}")
+            ),
+            placeholder=placeholder,
+            interval=settings["TG_STREAM_EDIT_INTERVAL_SEC"],
+        )
+        if not result:
+            raise RuntimeError("пустой ответ")
+    except GigaChatUnavailable as e:
+        await message.answer(f"⏳ {e}")
+        result = None
+    except Exception as e:
+        await message.answer(f"Ошибка GigaChat:\n{e}")
+        result = None
+    await cancel_flow(state)
+    if result is None:
+        return
+
+    try:
+        handle = await get_result_store().put(
+            result, owner_id=message.from_user.id, kind="motion" if is_motion else "settlement"
+        )
+    except ResultTooLarge:
+        await message.answer("Текст слишком длинный для экспорта в DOCX.")
+    except Exception as e:
+        logger.warning(f"Result store unavailable: {e!r}")
+        await message.answer("Экспорт сейчас недоступен.")
+    else:
+        await message.answer("Экспорт 👇", reply_markup=export_keyboard(handle))
+
 
-        cancel_flow(uid)
+# =========================
+# Catch-all message handler (must be AFTER FSM handlers!)
+# =========================
+@dp.message()
+async def main_text_router(message: Message, state: FSMContext):
+    # Если идёт FSM (создание дела, анкеты и т.п.) — не мешаем
+    if await state.get_state() is not None:
+        return
+    uid = message.from_user.id
+    if not is_allowed(uid):
+        return
+
+    # ✅ Команды всегда разрешены
+    if message.text and message.text.startswith("/"):
         return
 
+    await message.answer("Сначала выбери задачу через /start.")
+
 
 # ========== Хэндлеры для Кредиторов/Должников ==========
 
@@ -3928,18 +3423,18 @@ async def generate_creditors_doc(call: CallbackQuery):
     await call.answer("Генерирую документ...")
 
     try:
-        # Генерация DOCX из шаблона
-        doc_bytes = await render_creditors_list(case_id)
-
-        # Создание файла для отправки
-        filename = f"creditors_list_case_{case_id}.docx"
-        input_file = BufferedInputFile(doc_bytes, filename=filename)
+        # Генерация DOCX из шаблона, сохранение в архив дела
+        filename = f"creditors_list_case_{case_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
+        storage = get_storage()
+        with await render_creditors_list(case_id) as rendered:
+            key = await storage.save_stream(case_key(case_id, filename), rendered)
 
         # Отправка документа пользователю
         await call.message.answer_document(
-            input_file,
+            storage.input_file(key),
             caption="📄 Список кредиторов и должников"
         )
+        await send_pdf_copy(call.message, key)
     except Exception as e:
         logger.error(f"Error generating creditors list: {e}", exc_info=True)
         await call.message.answer("❌ Ошибка при генерации документа. Проверьте, что вы заполнили профиль должника.")
@@ -3959,18 +3454,18 @@ async def generate_inventory_doc(call: CallbackQuery):
     await call.answer("Генерирую документ...")
 
     try:
-        # Генерация DOCX из шаблона
-        doc_bytes = await render_inventory(case_id)
-
-        # Создание файла для отправки
-        filename = f"inventory_case_{case_id}.docx"
-        input_file = BufferedInputFile(doc_bytes, filename=filename)
+        # Генерация DOCX из шаблона, сохранение в архив дела
+        filename = f"inventory_case_{case_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
+        storage = get_storage()
+        with await render_inventory(case_id) as rendered:
+            key = await storage.save_stream(case_key(case_id, filename), rendered)
 
         # Отправка документа пользователю
         await call.message.answer_document(
-            input_file,
+            storage.input_file(key),
             caption="📄 Опись имущества гражданина"
         )
+        await send_pdf_copy(call.message, key)
     except Exception as e:
         logger.error(f"Error generating inventory: {e}", exc_info=True)
         await call.message.answer("❌ Ошибка при генерации документа. Проверьте, что вы заполнили профиль должника.")
@@ -3980,10 +3475,9 @@ async def generate_inventory_doc(call: CallbackQuery):
 # Catch-all callback handler (must be AFTER all specific handlers)
 # =========================
 @dp.callback_query()
-async def on_callback(call: CallbackQuery):
+async def on_callback(call: CallbackQuery, state: FSMContext):
     uid = call.from_user.id
     data = call.data or ""
-    flow = USER_FLOW.get(uid) or {}
 
     if data.startswith(("docs:", "case:", "profile:", "back:")):
         await call.answer()
@@ -3994,7 +3488,7 @@ async def on_callback(call: CallbackQuery):
         return
 
     is_flow_callback = (
-        data == "export:word"
+        data.startswith("export:word")
         or data == "flow:cancel"
         or data == "flow:motion"
         or data == "flow:settlement"
@@ -4005,43 +3499,45 @@ async def on_callback(call: CallbackQuery):
         await call.answer()
         return
 
-    if data == "export:word":
+    if data.startswith("export:word"):
         await call.answer()
-        text = LAST_RESULT.get(uid)
-        if text:
-            await call.message.answer(text)
-        else:
-            await call.message.answer("Пока нечего экспортировать.")
+        handle = data.split(":", 2)[2] if data.count(":") == 2 else ""
+        stored = await get_result_store().get(handle, owner_id=uid) if handle else None
+        if stored is None:
+            await call.message.answer("Результат устарел — сформируй документ заново.")
+            return
+        kind = stored.kind or "document"
+        with tempfile.TemporaryDirectory() as tmp:
+            out_path = os.path.join(tmp, f"{kind}.docx")
+            await run_in_render_pool(
+                render_text_to_file, RESULT_TITLES.get(kind, "Проект документа"), stored.text, out_path
+            )
+            with open(out_path, "rb") as f:
+                await call.message.answer_document(DocumentInputFile(f, f"{kind}.docx"))
         return
 
     if data == "flow:cancel":
         await call.answer()
-        cancel_flow(uid)
+        await cancel_flow(state)
         await call.message.answer("Ок, отменил. Меню 👇", reply_markup=main_keyboard())
         return
 
     if data == "flow:motion":
         await call.answer()
-        USER_FLOW[uid] = {"flow": "motion", "stage": "choose_court", "court_type": None, "step": 0, "answers": {}}
+        await start_flow(state, MotionFlow.court_type)
         await call.message.answer("Выбери тип суда:", reply_markup=court_type_keyboard())
         return
 
     if data.startswith("motion:court:"):
         await call.answer()
         ct = data.split(":")[-1]
-        if uid not in USER_FLOW or USER_FLOW[uid].get("flow") != "motion":
-            USER_FLOW[uid] = {"flow": "motion", "stage": "fill", "court_type": ct, "step": 0, "answers": {}}
-        else:
-            USER_FLOW[uid]["stage"] = "fill"
-            USER_FLOW[uid]["court_type"] = ct
-            USER_FLOW[uid]["step"] = 0
-            USER_FLOW[uid]["answers"] = {}
+        await start_flow(state, MotionFlow.answers, court_type=ct)
         await call.message.answer(MOTION_STEPS[0][1], reply_markup=motion_actions_keyboard())
         return
 
     if data == "flow:settlement":
         await call.answer()
-        USER_FLOW[uid] = {"flow": "settlement", "step": 0, "answers": {}}
+        await start_flow(state, SettlementFlow.answers)
         await call.message.answer(SETTLEMENT_STEPS[0][1], reply_markup=settlement_actions_keyboard())
         return
 
@@ -4049,8 +3545,26 @@ async def on_callback(call: CallbackQuery):
     return
 
 
+_BACKGROUND_TASKS: set[asyncio.Task] = set()
+_metrics_runner = None
+
+
+async def on_shutdown() -> None:
+    """Освобождение ресурсов при остановке бота."""
+    global _metrics_runner
+    for task in _BACKGROUND_TASKS:
+        task.cancel()
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+    shutdown_render_pool()
+    await shutdown_pdf_export()
+    await shutdown_gigachat()
+
+
 async def main():
     import logging
+    global _metrics_runner
     logger = logging.getLogger(__name__)
 
     # Initialize authorization module FIRST (breaks circular imports)
@@ -4066,6 +3580,23 @@ async def main():
     await init_pg_db()
     logger.info("PostgreSQL database initialized")
 
+    # Общая сессия GigaChat (keepalive, пул соединений); закрывается в on_shutdown
+    await init_gigachat(settings, redis=storage.redis).start()
+    init_result_store(storage.redis, settings)
+
+    # Фоновая очистка GENERATED_DIR (RETENTION_INTERVAL_MIN=0 — выключено)
+    if RETENTION_INTERVAL_MIN > 0 and isinstance(get_storage(), LocalStorage):
+        _BACKGROUND_TASKS.add(
+            asyncio.create_task(retention_loop(GENERATED_DIR, RETENTION_POLICY, RETENTION_INTERVAL_MIN * 60))
+        )
+
+    # /metrics этого процесса (счётчики GigaChat, FSM, шардов); web.py отдаёт только свои
+    if settings["METRICS_PORT"] > 0:
+        _metrics_runner = await start_metrics_server(settings["METRICS_HOST"], settings["METRICS_PORT"])
+        logger.info(f"Metrics on http://{settings['METRICS_HOST']}:{settings['METRICS_PORT']}/metrics")
+
+    dp.shutdown.register(on_shutdown)
+
     bot = Bot(token=BOT_TOKEN)
 
     # Execution mode: polling (default) or webhook
@@ -4107,6 +3638,19 @@ async def main():
         logger.info("Bot starting in WEBHOOK mode")
         logger.info("=" * 60)
 
+        if settings["WEBHOOK_SHARDS"] > 0:
+            # Sharded: web.py publishes updates to Redis, this process handles its shards
+            shards = parse_shards(settings["WEBHOOK_SHARD"], settings["WEBHOOK_SHARDS"])
+            logger.info(f"Handling webhook shards {shards} of {settings['WEBHOOK_SHARDS']}")
+            await dp.emit_startup(bot=bot)
+            try:
+                await run_shard_worker(
+                    storage.redis, shards, dp, bot, concurrency=settings["WEBHOOK_WORKER_CONCURRENCY"]
+                )
+            finally:
+                await dp.emit_shutdown(bot=bot)
+            return
+
         # Initialize web app with dependencies (breaks circular import)
         from web import init_web_app
         init_web_app(BOT_TOKEN, dp)
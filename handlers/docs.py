@@ -2,8 +2,9 @@ from aiogram import F, Router
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
 from docxtpl import DocxTemplate
-from aiogram.types import FSInputFile
+from bankrot_bot.database import get_session
 from bankrot_bot.services.docx_jinja import generate_petition_jinja
+from bankrot_bot.services.docx_output import DocumentInputFile
 import os
 
 router = Router()
@@ -11,3 +12,8 @@ router = Router()
 @router.callback_query(F.data.startswith("generate_petition"))
 async def generate_petition(callback: CallbackQuery, state: FSMContext):
     case_id = int(callback.data.split(":")[-1])
+    async with get_session() as session:
+        rendered, filename = await generate_petition_jinja(session, case_id, callback.from_user.id)
+    with rendered:
+        await callback.message.answer_document(DocumentInputFile(rendered, filename))
+    await callback.answer()
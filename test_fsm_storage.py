@@ -0,0 +1,243 @@
+"""FSM в Redis: кэш CachedRedisStorage, set_state_data одним MULTI/EXEC, create_fsm_storage."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+from bankrot_bot.services import fsm_storage
+from bankrot_bot.services.fsm_storage import CachedRedisStorage, create_fsm_storage, set_state_data
+from bench_fsm_redis import count_round_trips
+
+
+class Flow(StatesGroup):
+    answers = State()
+
+
+class FakeRedis:
+    """redis.asyncio в памяти; calls — запросы: ("get", key), ("set", key, ex), ("delete", key), ("exec", ops)."""
+
+    def __init__(self) -> None:
+        self.values = {}
+        self.calls = []
+
+    async def get(self, key):
+        self.calls.append(("get", key))
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.calls.append(("set", key, ex))
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.calls.append(("delete", key))
+            self.values.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        assert transaction, "set_state_data must use MULTI/EXEC"
+        return FakePipeline(self)
+
+    def gets(self):
+        return sum(1 for call in self.calls if call[0] == "get")
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    def set(self, key, value, ex=None):
+        self.ops.append(("set", key, ex, value))
+
+    def delete(self, key):
+        self.ops.append(("delete", key))
+
+    async def execute(self):
+        self.redis.calls.append(("exec", [op[:3] for op in self.ops]))
+        for op in self.ops:
+            if op[0] == "set":
+                value = op[3]
+                self.redis.values[op[1]] = value.encode() if isinstance(value, str) else value
+            else:
+                self.redis.values.pop(op[1], None)
+        return []
+
+
+def key(user_id: int = 1) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+def test_cache_read_through_and_write_through():
+    async def run():
+        redis = FakeRedis()
+        storage = CachedRedisStorage(redis, cache_ttl=60)
+        redis.values[storage.key_builder.build(key(), "state")] = b"Flow:answers"
+
+        hits = fsm_storage.CACHE_HITS.value(part="state")
+        assert await storage.get_state(key()) == "Flow:answers"
+        assert await storage.get_state(key()) == "Flow:answers"
+        assert redis.gets() == 1
+        assert fsm_storage.CACHE_HITS.value(part="state") == hits + 1
+
+        # пустые данные тоже кэшируются
+        assert await storage.get_data(key()) == {}
+        assert await storage.get_data(key()) == {}
+        assert redis.gets() == 2
+
+        # записи сразу видны из кэша
+        await storage.set_state(key(), Flow.answers)
+        await storage.set_data(key(), {"step": 1})
+        assert await storage.get_state(key()) == Flow.answers.state
+        assert await storage.get_data(key()) == {"step": 1}
+        await set_state_data(FSMContext(storage, key()), None, {"step": 2})
+        assert await storage.get_state(key()) is None
+        assert await storage.get_data(key()) == {"step": 2}
+        assert redis.gets() == 2
+
+    asyncio.run(run())
+
+
+def test_get_data_returns_independent_copies():
+    async def run():
+        storage = CachedRedisStorage(FakeRedis(), cache_ttl=60)
+        await storage.set_data(key(), {"flow": {"answers": {"fio": "Иванов"}}})
+        first = await storage.get_data(key())
+        first["flow"]["answers"]["fio"] = "изменено"
+        first["extra"] = 1
+        assert await storage.get_data(key()) == {"flow": {"answers": {"fio": "Иванов"}}}
+
+    asyncio.run(run())
+
+
+def test_cache_expiry_eviction_and_disable():
+    async def run():
+        # срок жизни записи кэша
+        redis = FakeRedis()
+        storage = CachedRedisStorage(redis, cache_ttl=0.05)
+        await storage.get_state(key())
+        await storage.get_state(key())
+        assert redis.gets() == 1
+        await asyncio.sleep(0.06)
+        await storage.get_state(key())
+        assert redis.gets() == 2
+
+        # LRU: при cache_size=2 вытесняется давно не использованный ключ
+        redis = FakeRedis()
+        storage = CachedRedisStorage(redis, cache_ttl=60, cache_size=2)
+        await storage.get_state(key(1))
+        await storage.get_state(key(2))
+        await storage.get_state(key(1))  # 1 — свежий, 2 — самый старый
+        await storage.get_state(key(3))
+        assert redis.gets() == 3
+        await storage.get_state(key(1))
+        assert redis.gets() == 3
+        await storage.get_state(key(2))
+        assert redis.gets() == 4
+
+        # cache_ttl=0 — кэш выключен
+        redis = FakeRedis()
+        storage = CachedRedisStorage(redis, cache_ttl=0)
+        await storage.set_state(key(), Flow.answers)
+        for _ in range(3):
+            assert await storage.get_state(key()) == Flow.answers.state
+            await storage.get_data(key())
+        assert redis.gets() == 6
+
+    asyncio.run(run())
+
+
+def test_set_state_data_single_transaction_with_ttl():
+    async def run():
+        for cls in (RedisStorage, CachedRedisStorage):
+            redis = FakeRedis()
+            storage = cls(redis, state_ttl=100, data_ttl=200)
+            state_key = storage.key_builder.build(key(), "state")
+            data_key = storage.key_builder.build(key(), "data")
+
+            await set_state_data(FSMContext(storage, key()), Flow.answers, {"step": 1})
+            assert redis.calls == [("exec", [("set", state_key, 100), ("set", data_key, 200)])]
+            assert redis.values[state_key] == b"Flow:answers"
+
+            # None и пустые данные удаляют ключи
+            redis.calls.clear()
+            await set_state_data(FSMContext(storage, key()), None, {})
+            assert redis.calls == [("exec", [("delete", state_key), ("delete", data_key)])]
+            assert redis.values == {}
+
+    asyncio.run(run())
+
+
+def test_set_state_data_memory_fallback_matches_redis():
+    async def run():
+        results = []
+        for storage in (MemoryStorage(), CachedRedisStorage(FakeRedis(), cache_ttl=0)):
+            state = FSMContext(storage, key())
+            await state.update_data({"keep": 1})
+            await set_state_data(state, Flow.answers, {"keep": 1, "step": 1})
+            first = (await state.get_state(), await state.get_data())
+            await set_state_data(state, None, {})
+            results.append((first, (await state.get_state(), await state.get_data())))
+        assert results[0] == results[1]
+        assert results[0] == ((Flow.answers.state, {"keep": 1, "step": 1}), (None, {}))
+
+    asyncio.run(run())
+
+
+def test_create_fsm_storage_from_settings():
+    async def run():
+        settings = {
+            "REDIS_URL": "redis://localhost:6399/3",
+            "REDIS_POOL_SIZE": 7,
+            "FSM_CACHE_TTL_SEC": 5,
+            "FSM_STATE_TTL_SEC": 3600,
+            "FSM_DATA_TTL_SEC": 0,
+        }
+        storage = create_fsm_storage(settings)
+        try:
+            assert isinstance(storage, CachedRedisStorage)
+            assert storage.cache_ttl == 5
+            assert storage.state_ttl == 3600
+            assert storage.data_ttl is None  # 0 — без срока
+            pool = storage.redis.connection_pool
+            assert pool.max_connections == 7
+            assert pool.connection_kwargs["db"] == 3
+        finally:
+            await storage.redis.aclose()
+
+    asyncio.run(run())
+
+
+def test_cache_cuts_redis_round_trips():
+    async def run():
+        plain, updates = await count_round_trips(RedisStorage)
+        cached, _ = await count_round_trips(CachedRedisStorage, cache_ttl=5.0)
+        # без кэша каждый апдейт читает состояние и данные из Redis
+        assert plain >= 2 * updates
+        assert cached * 2 < plain
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_cache_read_through_and_write_through()
+    test_get_data_returns_independent_copies()
+    test_cache_expiry_eviction_and_disable()
+    test_set_state_data_single_transaction_with_ttl()
+    test_set_state_data_memory_fallback_matches_redis()
+    test_create_fsm_storage_from_settings()
+    test_cache_cuts_redis_round_trips()
+    print("OK")
@@ -0,0 +1,196 @@
+"""Клиент GigaChat против локального фейкового сервера (OAuth + chat/completions)."""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from bankrot_bot.services import gigachat
+
+
+class FakeGigaChat:
+    """OAuth и chat/completions; statuses/oauth_statuses — очереди кодов ответа (дальше 200)."""
+
+    def __init__(self, *, expires_in: int = 1800, statuses=(), headers=None, oauth_statuses=()) -> None:
+        self.expires_in = expires_in
+        self.statuses = list(statuses)
+        self.oauth_statuses = list(oauth_statuses)
+        self.headers = headers or {}
+        self.oauth_calls = 0
+        self.chat_calls = 0
+        self.runner = None
+
+    async def oauth(self, request: web.Request) -> web.Response:
+        self.oauth_calls += 1
+        status = self.oauth_statuses.pop(0) if self.oauth_statuses else 200
+        if status != 200:
+            return web.Response(status=status, text=f"oauth error {status}")
+        return web.json_response({"access_token": f"token-{self.oauth_calls}", "expires_in": self.expires_in})
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self.chat_calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            return web.Response(status=status, text=f"error {status}", headers=self.headers.get(status))
+        payload = await request.json()
+        if payload.get("stream"):
+            resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await resp.prepare(request)
+            for piece in ("Проект ", "ходатайства"):
+                event = {"choices": [{"delta": {"content": piece}}]}
+                await resp.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+            await resp.write(b"data: [DONE]\n\n")
+            return resp
+        return web.json_response({"choices": [{"message": {"content": "Ответ модели"}}]})
+
+    async def __aenter__(self) -> "FakeGigaChat":
+        app = web.Application()
+        app.router.add_post("/oauth", self.oauth)
+        app.router.add_post("/chat", self.chat)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self._urls = (gigachat.OAUTH_URL, gigachat.CHAT_URL)
+        gigachat.OAUTH_URL = f"http://127.0.0.1:{port}/oauth"
+        gigachat.CHAT_URL = f"http://127.0.0.1:{port}/chat"
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        gigachat.OAUTH_URL, gigachat.CHAT_URL = self._urls
+        await self.runner.cleanup()
+
+
+def _client(**kwargs) -> gigachat.GigaChatClient:
+    return gigachat.GigaChatClient(auth_key="key", scope="scope", model="model", **kwargs)
+
+
+def test_refresher_does_not_flood_oauth():
+    async def run():
+        # упреждение больше срока жизни токена
+        async with FakeGigaChat(expires_in=60) as fake:
+            client = _client(refresh_ahead=3600)
+            await client.start()
+            await asyncio.sleep(0.5)
+            await client.close()
+            assert fake.oauth_calls == 1, fake.oauth_calls
+            assert 29 < client.tokens.ahead <= 30
+
+    asyncio.run(run())
+
+
+def test_status_handling_and_breaker():
+    async def ask(client):
+        return await client.chat(system_prompt="s", user_text="u")
+
+    async def run():
+        # 401 и после обновления токена: ошибка, сбой для размыкателя (не сброс)
+        async with FakeGigaChat(statuses=[401, 401]) as fake:
+            client = _client(max_retries=2)
+            client.breaker.failures = 2
+            errors = gigachat.REQUESTS.value(outcome="error")
+            try:
+                await ask(client)
+            except RuntimeError as e:
+                assert "HTTP 401" in str(e)
+            else:
+                raise AssertionError("expected HTTP 401")
+            assert fake.oauth_calls == 2
+            assert client.breaker.failures == 3
+            assert gigachat.REQUESTS.value(outcome="error") == errors + 1
+
+            # 400 — ошибка запроса: размыкатель не трогаем
+            fake.statuses = [400]
+            try:
+                await ask(client)
+            except RuntimeError as e:
+                assert "HTTP 400" in str(e)
+            else:
+                raise AssertionError("expected HTTP 400")
+            assert client.breaker.failures == 3
+
+            # 500 и 429 с Retry-After повторяются, 200 сбрасывает счётчик сбоев
+            fake.statuses = [500, 429]
+            fake.headers = {429: {"Retry-After": "0"}}
+            calls = fake.chat_calls
+            assert await ask(client) == "Ответ модели"
+            assert fake.chat_calls == calls + 3
+            assert client.breaker.failures == 0
+
+            # повторы исчерпаны
+            fake.statuses = [500, 500, 500]
+            try:
+                await ask(client)
+            except gigachat.GigaChatUnavailable:
+                pass
+            else:
+                raise AssertionError("expected GigaChatUnavailable")
+            assert client.breaker.failures == 1
+            await client.close()
+
+    base_delay, gigachat.RETRY_BASE_DELAY = gigachat.RETRY_BASE_DELAY, 0.01
+    try:
+        asyncio.run(run())
+    finally:
+        gigachat.RETRY_BASE_DELAY = base_delay
+
+
+def test_oauth_outage_opens_breaker():
+    async def ask(client):
+        return await client.chat(system_prompt="s", user_text="u")
+
+    async def run():
+        async with FakeGigaChat(oauth_statuses=[500] * 10) as fake:
+            client = _client(max_retries=1, breaker=gigachat.CircuitBreaker(failure_threshold=2))
+            errors = gigachat.REQUESTS.value(outcome="error")
+            for _ in range(2):
+                try:
+                    await ask(client)
+                except gigachat.GigaChatUnavailable:
+                    pass
+                else:
+                    raise AssertionError("expected GigaChatUnavailable")
+            # каждый запрос: попытка и один повтор
+            assert fake.oauth_calls == 4
+            assert fake.chat_calls == 0
+            assert client.breaker.state == gigachat.CircuitBreaker.OPEN
+            assert gigachat.REQUESTS.value(outcome="error") == errors + 2
+
+            # разомкнутая цепь: запрос отклонён сразу, OAuth не дёргается
+            try:
+                await ask(client)
+            except gigachat.GigaChatUnavailable:
+                pass
+            else:
+                raise AssertionError("expected GigaChatUnavailable")
+            assert fake.oauth_calls == 4
+
+            # 401 от OAuth (неверный ключ) не повторяется, но это сбой
+            fake.oauth_statuses = [401]
+            client.breaker = gigachat.CircuitBreaker()
+            try:
+                await ask(client)
+            except gigachat.TokenFetchError as e:
+                assert e.status == 401
+            else:
+                raise AssertionError("expected TokenFetchError")
+            assert fake.oauth_calls == 5
+            assert client.breaker.failures == 1
+            await client.close()
+
+    base_delay, gigachat.RETRY_BASE_DELAY = gigachat.RETRY_BASE_DELAY, 0.01
+    try:
+        asyncio.run(run())
+    finally:
+        gigachat.RETRY_BASE_DELAY = base_delay
+
+
+if __name__ == "__main__":
+    test_refresher_does_not_flood_oauth()
+    test_status_handling_and_breaker()
+    test_oauth_outage_opens_breaker()
+    print("OK")
@@ -0,0 +1,36 @@
+"""Эндпоинт /metrics процесса бота."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+
+from bankrot_bot.metrics import Counter, start_metrics_server
+
+HITS = Counter("test_metrics_hits_total", "Test counter", ("kind",))
+
+
+def test_metrics_server_serves_registry():
+    async def run():
+        HITS.inc(kind="a")
+        runner = await start_metrics_server("127.0.0.1", 0)
+        try:
+            host, port = runner.addresses[0][:2]
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://{host}:{port}/metrics") as r:
+                    assert r.status == 200
+                    assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                    body = await r.text()
+        finally:
+            await runner.cleanup()
+        assert "# TYPE test_metrics_hits_total counter" in body
+        assert 'test_metrics_hits_total{kind="a"} 1' in body
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_metrics_server_serves_registry()
+    print("OK")
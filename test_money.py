@@ -0,0 +1,34 @@
+"""Разбор сумм: ввод пользователя -> целые копейки."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bankrot_bot.services.case_financials import parse_amount_kopeks
+from bankrot_bot.services.money import creditor_kopeks, total_kopeks
+
+
+def test_parse_amount_kopeks():
+    assert parse_amount_kopeks("150000") == 15_000_000
+    assert parse_amount_kopeks("150000.50") == 15_000_050
+    assert parse_amount_kopeks("150 000,5") == 15_000_050
+    assert parse_amount_kopeks("1 200 000") == 120_000_000
+    assert parse_amount_kopeks("0") == 0
+    for bad in ("", "-5", "12.345", "150.000.50", "1e3", "abc", "150 руб"):
+        assert parse_amount_kopeks(bad) is None, bad
+
+
+def test_creditor_amounts():
+    creditors = [
+        {"amount_kopeks": parse_amount_kopeks("150000.50")},
+        {"debt_rubles": "20000", "debt_kopeks": "05"},
+        {"name": "без суммы"},
+    ]
+    assert [creditor_kopeks(c) for c in creditors] == [15_000_050, 2_000_005, None]
+    assert total_kopeks(creditors) == 17_000_055
+
+
+if __name__ == "__main__":
+    test_parse_amount_kopeks()
+    test_creditor_amounts()
+    print("OK")
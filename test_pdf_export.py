@@ -0,0 +1,61 @@
+"""Пул конвертеров PDF: после таймаута конвертер не отдаётся следующему документу, пока вызов не завершился."""
+import asyncio
+import os
+import sys
+import threading
+import time
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bankrot_bot.services.pdf_export import PdfConversionError, PdfConverterPool
+
+
+class _ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _FakeUnoserver:
+    """XML-RPC convert(): b"slow" отвечает через delay секунд, остальное — сразу."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.server = _ThreadingXMLRPCServer(("127.0.0.1", 0), logRequests=False, allow_none=True)
+        self.server.register_function(self.convert, "convert")
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def convert(self, inpath, indata, outpath, convert_to):
+        if indata.data == b"slow":
+            time.sleep(self.delay)
+        return xmlrpc.client.Binary(b"%PDF " + indata.data)
+
+
+def test_timeout_holds_converter_until_call_finishes():
+    fake = _FakeUnoserver(delay=1.0)
+
+    async def run():
+        pool = PdfConverterPool(addresses=[f"127.0.0.1:{fake.port}"], timeout=0.3)
+        started = time.monotonic()
+        try:
+            await pool.convert(b"slow")
+        except PdfConversionError as e:
+            assert "timeout" in str(e)
+        else:
+            raise AssertionError("expected timeout")
+        assert time.monotonic() - started < 0.8
+        # вызов ещё идёт — конвертер не в пуле, пока поток не завершится по таймауту сокета
+        assert pool._free.empty()
+        assert await pool.convert(b"doc") == b"%PDF doc"
+        assert pool._free.qsize() == 1
+        await pool.stop()
+
+    asyncio.run(run())
+    fake.server.shutdown()
+
+
+if __name__ == "__main__":
+    test_timeout_holds_converter_until_call_finishes()
+    print("OK")
@@ -0,0 +1,96 @@
+"""Эквивалентность быстрого Jinja-рендера заявления, прежней подстановки через python-docx и инкрементального рендера."""
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from docx import Document
+
+from bankrot_bot.services.docs_builder import build_petition_context
+from bankrot_bot.services.docx_incremental import forget_render, render_petition_incremental
+from bankrot_bot.services.docx_jinja import render_petition_jinja, render_petition_legacy
+
+CASE_ROW = (7, 123456789, "Иванов", "А40-1/2026", "Арбитражный суд г. Москвы", "Судья", "ФУ Петров П.П.")
+
+CARDS = {
+    "empty": {},
+    "full": {
+        "debtor_full_name": "Иванова Мария Петровна",
+        "debtor_gender": "female",
+        "debtor_birth_date": "01.02.1985",
+        "debtor_address": "г. Москва,, ул. Ленина, д. 1, ",
+        "debtor_inn": "771234567890",
+        "debtor_snils": "123-456-789 01",
+        "passport_series": "45 12",
+        "passport_number": "123456",
+        "court_name": "Арбитражный суд города Москвы",
+        "marital_status": "married",
+        "spouse_full_name": "Иванов Иван Иванович",
+        "has_minor_children": True,
+        "children_count": 2,
+        "creditors": [
+            {"name": "ПАО «Сбербанк» & Co <filial>", "debt_rubles": "150000", "debt_kopeks": "50"},
+            {"name": "ООО МФК", "debt_rubles": "20000", "note": "займ"},
+        ],
+    },
+}
+
+
+def _texts(rendered):
+    with rendered:
+        doc = Document(rendered)
+        paragraphs = [p.text for p in doc.paragraphs]
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    paragraphs.extend(p.text for p in cell.paragraphs)
+    return paragraphs
+
+
+def test_jinja_matches_legacy_text():
+    for name, card in CARDS.items():
+        context = build_petition_context(CASE_ROW, card, None, now=datetime(2026, 1, 17))
+        fast = _texts(render_petition_jinja(context))
+        legacy = _texts(render_petition_legacy(context))
+        assert fast == legacy, name
+        assert not any("{{" in t for t in fast), name
+
+
+def test_db_creditors_take_priority():
+    context = build_petition_context(
+        CASE_ROW,
+        CARDS["full"],
+        [{"name": "АО Банк", "debt_rubles": "1000", "debt_kopeks": "0"}],
+        now=datetime(2026, 1, 17),
+    )
+    assert context["total_debt_rubles"] == "1000"
+    assert _texts(render_petition_jinja(context)) == _texts(render_petition_legacy(context))
+
+
+def test_creditors_block_one_paragraph_per_creditor():
+    card = {"creditors": [{"name": f"Кредитор {i}", "amount_kopeks": i * 100} for i in range(1, 51)]}
+    context = build_petition_context(CASE_ROW, card, None, now=datetime(2026, 1, 17))
+    lines = [t for t in _texts(render_petition_jinja(context)) if "сумма задолженности" in t]
+    assert len(lines) == 50
+    assert lines[0] == "1) Кредитор 1; сумма задолженности: 1 руб. 00 коп."
+    assert not any("\n" in t for t in lines)
+
+
+def test_incremental_matches_full_render():
+    key = ("test", CASE_ROW[0])
+    forget_render(key)
+    first = build_petition_context(CASE_ROW, CARDS["empty"], None, now=datetime(2026, 1, 17))
+    render_petition_incremental(key, first).close()
+    for card in (CARDS["full"], {**CARDS["full"], "debtor_birth_date": "02.03.1986"}, CARDS["empty"]):
+        context = build_petition_context(CASE_ROW, card, None, now=datetime(2026, 1, 17))
+        assert _texts(render_petition_incremental(key, context)) == _texts(render_petition_jinja(context))
+    forget_render(key)
+
+
+if __name__ == "__main__":
+    test_jinja_matches_legacy_text()
+    test_db_creditors_take_priority()
+    test_creditors_block_one_paragraph_per_creditor()
+    test_incremental_matches_full_render()
+    print("OK")
@@ -0,0 +1,152 @@
+"""Политика хранения GENERATED_DIR: пробный прогон и применение, порядок по меткам в именах."""
+import os
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bankrot_bot.services.retention import RetentionPolicy, apply_retention, document_timestamp
+
+NOW = datetime(2026, 1, 20, 12, 0, 0).timestamp()
+
+
+def _make_case(root: Path) -> Path:
+    """Дело с четырьмя заявлениями и описью; mtime файлов перемешан относительно имён."""
+    case_dir = root / "cases" / "7"
+    case_dir.mkdir(parents=True)
+    names = [
+        "bankruptcy_petition_case_7_20260101_100000.docx",
+        "bankruptcy_petition_case_7_20260110_100000.docx",
+        "bankruptcy_petition_case_7_20260115_100000.docx",
+        "bankruptcy_petition_case_7_20260119_100000.docx",
+        "inventory_case_7_20260102_100000.docx",
+    ]
+    for i, name in enumerate(names):
+        path = case_dir / name
+        # одинаковое содержимое у всех заявлений — кандидаты на дедупликацию
+        path.write_bytes(b"petition" if name.startswith("bankruptcy") else b"inventory")
+        stamp = NOW - (len(names) - i) * 3600
+        os.utime(path, (stamp, NOW - i * 3600))
+    return case_dir
+
+
+def _names(case_dir: Path) -> list[str]:
+    return sorted(p.name for p in case_dir.iterdir())
+
+
+def test_document_timestamp():
+    assert document_timestamp("inventory_case_7_20260102_100000.docx") == datetime(2026, 1, 2, 10).timestamp()
+    assert document_timestamp("notes.txt") is None
+
+
+def test_dry_run_changes_nothing():
+    with tempfile.TemporaryDirectory() as tmp:
+        case_dir = _make_case(Path(tmp))
+        before = {p.name: (p.stat().st_ino, p.stat().st_mtime) for p in case_dir.iterdir()}
+        report = apply_retention(Path(tmp), RetentionPolicy(keep_last=2, dedup=True), dry_run=True, now=NOW)
+        after = {p.name: (p.stat().st_ino, p.stat().st_mtime) for p in case_dir.iterdir()}
+        assert before == after
+        assert sorted(p.name for p, _ in report.deleted) == [
+            "bankruptcy_petition_case_7_20260101_100000.docx",
+            "bankruptcy_petition_case_7_20260110_100000.docx",
+        ]
+        assert len(report.deduplicated) == 1
+
+
+def test_apply_keeps_newest_by_name_and_links_duplicates():
+    with tempfile.TemporaryDirectory() as tmp:
+        case_dir = _make_case(Path(tmp))
+        report = apply_retention(Path(tmp), RetentionPolicy(keep_last=2, dedup=True), now=NOW)
+        assert not report.errors
+        assert _names(case_dir) == [
+            "bankruptcy_petition_case_7_20260115_100000.docx",
+            "bankruptcy_petition_case_7_20260119_100000.docx",
+            "inventory_case_7_20260102_100000.docx",
+        ]
+        older = case_dir / "bankruptcy_petition_case_7_20260115_100000.docx"
+        newest = case_dir / "bankruptcy_petition_case_7_20260119_100000.docx"
+        assert older.stat().st_ino == newest.stat().st_ino
+
+        # общий inode — общий mtime; следующий проход всё равно оставляет самый новый по имени
+        report = apply_retention(Path(tmp), RetentionPolicy(keep_last=1, dedup=True), now=NOW)
+        assert [p.name for p, _ in report.deleted] == [older.name]
+        assert newest.exists()
+
+
+def test_max_age_uses_name_timestamp():
+    with tempfile.TemporaryDirectory() as tmp:
+        case_dir = _make_case(Path(tmp))
+        apply_retention(Path(tmp), RetentionPolicy(keep_last=0, max_age_days=7, dedup=False), now=NOW)
+        assert _names(case_dir) == [
+            "bankruptcy_petition_case_7_20260115_100000.docx",
+            "bankruptcy_petition_case_7_20260119_100000.docx",
+            "inventory_case_7_20260102_100000.docx",
+        ]
+
+
+def test_pdf_cache_expires_by_age_and_size():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp) / "pdf-cache"
+        cache.mkdir()
+        for i, age_days in enumerate((40, 3, 2, 1)):
+            path = cache / f"{i:064x}.pdf"
+            path.write_bytes(b"x" * 1000)
+            os.utime(path, (NOW, NOW - age_days * 86400))
+        policy = RetentionPolicy(keep_last=0, dedup=False, pdf_cache_max_age_days=30, pdf_cache_max_bytes=2000)
+        report = apply_retention(Path(tmp), policy, now=NOW)
+        assert sorted(p.name for p, _ in report.deleted) == [f"{0:064x}.pdf", f"{1:064x}.pdf"]
+        assert sorted(p.name for p in cache.iterdir()) == [f"{2:064x}.pdf", f"{3:064x}.pdf"]
+
+
+def _make_linked_case(root: Path) -> Path:
+    """Три жёсткие ссылки на одно заявление (1000 байт) и опись (500 байт): на диске 1500 байт."""
+    case_dir = root / "cases" / "8"
+    case_dir.mkdir(parents=True)
+    first = case_dir / "bankruptcy_petition_case_8_20260101_100000.docx"
+    first.write_bytes(b"p" * 1000)
+    for name in ("bankruptcy_petition_case_8_20260110_100000.docx", "bankruptcy_petition_case_8_20260119_100000.docx"):
+        os.link(first, case_dir / name)
+    (case_dir / "inventory_case_8_20260102_100000.docx").write_bytes(b"i" * 500)
+    return case_dir
+
+
+def test_case_limit_counts_hardlinks_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        case_dir = _make_linked_case(Path(tmp))
+        before = _names(case_dir)
+        # 1500 байт на диске укладываются в лимит, хотя сумма размеров ссылок — 3500
+        report = apply_retention(Path(tmp), RetentionPolicy(keep_last=0, max_case_bytes=1600, dedup=False), now=NOW)
+        assert not report.deleted
+        assert _names(case_dir) == before
+
+
+def test_deleting_extra_links_frees_nothing():
+    with tempfile.TemporaryDirectory() as tmp:
+        case_dir = _make_linked_case(Path(tmp))
+        # лимит не достижим: старые ссылки удаляются, но inode жив, пока есть самая новая
+        for dry_run in (True, False):
+            report = apply_retention(
+                Path(tmp), RetentionPolicy(keep_last=0, max_case_bytes=1200, dedup=False), dry_run=dry_run, now=NOW
+            )
+            assert sorted(p.name for p, _ in report.deleted) == [
+                "bankruptcy_petition_case_8_20260101_100000.docx",
+                "bankruptcy_petition_case_8_20260110_100000.docx",
+            ]
+            assert report.bytes_freed == 0
+        assert _names(case_dir) == [
+            "bankruptcy_petition_case_8_20260119_100000.docx",
+            "inventory_case_8_20260102_100000.docx",
+        ]
+
+
+if __name__ == "__main__":
+    test_document_timestamp()
+    test_dry_run_changes_nothing()
+    test_apply_keeps_newest_by_name_and_links_duplicates()
+    test_max_age_uses_name_timestamp()
+    test_pdf_cache_expires_by_age_and_size()
+    test_case_limit_counts_hardlinks_once()
+    test_deleting_extra_links_frees_nothing()
+    print("OK")
@@ -0,0 +1,70 @@
+"""Хранилище документов: локальный каталог и S3 (moto как замена MinIO)."""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import boto3
+from moto import mock_aws
+
+from bankrot_bot.services.storage import LocalStorage, S3Storage, case_key
+
+# разные виды документов в одном деле: по имени inventory_* всегда «новее»
+NAMES = [
+    "bankruptcy_petition_case_7_20260110_100000.docx",
+    "inventory_case_7_20260105_100000.docx",
+    "creditors_list_case_7_20260108_100000.docx",
+    "bankruptcy_petition_case_7_20260112_090000.docx",
+]
+NEWEST_FIRST = [
+    "bankruptcy_petition_case_7_20260112_090000.docx",
+    "bankruptcy_petition_case_7_20260110_100000.docx",
+    "creditors_list_case_7_20260108_100000.docx",
+    "inventory_case_7_20260105_100000.docx",
+]
+
+
+async def _exercise(storage):
+    for name in NAMES:
+        await storage.save_stream(case_key(7, name), io.BytesIO(name.encode()))
+    await storage.save_stream(case_key(7, "notes.txt"), io.BytesIO(b"x"))
+    await storage.save_stream(case_key(8, NAMES[0]), io.BytesIO(b"other case"))
+
+    assert await storage.list_case_documents(7) == NEWEST_FIRST
+
+    payload = os.urandom(300 * 1024)
+    key = case_key(7, "big_case_7_20260101_000000.docx")
+    await storage.save_stream(key, io.BytesIO(payload))
+    chunks = [chunk async for chunk in storage.iter_chunks(key, chunk_size=64 * 1024)]
+    assert len(chunks) > 1 and all(len(c) <= 64 * 1024 for c in chunks)
+    assert b"".join(chunks) == payload
+
+    assert await storage.exists(key)
+    await storage.delete(key)
+    assert not await storage.exists(key)
+    await storage.delete(key)  # повторное удаление — не ошибка
+
+
+def test_local_storage():
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_exercise(LocalStorage(Path(tmp))))
+
+
+def test_s3_storage():
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="bankrot-docs")
+        storage = S3Storage(bucket="bankrot-docs", prefix="bot", access_key="test", secret_key="test")
+        asyncio.run(_exercise(storage))
+        keys = [o["Key"] for o in boto3.client("s3").list_objects_v2(Bucket="bankrot-docs")["Contents"]]
+        assert all(k.startswith("bot/cases/") for k in keys)
+
+
+if __name__ == "__main__":
+    test_local_storage()
+    test_s3_storage()
+    print("OK")
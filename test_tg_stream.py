@@ -0,0 +1,70 @@
+"""Потоковый вывод в Telegram: ответ из фейкового SSE-сервера GigaChat и обрыв потока."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bankrot_bot.services.gigachat import GigaChatClient, GigaChatUnavailable
+from bankrot_bot.services.tg_stream import CURSOR, NO_ANSWER, stream_to_message
+from test_gigachat import FakeGigaChat
+
+
+class FakeMessage:
+    """Сообщение Telegram: answer() отправляет новое, edit_text() запоминает правки."""
+
+    def __init__(self, text: str = "", chat: list | None = None) -> None:
+        self.text = text
+        self.edits: list[str] = []
+        self.chat = chat if chat is not None else []
+
+    async def answer(self, text: str) -> "FakeMessage":
+        sent = FakeMessage(text, self.chat)
+        self.chat.append(sent)
+        return sent
+
+    async def edit_text(self, text: str) -> None:
+        self.text = text
+        self.edits.append(text)
+
+
+def test_streams_sse_answer():
+    async def run():
+        async with FakeGigaChat():
+            client = GigaChatClient(auth_key="key", scope="scope", model="model")
+            user = FakeMessage()
+            chunks = client.chat_stream(system_prompt="s", user_text="u")
+            result = await stream_to_message(user, chunks, placeholder="Готовлю…", interval=0)
+            await client.close()
+        assert result == "Проект ходатайства"
+        [reply] = user.chat
+        assert reply.text == "Проект ходатайства"
+        assert reply.edits[0].endswith(CURSOR)
+
+    asyncio.run(run())
+
+
+def test_interrupted_stream_drops_cursor():
+    async def broken(pieces):
+        for piece in pieces:
+            yield piece
+        raise GigaChatUnavailable("GigaChat временно недоступен.")
+
+    async def run(pieces):
+        user = FakeMessage()
+        try:
+            await stream_to_message(user, broken(pieces), placeholder="Готовлю…", interval=0)
+        except GigaChatUnavailable:
+            pass
+        else:
+            raise AssertionError("expected GigaChatUnavailable")
+        return user.chat[0].text
+
+    assert asyncio.run(run(["Начало ", "ответа"])) == "Начало ответа"
+    assert asyncio.run(run([])) == NO_ANSWER
+
+
+if __name__ == "__main__":
+    test_streams_sse_answer()
+    test_interrupted_stream_drops_cursor()
+    print("OK")
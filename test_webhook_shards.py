@@ -0,0 +1,216 @@
+"""Очереди апдейтов вебхука: порядок по пользователю, возврат необработанных, ответ 503."""
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram.types import Update
+
+from fastapi import HTTPException
+
+import web
+from bankrot_bot.services import webhook_shards
+from bankrot_bot.services.webhook_shards import ShardPublisher, UpdateQueue, run_shard_worker
+
+
+class FakeRedis:
+    """Списки Redis в памяти: rpush/llen/blmove/lmove/lrem."""
+
+    def __init__(self) -> None:
+        self.lists: dict[str, list[bytes]] = {}
+        self.changed = asyncio.Condition()
+
+    async def rpush(self, key: str, value: bytes) -> int:
+        async with self.changed:
+            self.lists.setdefault(key, []).append(value)
+            self.changed.notify_all()
+            return len(self.lists[key])
+
+    async def llen(self, key: str) -> int:
+        return len(self.lists.get(key, []))
+
+    def _move(self, src: str, dst: str, wherefrom: str, whereto: str):
+        items = self.lists.get(src)
+        if not items:
+            return None
+        value = items.pop(0 if wherefrom == "LEFT" else -1)
+        target = self.lists.setdefault(dst, [])
+        target.insert(0 if whereto == "LEFT" else len(target), value)
+        return value
+
+    async def lmove(self, src: str, dst: str, wherefrom: str = "LEFT", whereto: str = "RIGHT"):
+        return self._move(src, dst, wherefrom, whereto)
+
+    async def blmove(self, src: str, dst: str, timeout: float, wherefrom: str = "LEFT", whereto: str = "RIGHT"):
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait_for(lambda: bool(self.lists.get(src))), timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self._move(src, dst, wherefrom, whereto)
+
+    async def lrem(self, key: str, count: int, value: bytes) -> int:
+        items = self.lists.get(key, [])
+        if value in items:
+            items.remove(value)
+            return 1
+        return 0
+
+
+class FakeDispatcher:
+    """feed_update записывает (user_id, n) с задержкой — разные апдейты обгоняют друг друга."""
+
+    def __init__(self) -> None:
+        self.seen: list[tuple[int, int]] = []
+
+    async def feed_update(self, bot, update: Update) -> None:
+        await asyncio.sleep(random.uniform(0, 0.01))
+        self.seen.append((update.message.from_user.id, int(update.message.text)))
+
+
+def make_update(update_id: int, user_id: int, n: int) -> tuple[Update, bytes]:
+    payload = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+            "text": str(n),
+        },
+    }
+    raw = json.dumps(payload).encode()
+    return Update.model_validate_json(raw), raw
+
+
+def per_user(seen: list[tuple[int, int]]) -> dict[int, list[int]]:
+    result: dict[int, list[int]] = {}
+    for user_id, n in seen:
+        result.setdefault(user_id, []).append(n)
+    return result
+
+
+def test_two_workers_keep_per_user_order():
+    async def run():
+        redis = FakeRedis()
+        dp = FakeDispatcher()
+        users, per = list(range(100, 110)), 8
+        workers = [
+            asyncio.create_task(run_shard_worker(redis, [shard], dp, None, concurrency=4, poll_timeout=1))
+            for shard in (0, 1)
+        ]
+        publisher = ShardPublisher(redis, shards=2)
+        shards_used = set()
+        update_id = 0
+        for n in range(per):
+            for user_id in users:
+                update_id += 1
+                update, raw = make_update(update_id, user_id, n)
+                shards_used.add(await publisher.publish(update, raw))
+        assert shards_used == {0, 1}
+
+        while len(dp.seen) < len(users) * per:
+            await asyncio.sleep(0.01)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        assert per_user(dp.seen) == {user_id: list(range(per)) for user_id in users}
+        for shard in (0, 1):
+            assert not redis.lists.get(f"{webhook_shards.QUEUE_PREFIX}{shard}")
+            assert not redis.lists.get(f"{webhook_shards.PROCESSING_PREFIX}{shard}")
+
+    asyncio.run(run())
+
+
+def test_unfinished_updates_requeued_first():
+    async def run():
+        redis = FakeRedis()
+        dp = FakeDispatcher()
+        # прошлый процесс взял 0 и 1, но не успел обработать; 2 ещё в очереди
+        redis.lists[f"{webhook_shards.PROCESSING_PREFIX}0"] = [make_update(1, 7, 0)[1], make_update(2, 7, 1)[1]]
+        redis.lists[f"{webhook_shards.QUEUE_PREFIX}0"] = [make_update(3, 7, 2)[1]]
+        redis.lists[f"{webhook_shards.QUEUE_PREFIX}0"].insert(0, b"not json")
+
+        worker = asyncio.create_task(run_shard_worker(redis, [0], dp, None, poll_timeout=1))
+        while len(dp.seen) < 3:
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await asyncio.gather(worker, return_exceptions=True)
+
+        assert dp.seen == [(7, 0), (7, 1), (7, 2)]
+        assert not redis.lists[f"{webhook_shards.PROCESSING_PREFIX}0"]
+
+    asyncio.run(run())
+
+
+def test_update_queue_keeps_per_user_order():
+    async def run():
+        dp = FakeDispatcher()
+        queue = UpdateQueue(dp, None, maxsize=100, concurrency=4)
+        queue.start()
+        users, per = list(range(200, 206)), 10
+        update_id = 0
+        for n in range(per):
+            for user_id in users:
+                update_id += 1
+                assert queue.offer(make_update(update_id, user_id, n)[0])
+        await queue.stop()
+        assert per_user(dp.seen) == {user_id: list(range(per)) for user_id in users}
+
+    asyncio.run(run())
+
+
+class FakeRequest:
+    def __init__(self, raw: bytes) -> None:
+        self.raw = raw
+
+    async def body(self) -> bytes:
+        return self.raw
+
+
+def test_webhook_answers_503_when_queue_full():
+    async def post(raw: bytes):
+        try:
+            return await web.telegram_webhook("secret", FakeRequest(raw))
+        except HTTPException as e:
+            return e
+
+    async def run():
+        first, second = make_update(1, 5, 0)[1], make_update(2, 5, 1)[1]
+
+        # без шардов: очередь в процессе (потребитель не запущен — очередь не разбирается)
+        web._update_queue = UpdateQueue(FakeDispatcher(), None, maxsize=1)
+        assert await post(first) == {"ok": True}
+        rejected = await post(second)
+        assert isinstance(rejected, HTTPException) and rejected.status_code == 503
+        assert rejected.headers == {"Retry-After": "1"}
+        web._update_queue = None
+
+        # с шардами: LLEN списка шарда >= WEBHOOK_QUEUE_MAX
+        redis = FakeRedis()
+        web._publisher = ShardPublisher(redis, 2, max_len=1)
+        assert await post(first) == {"ok": True}
+        rejected = await post(second)
+        assert isinstance(rejected, HTTPException) and rejected.status_code == 503
+        assert sum(len(items) for items in redis.lists.values()) == 1
+
+    saved = web._settings, web.TELEGRAM_WEBHOOK_SECRET
+    web._settings = {"WEBHOOK_SHARDS": 0, "WEBHOOK_QUEUE_MAX": 1, "WEBHOOK_WORKER_CONCURRENCY": 4}
+    web.TELEGRAM_WEBHOOK_SECRET = "secret"
+    try:
+        asyncio.run(run())
+    finally:
+        web._settings, web.TELEGRAM_WEBHOOK_SECRET = saved
+        web._update_queue = web._publisher = None
+
+
+if __name__ == "__main__":
+    test_two_workers_keep_per_user_order()
+    test_unfinished_updates_requeued_first()
+    test_update_queue_keeps_per_user_order()
+    test_webhook_answers_503_when_queue_full()
+    print("OK")
@@ -3,8 +3,21 @@ FastAPI webhook server for Telegram bot.
 
 NO IMPORTS FROM bot.py - uses dependency injection to break circular imports.
 Dependencies are injected via init_web_app() called during bot startup.
+
+Sharded mode (WEBHOOK_SHARDS > 0): the endpoint only validates updates and
+publishes them to per-user Redis shards (bankrot_bot.services.webhook_shards);
+bot.py processes in TELEGRAM_MODE=webhook consume them. The web app then needs
+no dispatcher and can run with any number of uvicorn workers.
+
+Otherwise updates go to an in-process bounded UpdateQueue and are processed
+after the response (WEBHOOK_QUEUE_MAX=0 restores inline processing).
+Either way a full queue answers 503 so Telegram retries later.
 """
-from fastapi import FastAPI, Request, HTTPException, Depends
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from datetime import datetime
 from aiogram import Bot, Dispatcher
 from aiogram.types import Update
@@ -12,9 +25,52 @@ from pydantic import ValidationError
 import os
 import logging
 
+from bankrot_bot.config import load_settings
+from bankrot_bot.metrics import render_metrics
+from bankrot_bot.services.webhook_shards import ShardPublisher, UpdateQueue
+
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="bankrot_bot web")
+_settings: dict[str, Any] | None = None
+_publisher: ShardPublisher | None = None
+_update_queue: UpdateQueue | None = None
+
+
+def get_settings() -> dict[str, Any]:
+    """
+    Settings from load_settings(), loaded once on first use.
+
+    Not at import time: importing web.py must not require a filled .env.
+    """
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """Connect the shard publisher to Redis in sharded mode."""
+    global _publisher
+    settings = get_settings()
+    shards = settings["WEBHOOK_SHARDS"]
+    if shards > 0:
+        from redis.asyncio import Redis
+
+        redis = Redis.from_url(settings["REDIS_URL"])
+        _publisher = ShardPublisher(redis, shards, settings["WEBHOOK_QUEUE_MAX"])
+        logger.info(f"Webhook updates published to {shards} Redis shards")
+    try:
+        yield
+    finally:
+        if _publisher is not None:
+            await _publisher.redis.aclose()
+            _publisher = None
+        if _update_queue is not None:
+            await _update_queue.stop()
+
+
+app = FastAPI(title="bankrot_bot web", lifespan=lifespan)
 
 # ============================================
 # Dependency Injection - set by bot.py at startup
@@ -74,19 +130,35 @@ def get_dispatcher() -> Dispatcher:
     return _dispatcher
 
 
-def _get_webhook_bot(token: str = Depends(get_bot_token)) -> Bot:
+def _get_update_queue() -> UpdateQueue:
     """
-    Get or create webhook bot instance (singleton).
+    Get or create the in-process update queue (singleton).
 
-    Args:
-        token: Bot token from dependency
+    Started lazily inside the server event loop on the first update.
+    """
+    global _update_queue
+    if _update_queue is None:
+        settings = get_settings()
+        _update_queue = UpdateQueue(
+            get_dispatcher(),
+            _get_webhook_bot(),
+            maxsize=settings["WEBHOOK_QUEUE_MAX"],
+            concurrency=settings["WEBHOOK_WORKER_CONCURRENCY"],
+        )
+        _update_queue.start()
+    return _update_queue
+
+
+def _get_webhook_bot() -> Bot:
+    """
+    Get or create webhook bot instance (singleton).
 
     Returns:
         Cached Bot instance
     """
     global _webhook_bot
     if _webhook_bot is None:
-        _webhook_bot = Bot(token=token)
+        _webhook_bot = Bot(token=get_bot_token())
         logger.info("Created webhook bot instance")
     return _webhook_bot
 
@@ -98,28 +170,22 @@ TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "").strip()
 
 
 @app.post("/telegram/webhook/{secret}")
-async def telegram_webhook(
-    secret: str,
-    request: Request,
-    dp: Dispatcher = Depends(get_dispatcher),
-    bot: Bot = Depends(_get_webhook_bot),
-) -> dict:
+async def telegram_webhook(secret: str, request: Request) -> dict:
     """
     Telegram webhook endpoint.
 
-    Receives updates from Telegram API and feeds them to dispatcher.
+    Receives updates from Telegram API and feeds them to dispatcher, or, in
+    sharded mode, publishes them to the owning user's shard.
 
     Args:
         secret: URL path secret (must match TELEGRAM_WEBHOOK_SECRET env var)
         request: FastAPI request with JSON payload
-        dp: Injected dispatcher
-        bot: Injected bot instance
 
     Returns:
-        {"ok": True} on success
+        {"ok": True} once the update is queued (or processed, if queueing is off)
 
     Raises:
-        HTTPException: On authentication failure or validation error
+        HTTPException: On authentication failure, validation error or a full queue (503)
     """
     if not TELEGRAM_WEBHOOK_SECRET:
         logger.error("TELEGRAM_WEBHOOK_SECRET environment variable not set")
@@ -132,14 +198,24 @@ async def telegram_webhook(
         raise HTTPException(status_code=403, detail="forbidden")
 
     try:
-        payload = await request.json()
-        update = Update.model_validate(payload)
+        raw = await request.body()
+        update = Update.model_validate_json(raw)
         logger.debug(f"Received webhook update: {update.update_id}")
     except ValidationError as e:
         logger.error(f"Webhook validation error: {e}")
         raise HTTPException(status_code=422, detail=str(e))
 
-    await dp.feed_update(bot, update)
+    if _publisher is not None:
+        accepted = await _publisher.publish(update, raw) is not None
+    elif get_settings()["WEBHOOK_QUEUE_MAX"] > 0:
+        accepted = _get_update_queue().offer(update)
+    else:
+        await get_dispatcher().feed_update(_get_webhook_bot(), update)
+        accepted = True
+
+    if not accepted:
+        logger.warning(f"Webhook queue full, rejecting update {update.update_id}")
+        raise HTTPException(status_code=503, detail="queue full", headers={"Retry-After": "1"})
     return {"ok": True}
 
 
@@ -158,6 +234,21 @@ def healthz() -> dict:
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Prometheus metrics endpoint.
+
+    Only this web process: webhook acceptance and queue metrics. Counters of
+    bot.py processes (GigaChat, FSM, shard workers) are served by each bot
+    process itself on METRICS_PORT.
+
+    Returns:
+        Process metrics in Prometheus text exposition format
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def root() -> dict:
     """